@@ -0,0 +1,113 @@
+"""
+Synthetic photo catalogs for the benchmarks.
+
+generate_catalog() writes a data.db with the same schema main.py uses. Tags follow a Zipf
+distribution over a fixed vocabulary, so a few tags are on a large share of the photos and
+most are rare, like a real archive. File IDs look like Drive IDs (33 characters). A small
+share of rows have no thumbnail, which sends them through the thumbnail refresh paths.
+Catalogs are cached by (size, seed) under bench/.cache because the 1M one takes a while to build.
+"""
+import itertools
+import json
+import os
+import random
+import sqlite3
+
+from bench.fake_drive import random_file_id
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+
+TAG_VOCABULARY_SIZE = 2000
+TAG_ZIPF_EXPONENT = 1.1
+MAX_TAGS_PER_IMAGE = 6
+MISSING_THUMBNAIL_RATE = 0.01
+INSERT_CHUNK = 10000
+
+TAG_WORDS = (
+    "event", "student", "mentor", "classroom", "demo-day", "workshop", "graduation", "hackathon",
+    "portrait", "group", "outdoor", "stage", "laptop", "speaker", "panel", "team", "award", "lab",
+)
+
+
+def tag_vocabulary(size=TAG_VOCABULARY_SIZE):
+    """Returns `size` distinct tags, most popular first."""
+    tags = list(TAG_WORDS)
+    for n in itertools.count(2015):
+        if len(tags) >= size:
+            break
+        tags.extend(f"{word}-{n}" for word in TAG_WORDS)
+    return tags[:size]
+
+
+def zipf_weights(count, exponent=TAG_ZIPF_EXPONENT):
+    return list(itertools.accumulate(1.0 / (rank ** exponent) for rank in range(1, count + 1)))
+
+
+def thumbnail_for(file_id):
+    return f"https://lh3.googleusercontent.com/drive-storage/fake-{file_id}=s220"
+
+
+def generate_rows(size, seed=0):
+    rng = random.Random(seed)
+    tags = tag_vocabulary()
+    cum_weights = zipf_weights(len(tags))
+    seen = set()
+
+    for _ in range(size):
+        file_id = random_file_id(rng)
+        while file_id in seen:
+            file_id = random_file_id(rng)
+        seen.add(file_id)
+
+        # Most photos have a couple of tags; a few have none
+        tag_count = min(int(rng.expovariate(0.6)), MAX_TAGS_PER_IMAGE)
+        image_tags = list(dict.fromkeys(rng.choices(tags, cum_weights=cum_weights, k=tag_count)))
+        thumbnail = None if rng.random() < MISSING_THUMBNAIL_RATE else thumbnail_for(file_id)
+        yield file_id, json.dumps(image_tags), thumbnail
+
+
+def generate_catalog(path, size, seed=0):
+    if os.path.exists(path):
+        os.remove(path)
+
+    conn = sqlite3.connect(path)
+    c = conn.cursor()
+    c.execute("CREATE TABLE images (id TEXT PRIMARY KEY, tags TEXT, thumbnail TEXT)")
+    rows = generate_rows(size, seed)
+    while True:
+        chunk = list(itertools.islice(rows, INSERT_CHUNK))
+        if not chunk:
+            break
+        c.executemany("INSERT INTO images (id, tags, thumbnail) VALUES (?, ?, ?)", chunk)
+    conn.commit()
+    conn.close()
+
+
+def cached_catalog(size, seed=0):
+    """Returns the path of a generated catalog, building it on first use."""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    path = os.path.join(CACHE_DIR, f"catalog-{size}-{seed}.db")
+    if not os.path.exists(path):
+        partial = path + ".partial"
+        generate_catalog(partial, size, seed)
+        os.replace(partial, path)
+    return path
+
+
+def catalog_ids(path, limit=None):
+    conn = sqlite3.connect(path)
+    query = "SELECT id FROM images ORDER BY id" + (f" LIMIT {int(limit)}" if limit else "")
+    ids = [row[0] for row in conn.execute(query)]
+    conn.close()
+    return ids
+
+
+def popular_tags(path, count=3):
+    """Most-used tags in a catalog, most popular first."""
+    conn = sqlite3.connect(path)
+    rows = conn.execute("""
+        SELECT value, COUNT(*) AS n FROM images, json_each(images.tags)
+        GROUP BY value ORDER BY n DESC LIMIT ?
+    """, (count,)).fetchall()
+    conn.close()
+    return [tag for tag, _ in rows]
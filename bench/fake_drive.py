@@ -0,0 +1,428 @@
+"""
+Local stand-in for the Google Drive v3 and OAuth2 v2 clients used by main.py.
+
+FakeDrive holds a synthetic folder tree (folders, images, shortcuts) and answers the calls
+main.py makes: files.get, files.list (with q filtering and paging), about.get,
+userinfo.get and batch requests. Every call can be given a latency and an error rate, and
+errors are raised as real googleapiclient HttpErrors (429 rateLimitExceeded). The same data
+model is used by the in-process fake (install()) and by the HTTP fake server.
+"""
+import random
+import re
+import threading
+import time
+from collections import Counter
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+MIME_FOLDER = "application/vnd.google-apps.folder"
+MIME_SHORTCUT = "application/vnd.google-apps.shortcut"
+MIME_JPEG = "image/jpeg"
+ID_ALPHABET = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789_-"
+FAKE_USER_EMAIL = "rob@launchpadphilly.org"
+
+
+def random_file_id(rng):
+    return "1" + "".join(rng.choices(ID_ALPHABET, k=32))
+
+
+def rate_limit_error(uri=None):
+    content = (b'{"error": {"code": 429, "message": "User rate limit exceeded.", '
+               b'"errors": [{"reason": "rateLimitExceeded", "message": "User rate limit exceeded."}]}}')
+    return HttpError(httplib2.Response({"status": 429, "reason": "Too Many Requests"}), content, uri=uri)
+
+
+def not_found_error(file_id):
+    content = ('{"error": {"code": 404, "message": "File not found: %s.", '
+               '"errors": [{"reason": "notFound"}]}}' % file_id).encode()
+    return HttpError(httplib2.Response({"status": 404, "reason": "Not Found"}), content)
+
+
+### - Query Language - ###
+# Supports the subset of Drive's q syntax that main.py and the import strategies use:
+#   'ID' in parents, trashed = false, mimeType = '...', mimeType != '...',
+#   mimeType contains '...', name contains '...', modifiedTime > '...',
+# combined with and / or / not and parentheses.
+_TOKEN = re.compile(r"\s*(\(|\)|'(?:[^'\\]|\\.)*'|!=|<=|>=|=|<|>|[A-Za-z_]+)")
+
+
+def _tokenize(q):
+    tokens, pos = [], 0
+    q = q.strip()
+    while pos < len(q):
+        match = _TOKEN.match(q, pos)
+        if not match:
+            raise ValueError(f"Invalid query near: {q[pos:]!r}")
+        tokens.append(match.group(1))
+        pos = match.end()
+    return tokens
+
+
+def compile_query(q):
+    """Compiles a Drive q string into a predicate over file metadata dicts."""
+    tokens = _tokenize(q) if q else []
+    pos = 0
+
+    def peek():
+        return tokens[pos] if pos < len(tokens) else None
+
+    def take():
+        nonlocal pos
+        pos += 1
+        return tokens[pos - 1]
+
+    def parse_or():
+        left = parse_and()
+        while peek() and peek().lower() == "or":
+            take()
+            right = parse_and()
+            left = (lambda a, b: lambda f: a(f) or b(f))(left, right)
+        return left
+
+    def parse_and():
+        left = parse_not()
+        while peek() and peek().lower() == "and":
+            take()
+            right = parse_not()
+            left = (lambda a, b: lambda f: a(f) and b(f))(left, right)
+        return left
+
+    def parse_not():
+        if peek() and peek().lower() == "not":
+            take()
+            inner = parse_not()
+            return lambda f: not inner(f)
+        return parse_atom()
+
+    def literal(token):
+        if token.startswith("'"):
+            return token[1:-1].replace("\\'", "'")
+        if token.lower() in ("true", "false"):
+            return token.lower() == "true"
+        return token
+
+    def parse_atom():
+        token = take()
+        if token == "(":
+            expr = parse_or()
+            take()  # ")"
+            return expr
+        if token.startswith("'"):
+            # 'ID' in parents
+            value = literal(token)
+            take()  # in
+            field = take()
+            return lambda f: value in f.get(field, [])
+        field = token
+        op = take()
+        value = literal(take())
+        if op == "contains":
+            return lambda f: value in (f.get(field) or "")
+        if op == "=":
+            return lambda f: f.get(field, False if isinstance(value, bool) else None) == value
+        if op == "!=":
+            return lambda f: f.get(field) != value
+        if op == ">":
+            return lambda f: (f.get(field) or "") > value
+        if op == "<":
+            return lambda f: (f.get(field) or "") < value
+        if op == ">=":
+            return lambda f: (f.get(field) or "") >= value
+        if op == "<=":
+            return lambda f: (f.get(field) or "") <= value
+        raise ValueError(f"Unsupported operator {op!r}")
+
+    if not tokens:
+        return lambda _f: True
+    return parse_or()
+
+
+def _parents_in_query(q):
+    # Fast path: "'ID' in parents and ..." only needs to look at that folder's children
+    match = re.match(r"\s*'([^']+)'\s+in\s+parents\b", q or "")
+    return match.group(1) if match else None
+
+
+### - Data Model - ###
+class FakeDrive:
+    """
+    Synthetic Drive contents plus call accounting.
+    Files not created explicitly are synthesized on files.get as plain JPEGs, so catalogs
+    with millions of IDs don't need millions of metadata dicts.
+    """
+
+    def __init__(self, latency=0.0, error_rate=0.0, seed=0, max_page_size=1000, synthesize_missing=True):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.max_page_size = max_page_size
+        self.synthesize_missing = synthesize_missing
+        self.files = {}
+        self.children = {}
+        self.changes = []  # [(change_token, file_id)]
+        self.calls = Counter()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._forced_errors = 0
+        self.root_id = "root"
+
+    # --- building the tree ---
+    def add_file(self, file_id, name, mime_type, parent=None, **extra):
+        metadata = {
+            "id": file_id,
+            "name": name,
+            "mimeType": mime_type,
+            "parents": [parent] if parent else [],
+            "trashed": False,
+            "modifiedTime": extra.pop("modifiedTime", "2024-01-01T00:00:00.000Z"),
+            "createdTime": extra.pop("createdTime", "2024-01-01T00:00:00.000Z"),
+            "webViewLink": f"https://drive.google.com/file/d/{file_id}/view",
+        }
+        if mime_type.startswith("image/"):
+            metadata["thumbnailLink"] = self.thumbnail_link(file_id)
+            metadata["md5Checksum"] = extra.pop("md5Checksum", f"{abs(hash(file_id)):032x}"[:32])
+            metadata["size"] = extra.pop("size", str(100000 + abs(hash(file_id)) % 5000000))
+        metadata.update(extra)
+        with self._lock:
+            self.files[file_id] = metadata
+            if parent:
+                self.children.setdefault(parent, []).append(file_id)
+            self.changes.append((len(self.changes) + 1, file_id))
+        return metadata
+
+    def add_folder(self, folder_id, name, parent=None):
+        return self.add_file(folder_id, name, MIME_FOLDER, parent)
+
+    def add_shortcut(self, shortcut_id, target_id, parent):
+        target = self.files.get(target_id, {})
+        return self.add_file(
+            shortcut_id, f"Shortcut to {target.get('name', target_id)}", MIME_SHORTCUT, parent,
+            shortcutDetails={"targetId": target_id, "targetMimeType": target.get("mimeType", MIME_JPEG)},
+        )
+
+    def build_tree(self, image_ids, depth=3, fanout=4, shortcut_fraction=0.02, seed=0):
+        """
+        Spreads image_ids over a folder tree `depth` levels deep with `fanout` subfolders per
+        folder, adding a few shortcuts to existing images. Returns the root folder ID.
+        """
+        # Seeded apart from the catalog generator so folder IDs never collide with image IDs
+        rng = random.Random(f"drive-tree-{seed}")
+        root_id = random_file_id(rng)
+        self.add_folder(root_id, "Photo Archive")
+        self.root_id = root_id
+
+        folders = [root_id]
+        frontier = [root_id]
+        for level in range(depth):
+            next_frontier = []
+            for parent in frontier:
+                for i in range(fanout):
+                    folder_id = random_file_id(rng)
+                    self.add_folder(folder_id, f"Folder {level}-{i}", parent)
+                    next_frontier.append(folder_id)
+            folders.extend(next_frontier)
+            frontier = next_frontier
+
+        for n, image_id in enumerate(image_ids):
+            self.add_file(image_id, f"IMG_{n:07d}.jpg", MIME_JPEG, rng.choice(folders))
+
+        for _ in range(int(len(image_ids) * shortcut_fraction)):
+            self.add_shortcut(random_file_id(rng), rng.choice(image_ids), rng.choice(folders))
+
+        return root_id
+
+    # --- call accounting, latency and errors ---
+    def fail_next(self, count=1):
+        """Makes the next `count` calls fail with 429 regardless of error_rate."""
+        with self._lock:
+            self._forced_errors += count
+
+    def charge(self, method, latency=True):
+        with self._lock:
+            self.calls[method] += 1
+            forced = self._forced_errors > 0
+            if forced:
+                self._forced_errors -= 1
+            fail = forced or (self.error_rate and self._rng.random() < self.error_rate)
+        if latency and self.latency:
+            time.sleep(self.latency)
+        if fail:
+            raise rate_limit_error()
+
+    # --- API behaviour ---
+    @staticmethod
+    def thumbnail_link(file_id):
+        return f"https://lh3.googleusercontent.com/drive-storage/fake-{file_id}=s220"
+
+    def get_file(self, file_id):
+        metadata = self.files.get(file_id)
+        if metadata is None and self.synthesize_missing and file_id not in ("", None):
+            metadata = {
+                "id": file_id,
+                "name": f"{file_id}.jpg",
+                "mimeType": MIME_JPEG,
+                "parents": [],
+                "trashed": False,
+                "modifiedTime": "2024-01-01T00:00:00.000Z",
+                "thumbnailLink": self.thumbnail_link(file_id),
+                "md5Checksum": f"{abs(hash(file_id)):032x}"[:32],
+                "size": str(100000 + abs(hash(file_id)) % 5000000),
+            }
+        if metadata is None:
+            raise not_found_error(file_id)
+        return dict(metadata)
+
+    def list_files(self, q=None, page_size=100, page_token=None):
+        page_size = max(1, min(int(page_size or 100), self.max_page_size))
+        offset = int(page_token or 0)
+        predicate = compile_query(q)
+
+        parent = _parents_in_query(q)
+        candidates = self.children.get(parent, []) if parent else self.files.keys()
+        matches = [self.files[file_id] for file_id in candidates if predicate(self.files[file_id])]
+
+        page = [dict(f) for f in matches[offset:offset + page_size]]
+        result = {"files": page}
+        if offset + page_size < len(matches):
+            result["nextPageToken"] = str(offset + page_size)
+        return result
+
+    def list_changes(self, page_token=None, page_size=100):
+        start = int(page_token or 1)
+        page = self.changes[start - 1:start - 1 + page_size]
+        result = {"changes": [{"fileId": file_id, "file": dict(self.files[file_id]), "removed": False}
+                              for _, file_id in page]}
+        if start - 1 + page_size < len(self.changes):
+            result["nextPageToken"] = str(start + page_size)
+        else:
+            result["newStartPageToken"] = str(len(self.changes) + 1)
+        return result
+
+
+### - googleapiclient Look-alikes - ###
+# Keyword arguments the fake has no use for (fields=, supportsAllDrives=, num_retries=, ...) are accepted and ignored.
+class FakeRequest:
+    """Mimics googleapiclient.http.HttpRequest: has .methodId and .execute()."""
+
+    def __init__(self, drive, method_id, handler):
+        self.drive = drive
+        self.methodId = method_id
+        self._handler = handler
+
+    def execute(self, **_options):
+        self.drive.charge(self.methodId)
+        return self._handler()
+
+    def run_in_batch(self):
+        # Batched parts share the batch's latency but can still fail individually
+        self.drive.charge(self.methodId, latency=False)
+        return self._handler()
+
+
+class _Files:
+    def __init__(self, drive):
+        self.drive = drive
+
+    def get(self, fileId, **_options):
+        return FakeRequest(self.drive, "drive.files.get", lambda: self.drive.get_file(fileId))
+
+    def list(self, q=None, pageSize=100, pageToken=None, **_options):
+        return FakeRequest(self.drive, "drive.files.list",
+                           lambda: self.drive.list_files(q, pageSize, pageToken))
+
+
+class _Changes:
+    def __init__(self, drive):
+        self.drive = drive
+
+    def getStartPageToken(self, **_options):
+        return FakeRequest(self.drive, "drive.changes.getStartPageToken",
+                           lambda: {"startPageToken": str(len(self.drive.changes) + 1)})
+
+    def list(self, pageToken=None, pageSize=100, **_options):
+        return FakeRequest(self.drive, "drive.changes.list",
+                           lambda: self.drive.list_changes(pageToken, pageSize))
+
+
+class _About:
+    def __init__(self, drive):
+        self.drive = drive
+
+    def get(self, **_options):
+        return FakeRequest(self.drive, "drive.about.get", lambda: {
+            "user": {"emailAddress": FAKE_USER_EMAIL, "displayName": "Bench User"},
+            "storageQuota": {"usage": "0", "limit": "16106127360"},
+        })
+
+
+class _UserInfo:
+    def __init__(self, drive):
+        self.drive = drive
+
+    def get(self):
+        return FakeRequest(self.drive, "oauth2.userinfo.get",
+                           lambda: {"email": FAKE_USER_EMAIL, "verified_email": True})
+
+
+class FakeService:
+    def __init__(self, drive, name):
+        self.drive = drive
+        self.name = name
+
+    def files(self):
+        return _Files(self.drive)
+
+    def changes(self):
+        return _Changes(self.drive)
+
+    def about(self):
+        return _About(self.drive)
+
+    def userinfo(self):
+        return _UserInfo(self.drive)
+
+
+class FakeBatch:
+    """Mimics googleapiclient.http.BatchHttpRequest: one latency charge for the whole batch."""
+
+    def __init__(self, drive, callback=None, **_options):
+        self.drive = drive
+        self.callback = callback
+        self.methodId = "drive.batch"
+        self._requests = []
+
+    def add(self, request, callback=None, request_id=None):
+        self._requests.append((request, callback or self.callback, request_id or str(len(self._requests))))
+
+    def execute(self):
+        self.drive.charge("drive.batch")
+        for request, callback, request_id in self._requests:
+            try:
+                response, exception = request.run_in_batch(), None
+            except HttpError as e:
+                response, exception = None, e
+            if callback:
+                callback(request_id, response, exception)
+
+
+def install(drive, module):
+    """
+    Points a loaded main.py module at `drive` instead of Google.
+    Returns a function that undoes the patch.
+    """
+    saved = {"google_service": module.google_service, "drive_batch": module.drive_batch}
+
+    def fake_service(service_name, _version, _creds):
+        return FakeService(drive, service_name)
+
+    def fake_batch():
+        return FakeBatch(drive, batch_uri=module.DRIVE_BATCH_URI)
+
+    module.google_service = fake_service
+    module.drive_batch = fake_batch
+
+    def uninstall():
+        module.google_service = saved["google_service"]
+        module.drive_batch = saved["drive_batch"]
+
+    return uninstall
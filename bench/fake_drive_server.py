@@ -0,0 +1,216 @@
+"""
+Local HTTP stand-in for the Google Drive v3 and OAuth2 v2 APIs.
+
+Serves a synthetic folder tree (bench.fake_drive.FakeDrive) over the same URLs
+googleapiclient uses, so the app can be pointed at it with GOOGLE_API_BASE_URL:
+
+    python -m bench.fake_drive_server --images 10000 --latency 0.02 --error-rate 0.01
+    GOOGLE_API_BASE_URL=http://127.0.0.1:8765 python main.py
+
+Implemented: files.get, files.list (q filtering, pageSize/pageToken paging), shortcuts,
+about.get, changes.getStartPageToken, changes.list, oauth2 userinfo and the
+multipart/mixed batch endpoint. Authorization headers are accepted but not checked.
+
+Control endpoints (not part of the Google API):
+    POST /__fake__/fail?count=N     next N calls return 429 rateLimitExceeded
+    POST /__fake__/config?latency=0.05&error_rate=0.1
+    GET  /__fake__/stats            calls served, by method
+    GET  /__fake__/tree             root folder ID and a sample of image IDs
+"""
+import argparse
+import json
+import re
+import sys
+import uuid
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from googleapiclient.errors import HttpError
+
+from bench.fake_drive import FakeDrive, FakeService, random_file_id
+
+DEFAULT_PORT = 8765
+FILE_PATH = re.compile(r"^/drive/v3/files/([^/]+)$")
+
+
+class FakeDriveApp:
+    """Routes Google API URLs to a FakeDrive. Returns (status, content_type, body bytes)."""
+
+    def __init__(self, drive):
+        self.drive = drive
+        self.drive_service = FakeService(drive, "drive")
+        self.oauth2_service = FakeService(drive, "oauth2")
+
+    def api_request(self, method, path, params):
+        """Returns the FakeRequest for an API call, or None if the URL isn't one we serve."""
+        files = self.drive_service.files()
+        changes = self.drive_service.changes()
+
+        if method == "GET":
+            match = FILE_PATH.match(path)
+            if match:
+                return files.get(fileId=match.group(1), fields=params.get("fields"))
+            if path == "/drive/v3/files":
+                return files.list(q=params.get("q"), pageSize=params.get("pageSize", 100),
+                                  pageToken=params.get("pageToken"))
+            if path == "/drive/v3/about":
+                return self.drive_service.about().get(fields=params.get("fields"))
+            if path == "/drive/v3/changes/startPageToken":
+                return changes.getStartPageToken()
+            if path == "/drive/v3/changes":
+                return changes.list(pageToken=params.get("pageToken"), pageSize=int(params.get("pageSize", 100)))
+            if path in ("/oauth2/v2/userinfo", "/userinfo/v2/me"):
+                return self.oauth2_service.userinfo().get()
+        return None
+
+    def call(self, method, target, in_batch=False):
+        parts = urlsplit(target)
+        params = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+        request = self.api_request(method, parts.path, params)
+        if request is None:
+            return 404, "application/json", json.dumps({"error": {"code": 404, "message": "Not Found"}}).encode()
+
+        try:
+            result = request.run_in_batch() if in_batch else request.execute()
+        except HttpError as e:
+            return e.resp.status, "application/json", e.content
+        return 200, "application/json; charset=UTF-8", json.dumps(result).encode()
+
+    def batch(self, content_type, body):
+        """Answers a multipart/mixed batch: one latency charge, then each part in order."""
+        try:
+            self.drive.charge("drive.batch")
+        except HttpError as e:
+            return e.resp.status, "application/json", e.content
+
+        message = BytesParser().parsebytes(b"Content-Type: " + content_type.encode() + b"\r\n\r\n" + body)
+        boundary = uuid.uuid4().hex
+        out = []
+        for part in message.get_payload():
+            request_line = part.get_payload().split("\n", 1)[0].strip()
+            method, target, _ = request_line.split(" ", 2)
+            status, part_type, part_body = self.call(method, target, in_batch=True)
+            # Long Content-IDs arrive folded over two lines
+            content_id = " ".join((part["Content-ID"] or "").split()).strip("<>")
+            out.append(
+                f"--{boundary}\r\nContent-Type: application/http\r\nContent-ID: <response-{content_id}>\r\n\r\n"
+                f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\nContent-Type: {part_type}\r\n\r\n"
+                + part_body.decode() + "\r\n"
+            )
+        out.append(f"--{boundary}--\r\n")
+        return 200, f"multipart/mixed; boundary={boundary}", "".join(out).encode()
+
+    def control(self, method, target):
+        parts = urlsplit(target)
+        params = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+        if method == "POST" and parts.path == "/__fake__/fail":
+            self.drive.fail_next(int(params.get("count", 1)))
+        elif method == "POST" and parts.path == "/__fake__/config":
+            if "latency" in params:
+                self.drive.latency = float(params["latency"])
+            if "error_rate" in params:
+                self.drive.error_rate = float(params["error_rate"])
+        elif method == "GET" and parts.path == "/__fake__/stats":
+            return 200, "application/json", json.dumps({"calls": dict(self.drive.calls)}).encode()
+        elif method == "GET" and parts.path == "/__fake__/tree":
+            image_ids = [f["id"] for f in self.drive.files.values() if f["mimeType"].startswith("image/")]
+            return 200, "application/json", json.dumps({
+                "root_id": self.drive.root_id,
+                "files": len(self.drive.files),
+                "sample_image_ids": image_ids[:int(params.get("sample", 20))],
+            }).encode()
+        else:
+            return 404, "application/json", b'{"error": "unknown control endpoint"}'
+        return 200, "application/json", b'{"ok": true}'
+
+
+class FakeDriveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "FakeDrive/1"
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def dispatch(self, method):
+        app = self.server.app
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        path = urlsplit(self.path).path
+
+        if path.startswith("/__fake__/"):
+            status, content_type, payload = app.control(method, self.path)
+        elif method == "POST" and path.startswith("/batch/"):
+            status, content_type, payload = app.batch(self.headers.get("Content-Type", ""), body)
+        else:
+            status, content_type, payload = app.call(method, self.path)
+
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def make_server(drive, host="127.0.0.1", port=DEFAULT_PORT, verbose=False):
+    server = ThreadingHTTPServer((host, port), FakeDriveHandler)
+    server.daemon_threads = True
+    server.app = FakeDriveApp(drive)
+    server.verbose = verbose
+    return server
+
+
+def build_drive(images=1000, catalog_path=None, latency=0.0, error_rate=0.0, seed=0,
+                max_page_size=1000, shortcut_fraction=0.02):
+    """A FakeDrive whose tree holds the catalog's IDs (so refreshes hit real entries) or `images` new ones."""
+    if catalog_path:
+        from bench.catalog import catalog_ids
+        image_ids = catalog_ids(catalog_path, limit=images)
+    else:
+        import random
+        rng = random.Random(seed)
+        image_ids = [random_file_id(rng) for _ in range(images)]
+
+    drive = FakeDrive(latency=latency, error_rate=error_rate, seed=seed, max_page_size=max_page_size)
+    fanout = max(2, round((max(len(image_ids), 1) / 50) ** (1 / 3)))
+    drive.build_tree(image_ids, depth=3, fanout=fanout, shortcut_fraction=shortcut_fraction, seed=seed)
+    return drive
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve a fake Google Drive API for offline testing.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--images", type=int, default=1000, help="Images in the synthetic folder tree (default 1000)")
+    parser.add_argument("--catalog", help="Use the IDs from this catalog database (e.g. a copy of data/data.db)")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to each call")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of calls answered with 429")
+    parser.add_argument("--max-page-size", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    drive = build_drive(args.images, args.catalog, args.latency, args.error_rate, args.seed, args.max_page_size)
+    server = make_server(drive, args.host, args.port, args.verbose)
+    print(f"Fake Drive on http://{args.host}:{args.port} with {len(drive.files)} files", file=sys.stderr)
+    print(f"Root folder: https://drive.google.com/drive/folders/{drive.root_id}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,376 @@
+"""
+Load-test scenario pack for the app under gunicorn.
+
+Virtual users sign in through the local /dev/login bypass and then run a weighted mix of
+actions (browse, search, tag add/remove, backups) for a fixed time. The report gives
+p50/p95/p99 latency, error rate and throughput per action.
+
+    # Start gunicorn (gunicorn.conf.py, on 127.0.0.1) plus the fake Drive, then run the "mixed" pack
+    python -m bench.loadtest --start --size 10000 --scenario mixed --users 8 --duration 60
+
+    # Against an app you started yourself (with DEV_LOGIN=true and GOOGLE_API_BASE_URL set)
+    python -m bench.loadtest --url http://127.0.0.1:5000 --scenario curate --users 4
+
+With --start, the app runs in a temporary directory on a copy of a generated catalog
+(bench/catalog.py), so your data/ directory is not touched. --workers overrides the
+worker count from gunicorn.conf.py, which makes worker sizing experiments easy.
+"""
+import argparse
+import datetime
+import gzip
+import http.client
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+from bench import catalog
+from bench.fake_drive import FAKE_USER_EMAIL
+from bench.run import git_commit, percentile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Action weights per scenario pack
+SCENARIOS = {
+    "browse": {"browse": 45, "browse_api": 30, "search": 25},
+    "curate": {"browse": 15, "search": 20, "tag_add": 30, "tag_remove": 25, "tags_api": 10},
+    "mixed": {"browse": 30, "browse_api": 15, "search": 20, "tag_add": 13, "tag_remove": 10,
+              "backup_list": 8, "backup_save": 3, "backup_load": 1},
+    "backup": {"browse": 40, "backup_list": 25, "backup_save": 25, "backup_load": 10},
+}
+
+API = "/api/v1"
+INDEX_PAGE_SIZE = 40  # ITEMS_PER_PAGE in main.py
+APP_PORT = 5055
+FAKE_DRIVE_PORT = 8765
+
+
+### - Virtual Users - ###
+class VirtualUser:
+    """One curator: a keep-alive connection, a session cookie and the tags it has added."""
+
+    def __init__(self, number, base_url, email, catalog_info, rng):
+        parts = urllib.parse.urlsplit(base_url)
+        self.number = number
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.email = email
+        self.info = catalog_info
+        self.rng = rng
+        self.cookie = None
+        self.added = []  # (photo_id, tag) pairs this user can remove again
+        self.conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+
+    def request(self, method, path, body=None, content_type=None):
+        headers = {"Accept": "text/html,application/json", "Accept-Encoding": "gzip"}
+        if self.cookie:
+            headers["Cookie"] = self.cookie
+        if body is not None:
+            headers["Content-Type"] = content_type
+        try:
+            self.conn.request(method, path, body=body, headers=headers)
+            response = self.conn.getresponse()
+            payload = response.read()
+        except (OSError, http.client.HTTPException):
+            # Sync workers close idle connections; reconnect on the next request
+            self.conn.close()
+            return 0, b""
+
+        if response.getheader("Content-Encoding") == "gzip":
+            payload = gzip.decompress(payload)
+        set_cookie = response.getheader("Set-Cookie")
+        if set_cookie and set_cookie.startswith("session="):
+            self.cookie = set_cookie.split(";", 1)[0]
+        if response.getheader("Connection", "").lower() == "close":
+            self.conn.close()
+        return response.status, payload
+
+    def login(self):
+        status, _ = self.request("GET", "/dev/login?" + urllib.parse.urlencode({"email": self.email}))
+        if status != 302 or not self.cookie:
+            raise RuntimeError(f"/dev/login returned {status}; is the app running with DEV_LOGIN=true "
+                               f"and GOOGLE_API_BASE_URL set?")
+
+    def form(self, path, fields):
+        return self.request("POST", path, urllib.parse.urlencode(fields), "application/x-www-form-urlencoded")
+
+    # --- actions ---
+    def browse(self):
+        return self.request("GET", f"/?page={self.rng.randint(1, self.info['pages'])}")
+
+    def browse_api(self):
+        cursor = self.rng.choice(self.info["cursors"])
+        query = {"limit": 40, **({"cursor": cursor} if cursor else {})}
+        return self.request("GET", f"{API}/images?{urllib.parse.urlencode(query)}")
+
+    def search(self):
+        return self.request("GET", "/?" + urllib.parse.urlencode({"q": self.rng.choice(self.info["tags"])}))
+
+    def tags_api(self):
+        return self.request("GET", f"{API}/tags")
+
+    def tag_add(self):
+        photo_id = self.rng.choice(self.info["ids"])
+        tag = f"load-{self.number}-{self.rng.randint(0, 19)}"
+        self.added.append((photo_id, tag))
+        body = json.dumps({"tag": tag})
+        return self.request("POST", f"{API}/images/{urllib.parse.quote(photo_id)}/tags", body, "application/json")
+
+    def tag_remove(self):
+        if not self.added:
+            return self.tag_add()
+        photo_id, tag = self.added.pop(self.rng.randrange(len(self.added)))
+        return self.request("DELETE", f"{API}/images/{urllib.parse.quote(photo_id)}/tags/{urllib.parse.quote(tag)}")
+
+    def backup_list(self):
+        return self.request("GET", f"{API}/backups")
+
+    def backup_save(self):
+        return self.form("/backup/save", {"backup_name": f"load-{self.number}"})
+
+    def backup_load(self):
+        status, payload = self.request("GET", f"{API}/backups")
+        backups = json.loads(payload).get("backups", []) if status == 200 else []
+        if not backups:
+            return self.backup_save()
+        return self.form(f"/backup/load/{backups[0]['id']}", {})
+
+
+def discover_catalog(base_url, email, max_pages=5):
+    """Reads IDs, tags and a few cursors through the API so actions target real photos."""
+    user = VirtualUser(0, base_url, email, None, random.Random(0))
+    user.login()
+
+    ids, cursors, cursor = [], [None], None
+    for _ in range(max_pages):
+        query = {"limit": 200, "fields": "id", **({"cursor": cursor} if cursor else {})}
+        status, payload = user.request("GET", f"{API}/images?{urllib.parse.urlencode(query)}")
+        page = json.loads(payload)
+        ids.extend(item["id"] for item in page["items"])
+        cursor = page.get("next_cursor")
+        if not cursor:
+            break
+        cursors.append(cursor)
+
+    status, payload = user.request("GET", f"{API}/tags")
+    tag_counts = sorted(json.loads(payload)["tags"], key=lambda t: -t["count"])
+    if not ids:
+        raise RuntimeError("The catalog is empty; nothing to load-test")
+
+    # Only browse the pages that hold the IDs read above
+    return {
+        "ids": ids,
+        "cursors": cursors,
+        "tags": [t["tag"] for t in tag_counts[:50]] or ["event"],
+        "pages": max(1, len(ids) // INDEX_PAGE_SIZE),
+    }
+
+
+def run_user(user, actions, weights, deadline, think_time, samples):
+    user.login()
+    while time.monotonic() < deadline:
+        action = user.rng.choices(actions, weights=weights)[0]
+        started = time.perf_counter()
+        status, _ = getattr(user, action)()
+        samples.append((action, status, time.perf_counter() - started, time.monotonic()))
+        if think_time:
+            time.sleep(user.rng.expovariate(1 / think_time))
+
+
+def run_load(base_url, scenario, users, duration, warmup, think_time, email, seed):
+    info = discover_catalog(base_url, email)
+    actions, weights = zip(*SCENARIOS[scenario].items(), strict=True)
+    samples = []
+
+    started = time.monotonic()
+    deadline = started + warmup + duration
+    threads = [
+        threading.Thread(
+            target=run_user,
+            args=(VirtualUser(n + 1, base_url, email, info, random.Random(seed + n)),
+                  actions, weights, deadline, think_time, samples),
+            daemon=True,
+        )
+        for n in range(users)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    measured_from = started + warmup
+    return summarize([s for s in samples if s[3] >= measured_from], duration)
+
+
+def summarize(samples, duration):
+    by_action = {}
+    for action, status, seconds, _ in samples:
+        by_action.setdefault(action, []).append((status, seconds))
+
+    def stats(entries):
+        latencies = [seconds * 1000 for _, seconds in entries]
+        errors = sum(1 for status, _ in entries if status == 0 or status >= 400)
+        return {
+            "requests": len(entries),
+            "errors": errors,
+            "error_rate": round(errors / len(entries), 4),
+            "throughput_rps": round(len(entries) / duration, 2),
+            "p50_ms": round(percentile(latencies, 0.50), 2),
+            "p95_ms": round(percentile(latencies, 0.95), 2),
+            "p99_ms": round(percentile(latencies, 0.99), 2),
+            "mean_ms": round(sum(latencies) / len(latencies), 2),
+            "max_ms": round(max(latencies), 2),
+        }
+
+    routes = {action: stats(entries) for action, entries in sorted(by_action.items())}
+    all_entries = [entry for entries in by_action.values() for entry in entries]
+    return {"routes": routes, "total": stats(all_entries) if all_entries else None}
+
+
+### - Local Stack - ###
+class LocalStack:
+    """gunicorn (gunicorn.conf.py) plus the fake Drive server, on a scratch copy of a catalog."""
+
+    def __init__(self, size, workers=None, port=APP_PORT, drive_port=FAKE_DRIVE_PORT, latency=0.0, error_rate=0.0):
+        self.size = size
+        self.workers = workers
+        self.port = port
+        self.drive_port = drive_port
+        self.latency = latency
+        self.error_rate = error_rate
+        self.workdir = None
+        self.processes = []
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    def __enter__(self):
+        self.workdir = tempfile.mkdtemp(prefix="photo-tagger-load-")
+        os.makedirs(os.path.join(self.workdir, "data"))
+        catalog_path = os.path.join(self.workdir, "data", "data.db")
+        shutil.copyfile(catalog.cached_catalog(self.size), catalog_path)
+
+        env = dict(os.environ)
+        env.update({
+            "PYTHONPATH": REPO_ROOT,
+            "GOOGLE_API_BASE_URL": f"http://127.0.0.1:{self.drive_port}",
+            "DEV_LOGIN": "true",
+            "PRODUCTION": "false",
+            "LOG_LEVEL": env.get("LOG_LEVEL", "WARNING"),
+        })
+        for name in ("FLASK_SECRET_KEY", "GOOGLE_CLIENT_ID", "GOOGLE_CLIENT_SECRET", "GOOGLE_PROJECT_ID"):
+            env.setdefault(name, "loadtest")
+
+        self.processes.append(subprocess.Popen(
+            [sys.executable, "-m", "bench.fake_drive_server", "--port", str(self.drive_port),
+             "--catalog", catalog_path, "--images", str(min(self.size, 20000)),
+             "--latency", str(self.latency), "--error-rate", str(self.error_rate)],
+            cwd=REPO_ROOT, env=env,
+        ))
+        gunicorn = [sys.executable, "-m", "gunicorn", "-c", os.path.join(REPO_ROOT, "gunicorn.conf.py"),
+                    "--bind", f"127.0.0.1:{self.port}", "--chdir", self.workdir]
+        if self.workers:
+            gunicorn += ["--workers", str(self.workers)]
+        self.processes.append(subprocess.Popen(gunicorn + ["wsgi:app"], cwd=self.workdir, env=env))
+
+        self.wait_until_ready()
+        return self
+
+    def wait_until_ready(self, timeout=60):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            for process in self.processes:
+                if process.poll() is not None:
+                    raise RuntimeError(f"{process.args[2]} exited with status {process.returncode}")
+            try:
+                for port, path in ((self.drive_port, "/__fake__/stats"), (self.port, "/metrics")):
+                    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+                    conn.request("GET", path)
+                    conn.getresponse().read()
+                    conn.close()
+                return
+            except OSError:
+                time.sleep(0.25)
+        raise RuntimeError("The app did not start in time")
+
+    def __exit__(self, *exc):
+        for process in reversed(self.processes):
+            process.terminate()
+        for process in self.processes:
+            try:
+                process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+### - Reporting - ###
+def print_table(report, stream=sys.stderr):
+    print(f"{'action':<14} {'requests':>9} {'errors':>7} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}",
+          file=stream)
+    rows = list(report["routes"].items()) + ([("TOTAL", report["total"])] if report["total"] else [])
+    for action, s in rows:
+        print(f"{action:<14} {s['requests']:>9} {s['errors']:>7} {s['throughput_rps']:>8.1f} "
+              f"{s['p50_ms']:>9.1f} {s['p95_ms']:>9.1f} {s['p99_ms']:>9.1f}", file=stream)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test Photo Tagger with scripted curator scenarios.")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--start", action="store_true", help="Start gunicorn and the fake Drive locally")
+    target.add_argument("--url", help="Base URL of an app that is already running")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="mixed")
+    parser.add_argument("--users", type=int, default=4, help="Concurrent virtual users (default 4)")
+    parser.add_argument("--duration", type=float, default=30, help="Measured seconds (default 30)")
+    parser.add_argument("--warmup", type=float, default=5, help="Seconds run before measuring (default 5)")
+    parser.add_argument("--think-time", type=float, default=0.0,
+                        help="Mean pause between a user's actions, in seconds (default 0: closed loop)")
+    parser.add_argument("--size", type=int, default=10000, help="Catalog size with --start (default 10000)")
+    parser.add_argument("--workers", type=int, help="gunicorn workers with --start (default: gunicorn.conf.py)")
+    parser.add_argument("--latency", type=float, default=0.0, help="Fake Drive latency per call with --start")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fake Drive 429 rate with --start")
+    parser.add_argument("--email", default=FAKE_USER_EMAIL, help="Allowed user to sign in as")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report here (default: stdout)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    config = {key: getattr(args, key) for key in
+              ("scenario", "users", "duration", "warmup", "think_time", "size", "workers", "latency", "error_rate")}
+
+    if args.start:
+        with LocalStack(args.size, args.workers, latency=args.latency, error_rate=args.error_rate) as stack:
+            result = run_load(stack.url, args.scenario, args.users, args.duration, args.warmup,
+                              args.think_time, args.email, args.seed)
+    else:
+        result = run_load(args.url.rstrip("/"), args.scenario, args.users, args.duration, args.warmup,
+                          args.think_time, args.email, args.seed)
+
+    report = {
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "config": config,
+        **result,
+    }
+    print_table(report)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,361 @@
+"""
+Benchmarks for the hot paths in main.py, run against generated catalogs and a fake Drive.
+
+    python -m bench.run                                   # 1k, 10k, 100k and 1M images
+    python -m bench.run --sizes 1000,10000 --output bench/results/baseline.json
+    python -m bench.run --sizes 1000,10000 --compare bench/results/baseline.json
+    python -m bench.run --input new.json --compare baseline.json   # compare two saved reports
+
+Each size gets a fresh copy of a cached catalog (see bench/catalog.py). The app runs in a
+temporary working directory, so the real data/ directory is never touched. Google calls
+go to bench.fake_drive.FakeDrive, with --latency seconds added per call and --error-rate of
+calls failing with 429.
+
+The refresh routes make one Drive call per photo, so they only run at sizes up to
+--refresh-max. With --compare, the exit status is 1 if any case's median got slower
+than the baseline by more than --threshold (and by more than --min-delta-ms).
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench import catalog
+from bench.fake_drive import FAKE_USER_EMAIL, FakeDrive, install
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPORT_FORMAT_VERSION = 1
+DEFAULT_SIZES = "1000,10000,100000,1000000"
+BENCH_CREDENTIALS = {"token": "bench-token"}
+
+
+### - App Setup - ###
+def load_app():
+    """Imports main.py inside a scratch working directory with benchmark settings."""
+    workdir = tempfile.mkdtemp(prefix="photo-tagger-bench-")
+    os.chdir(workdir)
+    os.makedirs("data", exist_ok=True)
+
+    os.environ.setdefault("FLASK_SECRET_KEY", "bench")
+    os.environ.setdefault("GOOGLE_CLIENT_ID", "bench")
+    os.environ.setdefault("GOOGLE_CLIENT_SECRET", "bench")
+    os.environ.setdefault("GOOGLE_PROJECT_ID", "bench")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ["PROFILE_SAMPLE_RATE"] = "0"
+
+    import main
+    return main, workdir
+
+
+def reset_data(main, catalog_path):
+    """Replaces the app's databases with a fresh copy of the catalog and empties the caches."""
+    for name in os.listdir("data"):
+        path = os.path.join("data", name)
+        if os.path.isfile(path):
+            os.remove(path)
+    shutil.copyfile(catalog_path, main.DB_FILE)
+    main.init_db()
+    main._fragment_lru.clear()
+
+
+def bench_client(main):
+    client = main.app.test_client()
+    with client.session_transaction() as session:
+        session["credentials"] = dict(BENCH_CREDENTIALS)
+        session["email"] = FAKE_USER_EMAIL
+    return client
+
+
+def check(response):
+    if response.status_code >= 500:
+        raise RuntimeError(f"{response.request.method} {response.request.path} returned {response.status_code}")
+    return response
+
+
+def bump_version(main):
+    # Makes every cached fragment stale, as any write would
+    conn = main.connect_db()
+    c = conn.cursor()
+    main.bump_catalog_version(c)
+    conn.commit()
+    conn.close()
+
+
+def execute(main, sql, params=()):
+    conn = main.connect_db()
+    conn.execute(sql, params)
+    conn.commit()
+    conn.close()
+
+
+### - Cases - ###
+class Case:
+    def __init__(self, name, run, setup=None, refresh=False):
+        self.name = name
+        self.run = run
+        self.setup = setup
+        self.refresh = refresh
+
+
+def build_cases(main, client, drive, catalog_path, size, args):
+    ids = catalog.catalog_ids(catalog_path)
+    search_tag, rename_tag = catalog.popular_tags(catalog_path, 2)
+    middle_page = max(1, size // main.ITEMS_PER_PAGE // 2)
+    page_ids = ids[(middle_page - 1) * main.ITEMS_PER_PAGE:][:main.ITEMS_PER_PAGE]
+
+    # A Drive tree over (a sample of) the catalog, roughly 50 images per folder
+    tree_ids = ids[:args.tree_max]
+    fanout = max(2, round((len(tree_ids) / 50) ** (1 / 3)))
+    root_id = drive.build_tree(tree_ids, depth=3, fanout=fanout, seed=args.seed)
+    creds = main.load_credentials(BENCH_CREDENTIALS)
+
+    rename = {"from": rename_tag, "to": f"{rename_tag}-renamed"}
+    state = {"backup_id": None, "refresh_backup_id": None}
+
+    def clear_thumbnails(file_ids):
+        placeholders = ",".join("?" * len(file_ids))
+        execute(main, f"UPDATE images SET thumbnail = NULL WHERE id IN ({placeholders})", file_ids)
+
+    def load_data_setup():
+        # Two rows on the page lose their thumbnail, so each run also does one batch refresh
+        clear_thumbnails(page_ids[:2])
+
+    def load_data():
+        with main.app.test_request_context():
+            main.session["credentials"] = dict(BENCH_CREDENTIALS)
+            main.load_data(page=middle_page, per_page=main.ITEMS_PER_PAGE)
+
+    def edit_tag():
+        check(client.post("/tag/edit", data={"old_tag": rename["from"], "new_tag": rename["to"]}))
+        rename["from"], rename["to"] = rename["to"], rename["from"]
+
+    def clear_backups():
+        execute(main, "DELETE FROM backups")
+
+    def backup_exists(backup_id):
+        return any(backup[0] == backup_id for backup in main.list_backups())
+
+    def ensure_backup():
+        if not backup_exists(state["backup_id"]):
+            main.save_backup("bench")
+            state["backup_id"] = main.list_backups()[0][0]
+
+    def ensure_refresh_backup():
+        # A backup taken while the sample had no thumbnails, so loading it refreshes them from Drive
+        clear_thumbnails(ids[:args.refresh_max])
+        if not backup_exists(state["refresh_backup_id"]):
+            main.save_backup("bench-refresh")
+            state["refresh_backup_id"] = main.list_backups()[0][0]
+
+    return [
+        Case("load_data", load_data, setup=load_data_setup),
+        Case("index_search", lambda: check(client.get("/", query_string={"q": search_tag})),
+             setup=lambda: bump_version(main)),
+        Case("index_search_cached", lambda: check(client.get("/", query_string={"q": search_tag}))),
+        Case("index_browse", lambda: check(client.get("/", query_string={"page": middle_page})),
+             setup=lambda: bump_version(main)),
+        Case("edit_tag", edit_tag),
+        Case("save_backup", lambda: check(client.post("/backup/save", data={"backup_name": "bench"})),
+             setup=clear_backups),
+        Case("load_backup", lambda: main.load_backup(state["backup_id"], creds=None, try_refresh_missing=False),
+             setup=ensure_backup),
+        Case("list_images_in_folder", lambda: main.list_images_in_folder(root_id, creds),
+             setup=lambda: execute(main, "DELETE FROM drive_files")),
+        Case("list_images_in_folder_cached", lambda: main.list_images_in_folder(root_id, creds)),
+        Case("refresh_thumbnails", lambda: check(client.post("/refresh/thumbnails")), refresh=True),
+        Case("refresh_thumbnails_test_mode",
+             lambda: check(client.post("/refresh/thumbnails", data={"test_mode": "true"}))),
+        Case("backup_load_with_refresh", lambda: check(client.post(f"/backup/load/{state['refresh_backup_id']}")),
+             setup=ensure_refresh_backup, refresh=True),
+        Case("backup_refresh", lambda: check(client.post(f"/backup/refresh/{state['backup_id']}")),
+             setup=ensure_backup, refresh=True),
+        Case("test_single", lambda: check(client.post(f"/test/single/{ids[0]}"))),
+    ]
+
+
+### - Measurement - ###
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def measure(case, repeat, drive):
+    samples = []
+    calls_before = dict(drive.calls)
+    for _ in range(repeat):
+        if case.setup:
+            case.setup()
+        started = time.perf_counter()
+        case.run()
+        samples.append((time.perf_counter() - started) * 1000)
+
+    calls = {method: (count - calls_before.get(method, 0)) / repeat
+             for method, count in drive.calls.items() if count != calls_before.get(method, 0)}
+    return {
+        "median_ms": round(statistics.median(samples), 3),
+        "p95_ms": round(percentile(samples, 0.95), 3),
+        "min_ms": round(min(samples), 3),
+        "max_ms": round(max(samples), 3),
+        "runs": len(samples),
+        "drive_calls_per_run": calls,
+    }
+
+
+def peak_rss_mb():
+    # ru_maxrss is kilobytes on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(args):
+    main, workdir = load_app()
+    results = {}
+    try:
+        for size in args.sizes:
+            started = time.perf_counter()
+            catalog_path = catalog.cached_catalog(size, args.seed)
+            reset_data(main, catalog_path)
+
+            drive = FakeDrive(latency=args.latency, error_rate=args.error_rate, seed=args.seed)
+            uninstall = install(drive, main)
+            client = bench_client(main)
+            cases = build_cases(main, client, drive, catalog_path, size, args)
+            setup_seconds = time.perf_counter() - started
+
+            size_results = {}
+            for case in cases:
+                if args.only and case.name not in args.only:
+                    continue
+                if case.refresh and size > args.refresh_max:
+                    continue
+                # One untimed run warms caches and lazily built state
+                if case.setup:
+                    case.setup()
+                case.run()
+                size_results[case.name] = measure(case, args.refresh_repeat if case.refresh else args.repeat, drive)
+                print(f"{size:>9,} {case.name:<30} median {size_results[case.name]['median_ms']:>10.2f} ms",
+                      file=sys.stderr)
+
+            uninstall()
+            results[str(size)] = {
+                "setup_seconds": round(setup_seconds, 2),
+                "peak_rss_mb": peak_rss_mb(),
+                "cases": size_results,
+            }
+    finally:
+        main.metrics.flush()
+        os.chdir(REPO_ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "format": REPORT_FORMAT_VERSION,
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "repeat": args.repeat,
+            "refresh_repeat": args.refresh_repeat,
+            "refresh_max": args.refresh_max,
+            "tree_max": args.tree_max,
+            "latency": args.latency,
+            "error_rate": args.error_rate,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+
+
+### - Comparison - ###
+def compare_reports(baseline, current, threshold, min_delta_ms):
+    """Prints a comparison table and returns the list of regressions."""
+    regressions = []
+    print(f"{'size':>9} {'case':<30} {'baseline ms':>12} {'current ms':>12} {'change':>8}")
+    for size, size_results in current["results"].items():
+        baseline_cases = baseline.get("results", {}).get(size, {}).get("cases", {})
+        for name, result in size_results["cases"].items():
+            before = baseline_cases.get(name)
+            if before is None:
+                print(f"{int(size):>9,} {name:<30} {'-':>12} {result['median_ms']:>12.2f} {'new':>8}")
+                continue
+
+            old, new = before["median_ms"], result["median_ms"]
+            change = (new - old) / old if old else 0.0
+            regressed = change > threshold and new - old > min_delta_ms
+            flag = "  REGRESSION" if regressed else ""
+            print(f"{int(size):>9,} {name:<30} {old:>12.2f} {new:>12.2f} {change:>+8.1%}{flag}")
+            if regressed:
+                regressions.append((size, name, old, new))
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark Photo Tagger against generated catalogs.")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES,
+                        type=lambda value: [int(size) for size in value.split(",") if size],
+                        help=f"Comma-separated catalog sizes (default {DEFAULT_SIZES})")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per case (default 5)")
+    parser.add_argument("--refresh-repeat", type=int, default=1, help="Timed runs per refresh route (default 1)")
+    parser.add_argument("--refresh-max", type=int, default=1000,
+                        help="Largest catalog the refresh routes run against (default 1000)")
+    parser.add_argument("--tree-max", type=int, default=20000,
+                        help="Most images placed in the fake Drive folder tree (default 20000)")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to each fake Drive call")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of fake Drive calls that fail with 429")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", type=lambda value: set(value.split(",")), help="Comma-separated case names to run")
+    parser.add_argument("--output", help="Write the JSON report here (default: stdout)")
+    parser.add_argument("--input", help="Compare this saved report instead of running the benchmarks")
+    parser.add_argument("--compare", help="Baseline report to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="Allowed slowdown of a median before it counts as a regression (default 0.25 = 25%%)")
+    parser.add_argument("--min-delta-ms", type=float, default=5.0,
+                        help="Ignore slowdowns smaller than this many milliseconds (default 5)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    if args.input:
+        with open(args.input) as f:
+            report = json.load(f)
+    else:
+        report = run_benchmarks(args)
+        if args.output:
+            os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+            with open(args.output, "w") as f:
+                json.dump(report, f, indent=2)
+        elif not args.compare:
+            json.dump(report, sys.stdout, indent=2)
+            print()
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare_reports(baseline, report, args.threshold, args.min_delta_ms)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) over {args.threshold:.0%}", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,177 @@
+"""
+Startup timings for main.py: what a gunicorn master pays once, and what a worker forked from
+it (or a non-preloaded worker, or a script) pays before its first search.
+
+    python -m bench.startup                       # 10k-image catalog, 5 runs
+    python -m bench.startup --size 100000 --importtime 15 --output startup.json
+
+Every run is a fresh interpreter in a scratch directory on a copy of a generated catalog
+(bench/catalog.py), so your data/ directory is not touched. Phases:
+
+    import_main    import main (module-level setup only)
+    create_app     main.create_app(): schema, Google client imports, tag index
+    first_search   the first search afterwards, as a worker's first request would run it
+    cold_search    the first search straight after the import, without create_app()
+
+The catalog is brought up to the current schema once beforehand, so create_app() is timed
+as it runs on every restart rather than on the first one after an upgrade.
+
+--importtime N adds the N slowest modules to `import main` by cumulative time
+(python -X importtime), to see what to defer next.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from bench import catalog
+from bench.run import git_commit, percentile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPORT_FORMAT_VERSION = 1
+
+# Runs in the child interpreter; prints one JSON object of phase timings in milliseconds
+CHILD_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+import main
+timings = {"import_main": time.perf_counter() - started}
+search = sys.argv[1]
+if sys.argv[2] == "warm":
+    started = time.perf_counter()
+    main.create_app()
+    timings["create_app"] = time.perf_counter() - started
+    phase = "first_search"
+else:
+    phase = "cold_search"
+started = time.perf_counter()
+main.search_image_ids(search)
+timings[phase] = time.perf_counter() - started
+timings = {name: round(seconds * 1000, 2) for name, seconds in timings.items()}
+timings["modules"] = len(sys.modules)
+print(json.dumps(timings))
+"""
+
+
+def child_env():
+    env = dict(os.environ)
+    env.setdefault("FLASK_SECRET_KEY", "bench")
+    env.setdefault("GOOGLE_CLIENT_ID", "bench")
+    env.setdefault("GOOGLE_CLIENT_SECRET", "bench")
+    env.setdefault("GOOGLE_PROJECT_ID", "bench")
+    env["LOG_LEVEL"] = "WARNING"
+    env["PROFILE_SAMPLE_RATE"] = "0"
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [REPO_ROOT, env.get("PYTHONPATH")]))
+    return env
+
+
+def migrate_catalog(workdir, catalog_path):
+    """A copy of the catalog with the current schema, so the timed runs don't include one-off backfills."""
+    shutil.copyfile(catalog_path, os.path.join(workdir, "data", "data.db"))
+    subprocess.run([sys.executable, "-c", "import main; main.init_db()"], cwd=workdir,
+                   env=child_env(), check=True)
+    migrated_path = os.path.join(workdir, "migrated.db")
+    shutil.move(os.path.join(workdir, "data", "data.db"), migrated_path)
+    return migrated_path
+
+
+def run_child(workdir, catalog_path, search, mode):
+    # A fresh copy each run, so no run finds the fragment cache or metrics of the one before
+    for name in os.listdir(os.path.join(workdir, "data")):
+        path = os.path.join(workdir, "data", name)
+        if os.path.isfile(path):
+            os.remove(path)
+    shutil.copyfile(catalog_path, os.path.join(workdir, "data", "data.db"))
+    result = subprocess.run([sys.executable, "-c", CHILD_SCRIPT, search, mode], cwd=workdir,
+                            env=child_env(), capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def import_profile(workdir, limit):
+    """The slowest modules to import main, as (cumulative ms, module) pairs."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=workdir,
+                            env=child_env(), capture_output=True, text=True, check=True)
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit():
+            modules.append((int(cumulative) / 1000, name.strip()))
+    modules.sort(reverse=True)
+    return [{"module": name, "cumulative_ms": round(ms, 2)} for ms, name in modules[:limit]]
+
+
+def summarize(samples):
+    return {
+        "median_ms": round(statistics.median(samples), 2),
+        "p95_ms": round(percentile(samples, 0.95), 2),
+        "min_ms": round(min(samples), 2),
+        "max_ms": round(max(samples), 2),
+    }
+
+
+def run(args):
+    catalog_path = catalog.cached_catalog(args.size, args.seed)
+    search_tag = catalog.popular_tags(catalog_path, 1)[0]
+    workdir = tempfile.mkdtemp(prefix="photo-tagger-startup-")
+    os.makedirs(os.path.join(workdir, "data"))
+    try:
+        catalog_path = migrate_catalog(workdir, catalog_path)
+        phases = {}
+        modules = {}
+        for mode in ("warm", "cold"):
+            for _ in range(args.repeat):
+                timings = run_child(workdir, catalog_path, search_tag, mode)
+                modules[mode] = timings.pop("modules")
+                for phase, ms in timings.items():
+                    phases.setdefault(phase, []).append(ms)
+
+        report = {
+            "format": REPORT_FORMAT_VERSION,
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "size": args.size,
+            "repeat": args.repeat,
+            "phases": {phase: summarize(samples) for phase, samples in phases.items()},
+            "modules_loaded": {"import_main": modules["cold"], "create_app": modules["warm"]},
+        }
+        if args.importtime:
+            report["slowest_imports"] = import_profile(workdir, args.importtime)
+        return report
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Time Photo Tagger's import and create_app() startup.")
+    parser.add_argument("--size", type=int, default=10000, help="Catalog size (default: 10000)")
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters per mode (default: 5)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--importtime", type=int, default=0, metavar="N",
+                        help="Also list the N slowest modules imported by main")
+    parser.add_argument("--output", help="Write the JSON report here (default: stdout)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run(args)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
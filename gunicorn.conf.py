@@ -1,3 +1,5 @@
+import gc
+
 bind = "0.0.0.0:5000"
 workers = 2
 worker_class = "sync"
@@ -6,4 +8,11 @@ timeout = 30
 keepalive = 2
 max_requests = 1000
 max_requests_jitter = 100
-preload_app = True
\ No newline at end of file
+preload_app = True
+
+
+def when_ready(_server):
+    # With preload_app the master has imported the app (wsgi.py ran create_app()) before any
+    # worker forks. Freezing those objects keeps the garbage collector from writing to them in
+    # the workers, so their pages stay shared with the master instead of being copied.
+    gc.freeze()
@@ -0,0 +1,247 @@
+"""
+Request-level timing and metrics for the Photo Tagger app.
+
+Hot segments (SQLite, Google API calls by method, template rendering, JSON decoding) are
+timed into a recorder that lives for one request. When the request ends, the totals are
+sent back as a Server-Timing header and added to cumulative metrics. Every few seconds the
+metrics are flushed to a small SQLite store that all gunicorn workers share, and they are
+served in Prometheus text format from /metrics.
+"""
+import atexit
+import contextvars
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger("photo_tagger.metrics")
+
+# Request duration histogram buckets (seconds)
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# How often each worker writes its buffered metrics to the shared store
+FLUSH_INTERVAL_SECONDS = 5.0
+
+METRIC_HELP = {
+    "photo_tagger_requests_total": ("counter", "Requests handled, by route, method and status."),
+    "photo_tagger_request_duration_seconds": ("histogram", "Request wall time, by route."),
+    "photo_tagger_segment_seconds_total": ("counter", "Time spent in instrumented segments, by segment."),
+    "photo_tagger_segment_calls_total": ("counter", "Calls made in instrumented segments, by segment."),
+}
+
+_current = contextvars.ContextVar("request_timings", default=None)
+
+
+class RequestTimings:
+    """Per-request accumulator of {segment: [seconds, calls]}."""
+    __slots__ = ("started", "segments")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.segments = {}
+
+    def add(self, segment, seconds, calls=1):
+        entry = self.segments.get(segment)
+        if entry is None:
+            self.segments[segment] = [seconds, calls]
+        else:
+            entry[0] += seconds
+            entry[1] += calls
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+
+def begin_request():
+    timings = RequestTimings()
+    _current.set(timings)
+    return timings
+
+
+def current_request():
+    return _current.get()
+
+
+def clear_request():
+    _current.set(None)
+
+
+def add_timing(segment, seconds, calls=1):
+    # Outside a request (startup, CLI scripts) timings are simply dropped
+    timings = _current.get()
+    if timings is not None:
+        timings.add(segment, seconds, calls)
+
+
+@contextmanager
+def timed(segment):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_timing(segment, time.perf_counter() - started)
+
+
+def server_timing_header(timings):
+    """Formats the recorder as a Server-Timing header value (durations in milliseconds)."""
+    parts = []
+    for segment, (seconds, calls) in sorted(timings.segments.items()):
+        name = segment.replace(".", "-").replace(":", "-")
+        parts.append(f'{name};dur={seconds * 1000:.2f};desc="{calls} call(s)"')
+    parts.append(f"total;dur={timings.elapsed() * 1000:.2f}")
+    return ", ".join(parts)
+
+
+### - SQLite Timing - ###
+class TimedCursor(sqlite3.Cursor):
+    """Cursor that charges execute/fetch time to the "sqlite" segment."""
+
+    def execute(self, *args, **kwargs):
+        with timed("sqlite"):
+            return super().execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        with timed("sqlite"):
+            return super().executemany(*args, **kwargs)
+
+    def fetchone(self):
+        with timed("sqlite"):
+            return super().fetchone()
+
+    def fetchmany(self, *args, **kwargs):
+        with timed("sqlite"):
+            return super().fetchmany(*args, **kwargs)
+
+    def fetchall(self):
+        with timed("sqlite"):
+            return super().fetchall()
+
+
+class TimedConnection(sqlite3.Connection):
+    """Connection factory for sqlite3.connect() whose cursors and commits are timed."""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, *args, **kwargs):
+        return self.cursor().execute(*args, **kwargs)
+
+    def commit(self):
+        with timed("sqlite"):
+            return super().commit()
+
+
+### - Shared Metrics Store - ###
+def _label_string(labels):
+    return ",".join(f'{key}="{str(value)}"' for key, value in sorted(labels.items()))
+
+
+class MetricsStore:
+    """
+    Cumulative counters buffered in memory and flushed to a SQLite file shared by all workers.
+    Counters only ever go up, so totals from recycled workers are kept.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._initialized = False
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5)
+        if not self._initialized:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS metrics (
+                    name TEXT,
+                    labels TEXT,
+                    value REAL,
+                    PRIMARY KEY (name, labels)
+                )
+            """)
+            self._initialized = True
+        return conn
+
+    def inc(self, name, labels, amount=1.0):
+        key = (name, _label_string(labels))
+        with self._lock:
+            self._pending[key] = self._pending.get(key, 0.0) + amount
+
+    def observe_request(self, route, method, status, timings):
+        duration = timings.elapsed()
+        self.inc("photo_tagger_requests_total", {"route": route, "method": method, "status": status})
+
+        # Cumulative buckets, as Prometheus expects
+        for bound in REQUEST_BUCKETS:
+            if duration <= bound:
+                self.inc("photo_tagger_request_duration_seconds_bucket", {"route": route, "le": bound})
+        self.inc("photo_tagger_request_duration_seconds_bucket", {"route": route, "le": "+Inf"})
+        self.inc("photo_tagger_request_duration_seconds_sum", {"route": route}, duration)
+        self.inc("photo_tagger_request_duration_seconds_count", {"route": route})
+
+        for segment, (seconds, calls) in timings.segments.items():
+            self.inc("photo_tagger_segment_seconds_total", {"route": route, "segment": segment}, seconds)
+            self.inc("photo_tagger_segment_calls_total", {"route": route, "segment": segment}, calls)
+
+        if time.monotonic() - self._last_flush >= FLUSH_INTERVAL_SECONDS:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+        if not pending:
+            return
+
+        try:
+            conn = self._connect()
+            conn.executemany("""
+                INSERT INTO metrics (name, labels, value) VALUES (?, ?, ?)
+                ON CONFLICT(name, labels) DO UPDATE SET value = value + excluded.value
+            """, [(name, labels, value) for (name, labels), value in pending.items()])
+            conn.commit()
+            conn.close()
+        except sqlite3.Error as e:
+            # Put the increments back; they go out with the next flush
+            with self._lock:
+                for key, value in pending.items():
+                    self._pending[key] = self._pending.get(key, 0.0) + value
+            logger.warning("Metrics flush failed: %s", e)
+
+    def render_prometheus(self):
+        """Flushes this worker's buffer and returns every worker's metrics in Prometheus text format."""
+        self.flush()
+        conn = self._connect()
+        rows = conn.execute("SELECT name, labels, value FROM metrics ORDER BY name, labels").fetchall()
+        conn.close()
+
+        lines = []
+        announced = set()
+        for name, labels, value in rows:
+            family = name
+            for suffix in ("_bucket", "_sum", "_count"):
+                if name.endswith(suffix) and name[:-len(suffix)] in METRIC_HELP:
+                    family = name[:-len(suffix)]
+            if family not in announced and family in METRIC_HELP:
+                metric_type, help_text = METRIC_HELP[family]
+                lines.append(f"# HELP {family} {help_text}")
+                lines.append(f"# TYPE {family} {metric_type}")
+                announced.add(family)
+            lines.append(f"{name}{{{labels}}} {value:g}" if labels else f"{name} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def register_exit_flush(self):
+        atexit.register(self.flush)
+
+
+### - Sampled Profiling - ###
+def profile_sample_rate():
+    # PROFILE_SAMPLE_RATE=0.01 profiles ~1% of requests; 0 (the default) turns it off
+    try:
+        return float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+    except ValueError:
+        return 0.0
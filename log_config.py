@@ -0,0 +1,142 @@
+"""
+Logging setup for the Photo Tagger app.
+
+- Levels come from LOG_LEVEL (default INFO), so debug output costs nothing in production.
+- LOG_FORMAT=json writes one JSON object per line (the default when PRODUCTION=true).
+  LOG_FORMAT=text writes a plain single-line format for local development.
+- Records are put on an in-memory queue and written to stdout by a background listener
+  thread, so request threads never block on stdout.
+- ProgressLog turns per-item outcomes in long loops into periodic INFO summaries. The
+  per-item details are only logged at DEBUG.
+"""
+import atexit
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+
+# Attributes every LogRecord has; anything else was passed through `extra=` and is emitted as a field
+_STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener = None
+_configured_pid = None
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s: %(message)s")
+
+    def format(self, record):
+        line = super().format(record)
+        fields = {k: v for k, v in vars(record).items() if k not in _STANDARD_ATTRS and not k.startswith("_")}
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+
+def _default_format():
+    return "json" if os.getenv("PRODUCTION", "false").lower() == "true" else "text"
+
+
+def configure_logging():
+    """
+    Installs the queue handler on the root logger and starts the stdout listener.
+    Safe to call repeatedly. After a fork (gunicorn preload_app) the child gets its own listener.
+    """
+    global _listener, _configured_pid
+    if _configured_pid == os.getpid():
+        return
+
+    level = getattr(logging, os.getenv("LOG_LEVEL", "INFO").upper(), logging.INFO)
+    log_format = os.getenv("LOG_FORMAT", _default_format()).lower()
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter() if log_format == "json" else TextFormatter())
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, logging.handlers.QueueHandler):
+            root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(level)
+
+    # The parent's listener thread does not survive a fork, so each process starts its own
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=False)
+    _listener.start()
+    _configured_pid = os.getpid()
+
+
+def _stop_listener():
+    if _listener is not None and _configured_pid == os.getpid():
+        _listener.stop()
+
+
+atexit.register(_stop_listener)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=configure_logging)
+
+
+class ProgressLog:
+    """
+    Counts per-item outcomes in a long loop and logs an INFO summary every `every_items`
+    items or `every_seconds` seconds, plus once at the end. Per-item details go to
+    item() and are only formatted when DEBUG is enabled.
+    """
+
+    def __init__(self, logger, label, total=None, every_items=500, every_seconds=10.0):
+        self.logger = logger
+        self.label = label
+        self.total = total
+        self.every_items = every_items
+        self.every_seconds = every_seconds
+        self.counts = {}
+        self.processed = 0
+        self._last_report_items = 0
+        self._last_report_time = time.monotonic()
+        self._debug = logger.isEnabledFor(logging.DEBUG)
+
+    def item(self, outcome, message=None, *args):
+        self.counts[outcome] = self.counts.get(outcome, 0) + 1
+        self.processed += 1
+        if self._debug and message:
+            self.logger.debug(message, *args)
+
+        if (self.processed - self._last_report_items >= self.every_items
+                or time.monotonic() - self._last_report_time >= self.every_seconds):
+            self.report()
+
+    def report(self, final=False):
+        self._last_report_items = self.processed
+        self._last_report_time = time.monotonic()
+        self.logger.info(
+            "%s %s: %d%s processed",
+            self.label,
+            "finished" if final else "progress",
+            self.processed,
+            f"/{self.total}" if self.total is not None else "",
+            extra={"progress": self.label, "processed": self.processed, "total": self.total, "outcomes": dict(self.counts)},
+        )
+
+    def finish(self):
+        self.report(final=True)
@@ -1,22 +1,50 @@
 ### - Libraries - ###
 import dotenv
-from flask import Flask, render_template, request, redirect, session, abort, flash
+from flask import Flask, Blueprint, render_template, request, redirect, session, abort, flash, jsonify
+from flask import before_render_template, template_rendered, has_request_context, g
 import os
+import base64
 import re
 from dotenv import load_dotenv
 import sqlite3
-import json
+import math
 import datetime
+import gzip
+import atexit
+import hashlib
+import importlib
+import threading
+import time
+import random
+import uuid
+import itertools
+import bisect
+from array import array
+import cProfile
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict, defaultdict, deque
+from markupsafe import Markup
+
+import logging
+import instrumentation
+import log_config
+import codec
+import rate_limit
+import perceptual_hash
+import tag_query
+from instrumentation import timed, add_timing
+
+try:
+    import brotli  # Optional: enables Content-Encoding: br when installed
+except ImportError:
+    brotli = None
 
 load_dotenv()  # Load environment variables from .env file
 
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import Flow
-from google.auth.transport.requests import Request
-from googleapiclient.http import BatchHttpRequest
-import googleapiclient.discovery
-from googleapiclient.discovery import build
-
+# Leveled, queue-backed logging (LOG_LEVEL, LOG_FORMAT); see log_config.py
+log_config.configure_logging()
+logger = logging.getLogger("photo_tagger")
 
 ### - Flask App Setup - ###
 app = Flask(__name__)
@@ -43,10 +71,90 @@ ALLOWED_USERS = {
 # Database Configuration
 DB_FILE = "data/data.db"
 
+# Request Metrics (cumulative counters shared by all workers, served at /metrics)
+METRICS_DB = "data/metrics.db"
+# /metrics needs a signed-in session unless this is on (for a Prometheus scraper that can only
+# reach the app over a private network; route names and traffic would be public otherwise)
+METRICS_PUBLIC = os.getenv("METRICS_PUBLIC", "false").lower() == "true"
+PROFILE_DIR = "data/profiles"  # Where sampled cProfile dumps go (see PROFILE_SAMPLE_RATE)
+
+# Rendered Fragment Cache (per-worker LRU in front of a small SQLite store shared by all workers)
+FRAGMENT_CACHE_DB = "data/fragment_cache.db"
+FRAGMENT_CACHE_SIZE = 128          # Entries kept in each worker's memory
+FRAGMENT_CACHE_SHARED_SIZE = 512   # Entries kept in the shared store
+
+# Thumbnail Refresh Coalescing (one Drive fetch per file ID across threads and workers)
+THUMBNAIL_CLAIM_TTL_SECONDS = 30   # Claims left behind by a crashed worker expire after this
+THUMBNAIL_WAIT_SECONDS = 10        # Longest a request waits on another request's fetch
+THUMBNAIL_POLL_SECONDS = 0.1       # How often a worker checks whether another worker's fetch finished
+
+# Drive API Rate Limiting (token buckets per worker; rates adapt to Google's rate-limit errors)
+# Google's default quota is 12,000 queries per minute (200/s), per project and per user.
+DRIVE_REQUESTS_PER_SECOND = 50        # Starting rate for the whole worker
+DRIVE_USER_REQUESTS_PER_SECOND = 50   # Starting rate per signed-in user
+DRIVE_MIN_REQUESTS_PER_SECOND = 1
+DRIVE_MAX_REQUESTS_PER_SECOND = 200
+DRIVE_BURST = 100                     # Calls that can go out back to back after an idle spell (one full page batch fits)
+DRIVE_MAX_RETRIES = 5                 # Retries for rate-limit and transient (5xx) errors
+DRIVE_BACKOFF_BASE_SECONDS = 0.5      # First retry waits up to this long, doubling each time
+DRIVE_BACKOFF_CAP_SECONDS = 32
+
+# Drive Metadata Cache (drive_files table, shared by all workers)
+# Thumbnail links expire, so they are stored but never served from here.
+DRIVE_FILE_CACHE_TTL_SECONDS = 6 * 3600   # File metadata older than this is fetched again
+DRIVE_FOLDER_CACHE_TTL_SECONDS = 3600     # Folder listings older than this are listed again
+DRIVE_LIST_PAGE_SIZE = 1000               # Largest page files.list allows
+
+# Folder Imports
+# Folders are listed one call each. Once a crawl has listed this many folders from Drive and
+# more are left, it switches to flat queries over all the user's folders and images instead.
+FOLDER_CRAWL_FLAT_THRESHOLD = 25
+
+# Watched Folders (imported folder links are re-synced in the background for new photos)
+FOLDER_SYNC_INTERVAL_SECONDS = 3600   # How often each watched folder is checked
+FOLDER_SYNC_CLAIM_SECONDS = 600       # A sync left unfinished by a crashed worker can be retried after this
+
+# Folder Ingest (folder imports run in a background thread; the page polls their progress)
+INGEST_BATCH_SIZE = 100      # Images per thumbnail batch and database write (a Drive batch holds at most 100 calls)
+INGEST_POLL_SECONDS = 2      # How often the page asks for a running import's progress (one short request each)
+INGEST_STALE_SECONDS = 120   # A running job with no progress for this long was lost with its worker
+INGEST_RECENT_SECONDS = 600  # Finished imports stay listed on the main page this long
+INGEST_INTERRUPTED_MESSAGE = "The server restarted during this import. Add the folder again to import the rest; photos already saved are kept."
+
+# Duplicate Photos (copies of one photo under several Drive file IDs, matched by md5Checksum and size)
+# When on, imports and folder syncs add a copy of a photo already in the catalog as an alias of
+# that photo (its tags go to the existing entry) instead of as a new entry.
+DEDUP_IMPORTS = os.getenv("DEDUP_IMPORTS", "false").lower() == "true"
+
+# Related Tags (/api/tags/related)
+RELATED_TAGS_LIMIT = 10
+RELATED_TAGS_MIN_COUNT = 2   # Fewest shared images for a pair to be suggested
+
+# Search index: "memory" keeps a tag index in each worker (kept current from image_tag_changes),
+# "sqlite" queries the image_tags table for every search
+SEARCH_INDEX = os.getenv("SEARCH_INDEX", "memory").lower()
+TAG_INDEX_CHANGE_LOG_KEEP = 10000  # Change-log entries kept; a worker further behind rebuilds its index
+
+# Near-Duplicate Photos (perceptual hashes, see perceptual_hash.py)
+THUMBNAIL_CACHE_DIR = "data/thumbnail_cache"  # Downloaded thumbnail bytes, one file per image ID
+THUMBNAIL_DOWNLOAD_THREADS = 8
+THUMBNAIL_DOWNLOAD_TIMEOUT_SECONDS = 10
+IMAGE_HASH_BATCH_SIZE = 500       # Hashes written per transaction
+NEAR_DUPLICATE_DISTANCE = 6       # Default Hamming distance (of 64 bits) for two photos to count as near-duplicates
+NEAR_DUPLICATE_MAX_DISTANCE = 16  # Beyond this, unrelated photos start to match
+
+# Backups: "json" stores them as JSON text, "packed" as zlib-compressed JSON (see codec.py)
+BACKUP_FORMAT = os.getenv("BACKUP_FORMAT", "json").lower()
+
 # Pagination Settings
 DEFAULT_PAGE = 1
 ITEMS_PER_PAGE = 40
 
+# JSON API Settings
+API_VERSION = 1
+API_MAX_LIMIT = 200
+API_IMAGE_FIELDS = ("id", "tags", "thumb_url")
+
 # Google OAuth Configuration
 GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
 GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
@@ -70,7 +178,7 @@ client_config = {
     }
 }
 
-print(f"[OAuth Config] Client ID: {GOOGLE_CLIENT_ID}..., Redirect URI: {OAUTH_REDIRECT_URI}")
+logger.info("OAuth config loaded", extra={"client_id": GOOGLE_CLIENT_ID, "redirect_uri": OAUTH_REDIRECT_URI})
 
 OAUTH_SCOPES = [
     "https://www.googleapis.com/auth/drive.readonly",
@@ -83,12 +191,34 @@ OAUTH_SCOPES = [
 SERVER_HOST = "https://photo-tagger-app-npbtz.ondigitalocean.app/"
 SERVER_PORT = int(os.getenv("PORT", 3000))
 
-print(f"[Server Configuration] Running on {SERVER_HOST}:{SERVER_PORT}") 
+logger.info("Server configuration", extra={"host": SERVER_HOST, "port": SERVER_PORT})
 
 # API Settings
 GOOGLE_DRIVE_API_VERSION = "v3"
 OAUTH2_API_VERSION = "v2"
 
+# Google API base URL. Unset means the real Google endpoints; point it at a local stand-in
+# (e.g. bench/fake_drive_server.py at http://127.0.0.1:8765) for offline load testing.
+GOOGLE_API_BASE_URL = os.getenv("GOOGLE_API_BASE_URL", "").rstrip("/")
+GOOGLE_API_SERVICE_PATHS = {"drive": "drive/{version}/", "oauth2": ""}
+DRIVE_BATCH_URI = f"{GOOGLE_API_BASE_URL or 'https://www.googleapis.com'}/batch/drive/{GOOGLE_DRIVE_API_VERSION}"
+
+if GOOGLE_API_BASE_URL:
+    logger.warning("Google API calls are going to %s instead of Google", GOOGLE_API_BASE_URL)
+
+# Local sign-in bypass for load tests (bench/loadtest.py). Only works together with a fake
+# Google API (GOOGLE_API_BASE_URL), never when PRODUCTION=true, and only for loopback clients.
+DEV_LOGIN_ENABLED = (
+    os.getenv("DEV_LOGIN", "false").lower() == "true"
+    and bool(GOOGLE_API_BASE_URL)
+    and os.getenv("PRODUCTION", "false").lower() != "true"
+)
+DEV_LOGIN_TOKEN = "dev-login"
+LOOPBACK_ADDRESSES = {"127.0.0.1", "::1"}
+
+if DEV_LOGIN_ENABLED:
+    logger.warning("DEV_LOGIN is enabled: /dev/login signs in without Google OAuth")
+
 # URL Patterns
 DRIVE_FILE_ID_PATTERN = r"/d/([a-zA-Z0-9_-]+)"
 DRIVE_FOLDER_ID_PATTERN = r"/folders/([a-zA-Z0-9_-]+)"
@@ -96,6 +226,15 @@ DRIVE_FOLDER_ID_PATTERN = r"/folders/([a-zA-Z0-9_-]+)"
 # Default Values
 DEFAULT_THUMBNAIL = "https://via.placeholder.com/200x120?text=No+Thumb"
 
+# Response Compression Settings
+COMPRESS_MIN_SIZE = 1024  # Bytes; smaller bodies are sent as-is
+COMPRESS_MIMETYPES = {"text/html", "application/json"}
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+# Static Asset Caching (fingerprinted URLs never change content, so they can be cached for a year)
+STATIC_CACHE_SECONDS = 365 * 24 * 60 * 60
+
 # Flash Message Categories
 FLASH_SUCCESS = "success"
 FLASH_DANGER = "danger"
@@ -104,8 +243,7 @@ FLASH_INFO = "info"
 
 # Database Query Fields
 DRIVE_THUMBNAIL_FIELDS = "thumbnailLink"
-DRIVE_FILE_FIELDS = "id, mimeType, webViewLink, shortcutDetails"
-DRIVE_TARGET_FIELDS = "id, mimeType"
+DRIVE_FILE_FIELDS = "id, name, mimeType, parents, trashed, shortcutDetails, thumbnailLink, modifiedTime, md5Checksum, size"
 
 # MIME Types
 MIME_SHORTCUT = "application/vnd.google-apps.shortcut"
@@ -116,6 +254,245 @@ MIME_IMAGE_PREFIX = "image/"
 os.environ["OAUTHLIB_INSECURE_TRANSPORT"] = "1"
 
 
+### - Response Compression & Static Caching - ###
+_static_hashes = {}
+
+def static_file_hash(filename):
+    """
+    Returns a short content hash for a file in static/, recomputed only when its mtime changes.
+    """
+    path = os.path.join(app.static_folder, filename)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+
+    cached = _static_hashes.get(filename)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    with open(path, "rb") as f:
+        digest = hashlib.md5(f.read()).hexdigest()[:12]
+    _static_hashes[filename] = (mtime, digest)
+    return digest
+
+
+@app.url_defaults
+def fingerprint_static_urls(endpoint, values):
+    # url_for('static', filename=...) becomes /static/<file>?v=<content hash>
+    if endpoint == "static" and "filename" in values and "v" not in values:
+        digest = static_file_hash(values["filename"])
+        if digest:
+            values["v"] = digest
+
+
+@app.after_request
+def cache_fingerprinted_static(response):
+    if request.endpoint == "static" and request.args.get("v") and response.status_code == 200:
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = STATIC_CACHE_SECONDS
+        response.cache_control.immutable = True
+    return response
+
+
+@app.after_request
+def compress_response(response):
+    """
+    Gzips (or Brotli-compresses, if the brotli package is installed) HTML and JSON bodies above COMPRESS_MIN_SIZE.
+    """
+    if (response.status_code != 200
+            or response.direct_passthrough
+            or response.is_streamed
+            or response.mimetype not in COMPRESS_MIMETYPES
+            or "Content-Encoding" in response.headers):
+        return response
+
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+
+    if brotli and request.accept_encodings["br"]:
+        encoding = "br"
+        data = brotli.compress(data, quality=BROTLI_QUALITY)
+    elif request.accept_encodings["gzip"]:
+        encoding = "gzip"
+        data = gzip.compress(data, compresslevel=GZIP_LEVEL)
+    else:
+        return response
+
+    response.set_data(data)
+    response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+### - Instrumentation - ###
+metrics = instrumentation.MetricsStore(METRICS_DB)
+metrics.register_exit_flush()
+
+
+def connect_db(path=DB_FILE):
+    # All catalog queries go through here so their time shows up as the "sqlite" segment
+    return sqlite3.connect(path, factory=instrumentation.TimedConnection)
+
+
+### - Google Client Libraries - ###
+# The Google auth and API client packages take a large share of the app's import time, and
+# scripts that only work on the catalog (perceptual_hash, bench) never call Google. So they are
+# imported on first use, and create_app() imports them up front for gunicorn's master to share.
+GOOGLE_CLIENT_MODULES = (
+    "google.oauth2.credentials",
+    "google.auth.transport.requests",
+    "google_auth_oauthlib.flow",
+    "googleapiclient.http",
+    "googleapiclient.discovery",
+)
+
+
+def warm_google_clients():
+    for module_name in GOOGLE_CLIENT_MODULES:
+        importlib.import_module(module_name)
+
+
+def load_credentials(info):
+    """OAuth credentials from the dict kept in the session."""
+    from google.oauth2.credentials import Credentials
+    return Credentials(**info)
+
+
+def oauth_flow(**kwargs):
+    from google_auth_oauthlib.flow import Flow
+    return Flow.from_client_config(client_config, scopes=OAUTH_SCOPES, redirect_uri=OAUTH_REDIRECT_URI, **kwargs)
+
+
+def drive_batch():
+    from googleapiclient.http import BatchHttpRequest
+    return BatchHttpRequest(batch_uri=DRIVE_BATCH_URI)
+
+
+def google_service(name, version, creds):
+    """Builds a Google API client, pointed at GOOGLE_API_BASE_URL when one is configured."""
+    from googleapiclient.discovery import build
+    client_options = None
+    if GOOGLE_API_BASE_URL:
+        service_path = GOOGLE_API_SERVICE_PATHS[name].format(version=version)
+        client_options = {"api_endpoint": f"{GOOGLE_API_BASE_URL}/{service_path}"}
+    return build(name, version, credentials=creds, client_options=client_options)
+
+
+drive_limiter = rate_limit.DriveRateLimiter(
+    rate=DRIVE_REQUESTS_PER_SECOND,
+    user_rate=DRIVE_USER_REQUESTS_PER_SECOND,
+    burst=DRIVE_BURST,
+    min_rate=DRIVE_MIN_REQUESTS_PER_SECOND,
+    max_rate=DRIVE_MAX_REQUESTS_PER_SECOND,
+    max_retries=DRIVE_MAX_RETRIES,
+    backoff_base=DRIVE_BACKOFF_BASE_SECONDS,
+    backoff_cap=DRIVE_BACKOFF_CAP_SECONDS,
+    on_wait=lambda seconds: add_timing("drive.throttle", seconds),
+)
+
+
+def drive_user():
+    # Quota bucket key: the signed-in user, if this call is made while serving a request
+    return session.get("email") if has_request_context() else None
+
+
+def drive_execute(google_request):
+    """
+    Executes a Google API request (or a BatchHttpRequest) under the Drive rate limiter,
+    retrying rate-limit and transient errors. Timed per API method, e.g. "drive.files.get"
+    or "drive.batch"; time spent waiting for the limiter shows up as "drive.throttle".
+    """
+    method = getattr(google_request, "methodId", None) or "drive.batch"
+    # Each request in a batch counts against the quota separately
+    cost = len(getattr(google_request, "_requests", None) or ()) or 1
+
+    def execute():
+        with timed(method):
+            return google_request.execute()
+
+    return drive_limiter.call(execute, user=drive_user(), cost=cost)
+
+
+def decode_tags(tags_json):
+    # Tags are stored as a JSON list; empty/NULL means no tags
+    if not tags_json:
+        return []
+    with timed("json"):
+        return codec.loads(tags_json)
+
+
+def decode_json(text):
+    with timed("json"):
+        return codec.loads(text)
+
+
+def decode_backup(data):
+    # Backups are JSON text or, with BACKUP_FORMAT=packed, compressed bytes
+    with timed("json"):
+        return codec.unpack(data)
+
+
+@app.before_request
+def start_request_timing():
+    instrumentation.begin_request()
+
+    rate = instrumentation.profile_sample_rate()
+    if rate > 0 and random.random() < rate:
+        request.environ["photo_tagger.profiler"] = cProfile.Profile()
+        request.environ["photo_tagger.profiler"].enable()
+
+
+@app.after_request
+def finish_request_timing(response):
+    timings = instrumentation.current_request()
+    if timings is None:
+        return response
+
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+
+    profiler = request.environ.pop("photo_tagger.profiler", None)
+    if profiler:
+        profiler.disable()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        safe_route = re.sub(r"[^a-zA-Z0-9]+", "_", route).strip("_") or "root"
+        profiler.dump_stats(os.path.join(PROFILE_DIR, f"{int(time.time() * 1000)}-{safe_route}.prof"))
+
+    response.headers["Server-Timing"] = instrumentation.server_timing_header(timings)
+    metrics.observe_request(route, request.method, response.status_code, timings)
+    return response
+
+
+@app.teardown_request
+def clear_request_timing(_exc):
+    instrumentation.clear_request()
+
+
+# Signal receivers: Flask passes the app positionally and template/context by keyword
+def _template_render_started(_sender, context, **_extra):
+    context["_render_started"] = time.perf_counter()
+
+
+def _template_render_finished(_sender, context, **_extra):
+    started = context.get("_render_started")
+    if started is not None:
+        add_timing("render", time.perf_counter() - started)
+
+
+before_render_template.connect(_template_render_started, app)
+template_rendered.connect(_template_render_finished, app)
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    """Prometheus text exposition of request/segment metrics from every worker."""
+    if not METRICS_PUBLIC and "credentials" not in session:
+        abort(401)
+    return app.response_class(metrics.render_prometheus(), mimetype="text/plain; version=0.0.4")
+
+
 ### - Database Functions - ###
 
 def save_backup(backup_name=None):
@@ -123,7 +500,7 @@ def save_backup(backup_name=None):
     Enhanced backup function that saves ALL data including current thumbnail status
     """
     # 1) Grab *all* rows from images, not just the first page
-    conn = sqlite3.connect(DB_FILE)
+    conn = connect_db()
     c = conn.cursor()
     c.execute("SELECT id, tags, thumbnail FROM images ORDER BY id")
     rows = c.fetchall()
@@ -131,15 +508,16 @@ def save_backup(backup_name=None):
 
     # 2) Build your backup list from every row - preserve current thumbnail state
     full_data = []
+    backup_timestamp = datetime.datetime.now().isoformat()
     for file_id, tags_json, thumb in rows:
         # Store the actual thumbnail URL or None if invalid
         valid_thumb = thumb if is_valid_thumbnail(thumb) else None
         
         full_data.append({
             "id": file_id,
-            "tags": json.loads(tags_json) if tags_json else [],
+            "tags": decode_tags(tags_json),
             "thumb_url": valid_thumb,
-            "backup_timestamp": datetime.datetime.now().isoformat()
+            "backup_timestamp": backup_timestamp
         })
 
     # 3) Store it as JSON in backups
@@ -149,10 +527,13 @@ def save_backup(backup_name=None):
     else:
         timestamp = datetime.datetime.now().isoformat(timespec="seconds")
 
-    conn = sqlite3.connect(DB_FILE)
+    conn = connect_db()
     c = conn.cursor()
+    with timed("json"):
+        backup_data = codec.pack(full_data) if BACKUP_FORMAT == "packed" else codec.dumps(full_data)
     c.execute("INSERT INTO backups (timestamp, data) VALUES (?, ?)",
-              (timestamp, json.dumps(full_data)))
+              (timestamp, backup_data))
+    bump_catalog_version(c)
     conn.commit()
     conn.close()
 
@@ -264,7 +645,7 @@ def force_refresh_backup_thumbnails(backup_id, creds):
     if not creds:
         return False, "No credentials available"
     
-    conn = sqlite3.connect(DB_FILE)
+    conn = connect_db()
     c = conn.cursor()
     
     # Get the backup data to know which files to refresh
@@ -275,7 +656,7 @@ def force_refresh_backup_thumbnails(backup_id, creds):
         return False, "Backup not found"
     
     try:
-        data = json.loads(row[0])
+        data = decode_backup(row[0])
         file_ids = [item.get("id") for item in data if item.get("id")]
     except Exception as e:
         conn.close()
@@ -286,19 +667,21 @@ def force_refresh_backup_thumbnails(backup_id, creds):
         return False, "No files found in backup"
     
     try:
-        service = build("drive", GOOGLE_DRIVE_API_VERSION, credentials=creds)
+        service = google_service("drive", GOOGLE_DRIVE_API_VERSION, creds)
         
         success_count = 0
         fail_count = 0
+        fetched_files = []
         
         # Process files individually for better error handling
         for file_id in file_ids:
             try:
-                file_metadata = service.files().get(
+                file_metadata = drive_execute(service.files().get(
                     fileId=file_id,
-                    fields=DRIVE_THUMBNAIL_FIELDS,
+                    fields=DRIVE_FILE_FIELDS,
                     supportsAllDrives=True
-                ).execute()
+                ))
+                fetched_files.append(file_metadata)
                 
                 new_thumbnail = file_metadata.get("thumbnailLink")
                 if new_thumbnail and is_valid_thumbnail(new_thumbnail):
@@ -309,16 +692,14 @@ def force_refresh_backup_thumbnails(backup_id, creds):
                     fail_count += 1
                     
             except Exception as e:
-                print(f"[force_refresh_backup_thumbnails] failed for {file_id}: {e}")
+                logger.debug("force_refresh_backup_thumbnails failed for %s: %s", file_id, e)
                 c.execute("UPDATE images SET thumbnail = ? WHERE id = ?", (DEFAULT_THUMBNAIL, file_id))
                 fail_count += 1
-            
-            # Small delay to avoid hitting rate limits
-            import time
-            time.sleep(0.1)
         
+        bump_catalog_version(c)
         conn.commit()
         conn.close()
+        remember_drive_files(fetched_files)
         
         return True, f"Processed {len(file_ids)} files: {success_count} successful, {fail_count} failed"
         
@@ -330,7 +711,7 @@ def load_backup(backup_id, creds=None, try_refresh_missing=True):
     """
     Enhanced backup loading with robust thumbnail handling
     """
-    conn = sqlite3.connect(DB_FILE)
+    conn = connect_db()
     c = conn.cursor()
 
     c.execute("SELECT data FROM backups WHERE id = ?", (backup_id,))
@@ -340,14 +721,20 @@ def load_backup(backup_id, creds=None, try_refresh_missing=True):
         return False, "Backup not found"
 
     try:
-        data = json.loads(row[0])
+        data = decode_backup(row[0])
     except Exception as e:
-        print(f"[load_backup] malformed backup JSON for id {backup_id}: {e}")
+        logger.error("load_backup: malformed backup JSON for id %s: %s", backup_id, e)
         conn.close()
         return False, f"Backup data corrupted: {str(e)}"
 
     restored_count = 0
     thumbnail_refresh_needed = []
+
+    # Current rows in one query; the writes go out in two executemany() calls
+    c.execute("SELECT id, tags, thumbnail FROM images")
+    current = {file_id: (tags_json, thumb) for file_id, tags_json, thumb in c.fetchall()}
+    updates = []
+    inserts = []
     
     # Process each item in the backup
     for item in data:
@@ -355,12 +742,11 @@ def load_backup(backup_id, creds=None, try_refresh_missing=True):
         if not file_id:
             continue
             
-        backup_tags = item.get("tags", [])
+        backup_tags_json = codec.dumps(item.get("tags", []))
         backup_thumb = item.get("thumb_url")
 
         # Check if this file already exists in current database
-        c.execute("SELECT tags, thumbnail FROM images WHERE id = ?", (file_id,))
-        existing = c.fetchone()
+        existing = current.get(file_id)
 
         # Determine the best thumbnail to use
         chosen_thumb = None
@@ -378,11 +764,9 @@ def load_backup(backup_id, creds=None, try_refresh_missing=True):
                 chosen_thumb = None
                 needs_refresh = True
             
-            # Update with backup tags (restore backup state)
-            c.execute(
-                "UPDATE images SET tags = ?, thumbnail = ? WHERE id = ?",
-                (json.dumps(backup_tags), chosen_thumb, file_id)
-            )
+            # Update with backup tags (restore backup state); rows already matching it are left alone
+            if (backup_tags_json, chosen_thumb) != existing:
+                updates.append((backup_tags_json, chosen_thumb, file_id))
             
         else:
             # New file from backup
@@ -391,11 +775,10 @@ def load_backup(backup_id, creds=None, try_refresh_missing=True):
             else:
                 chosen_thumb = None
                 needs_refresh = True
-                
-            c.execute(
-                "INSERT INTO images (id, tags, thumbnail) VALUES (?, ?, ?)",
-                (file_id, json.dumps(backup_tags), chosen_thumb)
-            )
+
+            inserts.append((file_id, backup_tags_json, chosen_thumb))
+            # A backup listing the same ID twice restores its last entry
+            current[file_id] = (backup_tags_json, chosen_thumb)
         
         restored_count += 1
         
@@ -403,6 +786,10 @@ def load_backup(backup_id, creds=None, try_refresh_missing=True):
         if needs_refresh:
             thumbnail_refresh_needed.append(file_id)
 
+    c.executemany("INSERT INTO images (id, tags, thumbnail) VALUES (?, ?, ?)", inserts)
+    c.executemany("UPDATE images SET tags = ?, thumbnail = ? WHERE id = ?", updates)
+
+    bump_catalog_version(c)
     conn.commit()
 
     # Attempt to refresh thumbnails for files that need it
@@ -410,24 +797,26 @@ def load_backup(backup_id, creds=None, try_refresh_missing=True):
     failed_count = len(thumbnail_refresh_needed)
     
     if thumbnail_refresh_needed and try_refresh_missing and creds:
-        print(f"[load_backup] refreshing thumbnails for {len(thumbnail_refresh_needed)} items...")
+        logger.info("load_backup: refreshing thumbnails for %d items", len(thumbnail_refresh_needed))
         
         try:
-            service = build("drive", GOOGLE_DRIVE_API_VERSION, credentials=creds)
+            service = google_service("drive", GOOGLE_DRIVE_API_VERSION, creds)
             
             # Process in smaller batches to avoid timeouts
             batch_size = 20
             for i in range(0, len(thumbnail_refresh_needed), batch_size):
                 batch_files = thumbnail_refresh_needed[i:i + batch_size]
+                fetched_files = []
                 
                 # Use individual requests for better error handling
                 for file_id in batch_files:
                     try:
-                        file_metadata = service.files().get(
+                        file_metadata = drive_execute(service.files().get(
                             fileId=file_id,
-                            fields=DRIVE_THUMBNAIL_FIELDS,
+                            fields=DRIVE_FILE_FIELDS,
                             supportsAllDrives=True
-                        ).execute()
+                        ))
+                        fetched_files.append(file_metadata)
                         
                         new_thumbnail = file_metadata.get("thumbnailLink")
                         if new_thumbnail and is_valid_thumbnail(new_thumbnail):
@@ -439,21 +828,20 @@ def load_backup(backup_id, creds=None, try_refresh_missing=True):
                             c.execute("UPDATE images SET thumbnail = ? WHERE id = ?", (DEFAULT_THUMBNAIL, file_id))
                             
                     except Exception as e:
-                        print(f"[load_backup] thumbnail refresh failed for {file_id}: {e}")
+                        logger.debug("load_backup: thumbnail refresh failed for %s: %s", file_id, e)
                         # Set to default placeholder on error
                         c.execute("UPDATE images SET thumbnail = ? WHERE id = ?", (DEFAULT_THUMBNAIL, file_id))
                 
+                bump_catalog_version(c)
                 conn.commit()
-                
-                # Small delay between batches
-                import time
-                time.sleep(0.5)
+                remember_drive_files(fetched_files)
                         
-        except Exception as e:
-            print(f"[load_backup] batch thumbnail refresh error: {e}")
+        except Exception:
+            logger.exception("load_backup: batch thumbnail refresh error")
             # Set all remaining files to default placeholder
             for file_id in thumbnail_refresh_needed:
                 c.execute("UPDATE images SET thumbnail = ? WHERE id = ?", (DEFAULT_THUMBNAIL, file_id))
+            bump_catalog_version(c)
             conn.commit()
 
     conn.close()
@@ -468,8 +856,112 @@ def load_backup(backup_id, creds=None, try_refresh_missing=True):
     success_message = ", ".join(message_parts)
     return True, success_message
 
+def get_catalog_version():
+    """
+    Returns the current catalog version. Every write to images or backups bumps it,
+    so it can be used as a cheap validator (ETag) for anything derived from the catalog.
+    """
+    conn = connect_db()
+    c = conn.cursor()
+    c.execute("SELECT value FROM catalog_meta WHERE key = 'version'")
+    row = c.fetchone()
+    conn.close()
+    return row[0] if row else 0
+
+def request_catalog_version():
+    """
+    The catalog version as this request last saw it, read once per request rather than once per
+    fragment. Writes made by the request itself drop the memo (see bump_catalog_version); writes
+    by other workers only show on the next request, which is safe for anything keyed on it.
+    """
+    if not has_request_context():
+        return get_catalog_version()
+    if "catalog_version" not in g:
+        g.catalog_version = get_catalog_version()
+    return g.catalog_version
+
+def bump_catalog_version(c):
+    # Runs inside the caller's transaction so the bump commits together with the write.
+    c.execute("UPDATE catalog_meta SET value = value + 1 WHERE key = 'version'")
+    if has_request_context():
+        g.pop("catalog_version", None)
+
+# Distinct string tags of one images row ({row} is NEW or OLD inside a trigger), and every ordered pair of them
+TAG_STATS_TAGS = "SELECT DISTINCT value AS tag FROM json_each(CASE WHEN json_valid({row}.tags) THEN {row}.tags END) WHERE type = 'text'"
+TAG_STATS_PAIRS = "SELECT a.tag, b.tag AS other FROM ({tags}) a, ({tags}) b WHERE a.tag <> b.tag"
+# catalog_meta key that pauses the update trigger for the rest of a transaction (see recount_tag_stats)
+TAG_STATS_DEFERRED_KEY = "tag_stats_deferred"
+
+
+def tag_stats_statements(row, delta):
+    """Trigger statements that add (delta=1) or remove (delta=-1) the tags of NEW/OLD to tag_counts and tag_pairs."""
+    tags = TAG_STATS_TAGS.format(row=row)
+    pairs = TAG_STATS_PAIRS.format(tags=tags)
+    if delta > 0:
+        return [
+            f"INSERT INTO tag_counts (tag, count) SELECT tag, 1 FROM ({tags}) WHERE true "
+            "ON CONFLICT(tag) DO UPDATE SET count = count + 1",
+            f"INSERT INTO tag_pairs (tag, other, count) SELECT tag, other, 1 FROM ({pairs}) WHERE true "
+            "ON CONFLICT(tag, other) DO UPDATE SET count = count + 1",
+        ]
+    return [
+        f"UPDATE tag_counts SET count = count - 1 WHERE tag IN ({tags})",
+        f"DELETE FROM tag_counts WHERE count <= 0 AND tag IN ({tags})",
+        f"UPDATE tag_pairs SET count = count - 1 WHERE (tag, other) IN ({pairs})",
+        f"DELETE FROM tag_pairs WHERE count <= 0 AND (tag, other) IN ({pairs})",
+    ]
+
+
+def rebuild_tag_stats(c):
+    """Recounts tag_counts, tag_pairs and the image count from scratch, in the caller's transaction."""
+    valid_tags = "json_each(CASE WHEN json_valid(i.tags) THEN i.tags END)"
+    c.execute("DELETE FROM tag_counts")
+    c.execute("DELETE FROM tag_pairs")
+    c.execute(f"""
+        INSERT INTO tag_counts (tag, count)
+        SELECT t.value, COUNT(DISTINCT i.id) FROM images i, {valid_tags} t
+        WHERE t.type = 'text' GROUP BY t.value
+    """)
+    c.execute(f"""
+        INSERT INTO tag_pairs (tag, other, count)
+        SELECT a.value, b.value, COUNT(DISTINCT i.id) FROM images i, {valid_tags} a, {valid_tags} b
+        WHERE a.type = 'text' AND b.type = 'text' AND a.value <> b.value GROUP BY a.value, b.value
+    """)
+    c.execute("INSERT OR REPLACE INTO catalog_meta (key, value) VALUES ('image_count', (SELECT COUNT(*) FROM images))")
+
+
+def defer_tag_stats(c):
+    """Stops the update trigger maintaining tag_counts and tag_pairs until recount_tag_stats, in the caller's transaction."""
+    c.execute("INSERT OR REPLACE INTO catalog_meta (key, value) VALUES (?, 1)", (TAG_STATS_DEFERRED_KEY,))
+
+
+def recount_tag_stats(c, tags):
+    """
+    Recounts tag_counts and tag_pairs for just these tags (their pairs in both orders) and resumes
+    the update trigger. For bulk updates that only add or remove these tags: recounting them from
+    the images that carry them is much cheaper than the trigger redoing every pair of every row.
+    """
+    marks = ", ".join("?" * len(tags))
+    valid_tags = "json_each(CASE WHEN json_valid(i.tags) THEN i.tags END)"
+    c.execute("DELETE FROM catalog_meta WHERE key = ?", (TAG_STATS_DEFERRED_KEY,))
+    c.execute(f"DELETE FROM tag_counts WHERE tag IN ({marks})", tags)
+    c.execute(f"DELETE FROM tag_pairs WHERE tag IN ({marks}) OR other IN ({marks})", tags * 2)
+    c.execute(f"""
+        INSERT INTO tag_counts (tag, count)
+        SELECT tag, COUNT(*) FROM image_tags WHERE tag IN ({marks}) GROUP BY tag
+    """, tags)
+    c.execute(f"""
+        INSERT INTO tag_pairs (tag, other, count)
+        SELECT a.value, b.value, COUNT(DISTINCT i.id) FROM images i, {valid_tags} a, {valid_tags} b
+        WHERE i.id IN (SELECT image_id FROM image_tags WHERE tag IN ({marks}))
+          AND a.type = 'text' AND b.type = 'text' AND a.value <> b.value
+          AND (a.value IN ({marks}) OR b.value IN ({marks}))
+        GROUP BY a.value, b.value
+    """, tags * 3)
+
+
 def list_backups():
-    conn = sqlite3.connect(DB_FILE)
+    conn = connect_db()
     c = conn.cursor()
     c.execute("SELECT id, timestamp FROM backups ORDER BY id DESC")
     backups = c.fetchall()
@@ -480,7 +972,7 @@ def init_db():
     # Ensure data directory exists
     os.makedirs(os.path.dirname(DB_FILE), exist_ok=True)
     
-    conn = sqlite3.connect(DB_FILE)
+    conn = connect_db()
     c = conn.cursor()
 
     # Create images table with id, tags, and thumbnail (only once)
@@ -501,13 +993,254 @@ def init_db():
         )
     """)
 
+    # Create catalog_meta table (holds the catalog version counter)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS catalog_meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER
+        )
+    """)
+    c.execute("INSERT OR IGNORE INTO catalog_meta (key, value) VALUES ('version', 0)")
+
+    # Create thumbnail_refresh_locks table (which request is fetching which thumbnail from Drive)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS thumbnail_refresh_locks (
+            file_id TEXT PRIMARY KEY,
+            owner TEXT,
+            expires_at REAL
+        )
+    """)
+
+    # Create drive_files table (Drive metadata cache; children_fetched_at is set on folders that were listed)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS drive_files (
+            id TEXT PRIMARY KEY,
+            name TEXT,
+            mime_type TEXT,
+            parent_id TEXT,
+            trashed INTEGER,
+            shortcut_target TEXT,
+            thumbnail TEXT,
+            modified_time TEXT,
+            md5_checksum TEXT,
+            size INTEGER,
+            fetched_at REAL,
+            children_fetched_at REAL
+        )
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_drive_files_parent ON drive_files (parent_id)")
+
+    # Columns added to drive_files after it was first released
+    c.execute("PRAGMA table_info(drive_files)")
+    drive_file_columns = {row[1] for row in c.fetchall()}
+    for column, column_type in (("modified_time", "TEXT"), ("md5_checksum", "TEXT"), ("size", "INTEGER")):
+        if column not in drive_file_columns:
+            c.execute(f"ALTER TABLE drive_files ADD COLUMN {column} {column_type}")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_drive_files_content ON drive_files (md5_checksum, size)")
+
+    # Create image_aliases table (other Drive file IDs of a photo in the catalog, see DEDUP_IMPORTS)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS image_aliases (
+            alias_id TEXT PRIMARY KEY,
+            canonical_id TEXT
+        )
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_image_aliases_canonical ON image_aliases (canonical_id)")
+
+    # Create ingest_jobs table (progress of background folder imports)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS ingest_jobs (
+            id TEXT PRIMARY KEY,
+            folder_id TEXT,
+            status TEXT,
+            discovered INTEGER,
+            saved INTEGER,
+            failed INTEGER,
+            crawl_seconds REAL,
+            thumbnail_seconds REAL,
+            save_seconds REAL,
+            error TEXT,
+            started_at REAL,
+            updated_at REAL,
+            finished_at REAL
+        )
+    """)
+
+    # Create folders table (watched folders: their tags and the state of their last sync)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS folders (
+            id TEXT PRIMARY KEY,
+            tags TEXT,
+            added_at TEXT,
+            synced_through TEXT,
+            last_synced_at REAL,
+            last_sync_result TEXT,
+            sync_claimed_until REAL
+        )
+    """)
+
+    # Create folder_sync_marks table (modifiedTime of each folder in a watched tree as of its last sync)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS folder_sync_marks (
+            root_id TEXT,
+            folder_id TEXT,
+            modified_time TEXT,
+            PRIMARY KEY (root_id, folder_id)
+        )
+    """)
+
+    # Create tag_counts and tag_pairs tables (how many images carry each tag and each pair of tags, in
+    # both orders). Triggers on images keep them current through every write path.
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS tag_counts (
+            tag TEXT PRIMARY KEY,
+            count INTEGER
+        )
+    """)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS tag_pairs (
+            tag TEXT,
+            other TEXT,
+            count INTEGER,
+            PRIMARY KEY (tag, other)
+        )
+    """)
+    image_count_change = "UPDATE catalog_meta SET value = value {} 1 WHERE key = 'image_count';"
+    c.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS images_tag_stats_insert AFTER INSERT ON images BEGIN
+            {"; ".join(tag_stats_statements("NEW", 1))};
+            {image_count_change.format("+")}
+        END
+    """)
+    c.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS images_tag_stats_delete AFTER DELETE ON images BEGIN
+            {"; ".join(tag_stats_statements("OLD", -1))};
+            {image_count_change.format("-")}
+        END
+    """)
+    # Recreated every start, so catalogs from before the deferral check pick it up
+    c.execute("DROP TRIGGER IF EXISTS images_tag_stats_update")
+    c.execute(f"""
+        CREATE TRIGGER images_tag_stats_update AFTER UPDATE OF tags ON images
+        WHEN OLD.tags IS NOT NEW.tags
+            AND NOT EXISTS (SELECT 1 FROM catalog_meta WHERE key = '{TAG_STATS_DEFERRED_KEY}') BEGIN
+            {"; ".join(tag_stats_statements("OLD", -1) + tag_stats_statements("NEW", 1))};
+        END
+    """)
+    # Catalogs from before the triggers existed are counted once
+    c.execute("SELECT 1 FROM catalog_meta WHERE key = 'image_count'")
+    if c.fetchone() is None:
+        rebuild_tag_stats(c)
+
+    # Create image_tags table (inverted index: the photos carrying each tag, for search)
+    c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'image_tags'")
+    image_tags_existed = c.fetchone() is not None
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS image_tags (
+            tag TEXT,
+            image_id TEXT,
+            PRIMARY KEY (tag, image_id)
+        ) WITHOUT ROWID
+    """)
+    add_postings = "INSERT OR IGNORE INTO image_tags (tag, image_id) SELECT tag, NEW.id FROM ({}) WHERE true;".format(
+        TAG_STATS_TAGS.format(row="NEW"))
+    remove_postings = "DELETE FROM image_tags WHERE image_id = OLD.id AND tag IN ({});".format(
+        TAG_STATS_TAGS.format(row="OLD"))
+    c.execute(f"CREATE TRIGGER IF NOT EXISTS images_tag_index_insert AFTER INSERT ON images BEGIN {add_postings} END")
+    c.execute(f"CREATE TRIGGER IF NOT EXISTS images_tag_index_delete AFTER DELETE ON images BEGIN {remove_postings} END")
+    c.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS images_tag_index_update AFTER UPDATE OF tags ON images
+        WHEN OLD.tags IS NOT NEW.tags BEGIN {remove_postings} {add_postings} END
+    """)
+    # Create image_tag_changes table (every tag change on images, so worker-local tag indexes can catch up)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS image_tag_changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            image_id TEXT,
+            deleted INTEGER,
+            old_tags TEXT,
+            new_tags TEXT
+        )
+    """)
+    c.execute("""
+        CREATE TRIGGER IF NOT EXISTS images_tag_changes_insert AFTER INSERT ON images BEGIN
+            INSERT INTO image_tag_changes (image_id, deleted, old_tags, new_tags) VALUES (NEW.id, 0, NULL, NEW.tags);
+        END
+    """)
+    c.execute("""
+        CREATE TRIGGER IF NOT EXISTS images_tag_changes_delete AFTER DELETE ON images BEGIN
+            INSERT INTO image_tag_changes (image_id, deleted, old_tags, new_tags) VALUES (OLD.id, 1, OLD.tags, NULL);
+        END
+    """)
+    c.execute("""
+        CREATE TRIGGER IF NOT EXISTS images_tag_changes_update AFTER UPDATE OF tags ON images
+        WHEN OLD.tags IS NOT NEW.tags BEGIN
+            INSERT INTO image_tag_changes (image_id, deleted, old_tags, new_tags) VALUES (NEW.id, 0, OLD.tags, NEW.tags);
+        END
+    """)
+
+    if not image_tags_existed:
+        c.execute("""
+            INSERT OR IGNORE INTO image_tags (tag, image_id)
+            SELECT t.value, i.id FROM images i, json_each(CASE WHEN json_valid(i.tags) THEN i.tags END) t
+            WHERE t.type = 'text'
+        """)
+
+    # Create image_hashes table (perceptual hashes as 16-digit hex; NULL when the thumbnail couldn't be decoded)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS image_hashes (
+            id TEXT PRIMARY KEY,
+            dhash TEXT,
+            phash TEXT,
+            computed_at REAL
+        )
+    """)
+
     conn.commit()
     conn.close()
 
+    init_fragment_cache()
+
+
+class ImageRecord:
+    """
+    One photo on a page of the grid or the API. Tags stay as the stored JSON until something
+    reads .tags, so rows whose tags are never shown are never decoded. Templates use the
+    attributes directly (item.id, item.tags, item.thumb_url).
+    """
+
+    __slots__ = ("id", "thumb_url", "_tags_json", "_tags")
+
+    def __init__(self, image_id, tags_json, thumb_url):
+        self.id = image_id
+        self.thumb_url = thumb_url
+        self._tags_json = tags_json
+        self._tags = None
+
+    @property
+    def tags(self):
+        if self._tags is None:
+            self._tags = decode_tags(self._tags_json)
+        return self._tags
+
+    def to_dict(self, fields=API_IMAGE_FIELDS):
+        return {field: getattr(self, field) for field in fields}
+
+
+def reset_default_thumbnails(c, file_ids):
+    """
+    Points file_ids at DEFAULT_THUMBNAIL. Only rows that change are written and only then is
+    the catalog version bumped, so viewing a page that is already up to date keeps every ETag.
+    """
+    c.executemany("UPDATE images SET thumbnail = ? WHERE id = ? AND thumbnail IS NOT ?",
+                  [(DEFAULT_THUMBNAIL, file_id, DEFAULT_THUMBNAIL) for file_id in file_ids])
+    if c.rowcount > 0:
+        bump_catalog_version(c)
+
 
 def load_data(page=DEFAULT_PAGE, per_page=ITEMS_PER_PAGE):
     offset = (page - 1) * per_page
-    conn = sqlite3.connect(DB_FILE)
+    conn = connect_db()
     c = conn.cursor()
 
     c.execute("""
@@ -526,87 +1259,41 @@ def load_data(page=DEFAULT_PAGE, per_page=ITEMS_PER_PAGE):
         if not thumb or is_expired_thumbnail(thumb):
             expired_files[file_id] = tag_str
         else:
-            data.append({
-                "id": file_id,
-                "tags": json.loads(tag_str),
-                "thumb_url": thumb
-            })
+            data.append(ImageRecord(file_id, tag_str, thumb))
 
     # Only attempt to refresh thumbnails if we have expired files AND credentials
     if expired_files and "credentials" in session:
-        creds = Credentials(**session["credentials"])
-        service = build("drive", GOOGLE_DRIVE_API_VERSION, credentials=creds)
+        creds = load_credentials(session["credentials"])
         
-        # First, clear all expired thumbnails from database
+        # First, clear all expired thumbnails from database (the placeholder is left for the refresh to replace)
         expired_ids = list(expired_files.keys())
         placeholders = ','.join(['?' for _ in expired_ids])
-        c.execute(f"UPDATE images SET thumbnail = NULL WHERE id IN ({placeholders})", expired_ids)
+        c.execute(f"UPDATE images SET thumbnail = NULL WHERE id IN ({placeholders}) AND thumbnail <> ?",
+                  expired_ids + [DEFAULT_THUMBNAIL])
+        if c.rowcount > 0:
+            bump_catalog_version(c)
         conn.commit()
-        
-        batch = BatchHttpRequest(batch_uri='https://www.googleapis.com/batch/drive/v3')
-        refreshed_thumbnails = {}
-
-        def callback(request_id, response, exception):
-            if exception:
-                print(f"Thumbnail fetch failed for {request_id}: {exception}")
-                refreshed_thumbnails[request_id] = DEFAULT_THUMBNAIL
-                return
-            
-            new_thumbnail = response.get("thumbnailLink")
-            if new_thumbnail and is_valid_thumbnail(new_thumbnail):
-                refreshed_thumbnails[request_id] = new_thumbnail
-            else:
-                refreshed_thumbnails[request_id] = DEFAULT_THUMBNAIL
-
-        for file_id in expired_files.keys():
-            batch.add(
-                service.files().get(
-                    fileId=file_id,
-                    fields=DRIVE_THUMBNAIL_FIELDS,
-                    supportsAllDrives=True
-                ),
-                request_id=file_id,
-                callback=callback
-            )
 
         try:
-            batch.execute()  # Execute the batch request
+            # Fetches (or waits on another request's fetch of) each thumbnail and saves it
+            refreshed_thumbnails = refresh_thumbnails_single_flight(expired_ids, creds)
             
-            # After batch finishes, update DB with completely new thumbnails
             for file_id, tag_str in expired_files.items():
-                new_thumb_url = refreshed_thumbnails.get(file_id, DEFAULT_THUMBNAIL)
-                
-                # Add the item to data with refreshed thumbnail
-                data.append({
-                    "id": file_id,
-                    "tags": json.loads(tag_str),
-                    "thumb_url": new_thumb_url
-                })
-                
-                # Update the database with the completely new thumbnail
-                c.execute("UPDATE images SET thumbnail = ? WHERE id = ?", (new_thumb_url, file_id))
+                data.append(ImageRecord(file_id, tag_str, refreshed_thumbnails.get(file_id, DEFAULT_THUMBNAIL)))
                 
         except Exception as e:
-            print(f"Batch execution failed: {e}")
+            logger.warning("Thumbnail batch execution failed: %s", e)
             # Fallback: add expired files with default thumbnail and clear DB thumbnails
             for file_id, tag_str in expired_files.items():
-                data.append({
-                    "id": file_id,
-                    "tags": json.loads(tag_str),
-                    "thumb_url": DEFAULT_THUMBNAIL
-                })
-                # Set to DEFAULT_THUMBNAIL instead of leaving null
-                c.execute("UPDATE images SET thumbnail = ? WHERE id = ?", (DEFAULT_THUMBNAIL, file_id))
+                data.append(ImageRecord(file_id, tag_str, DEFAULT_THUMBNAIL))
+            # Set to DEFAULT_THUMBNAIL instead of leaving null
+            reset_default_thumbnails(c, expired_files)
     else:
         # If no credentials or no expired files, add expired files with default thumbnail
         for file_id, tag_str in expired_files.items():
-            data.append({
-                "id": file_id,
-                "tags": json.loads(tag_str),
-                "thumb_url": DEFAULT_THUMBNAIL
-            })
-            # Clear the expired thumbnail from database
-            c.execute("UPDATE images SET thumbnail = ? WHERE id = ?", (DEFAULT_THUMBNAIL, file_id))
+            data.append(ImageRecord(file_id, tag_str, DEFAULT_THUMBNAIL))
+        # Clear the expired thumbnail from database
+        reset_default_thumbnails(c, expired_files)
 
     conn.commit()
     conn.close()
@@ -615,7 +1302,7 @@ def load_data(page=DEFAULT_PAGE, per_page=ITEMS_PER_PAGE):
 
 # def load_data(page=DEFAULT_PAGE, per_page=ITEMS_PER_PAGE):
 #     offset = (page - 1) * per_page
-#     conn = sqlite3.connect(DB_FILE)
+#     conn = connect_db()
 #     c = conn.cursor()
 
 #     c.execute("""
@@ -641,124 +1328,1247 @@ def load_data(page=DEFAULT_PAGE, per_page=ITEMS_PER_PAGE):
 
 
 def save_item(item_id, tags):
-    # Attempt to get thumbnailLink from Google Drive (once per image)
-    thumb = None
-    if "credentials" in session:
-        creds = Credentials(**session["credentials"])
-        service = build("drive", GOOGLE_DRIVE_API_VERSION, credentials=creds)
-        try:
-            meta = service.files().get(
-                fileId=item_id,
-                fields=DRIVE_THUMBNAIL_FIELDS,
-                supportsAllDrives=True
-            ).execute()
-            thumb = meta.get("thumbnailLink")
-        except Exception as e:
-            print(f"Thumbnail fetch failed for {item_id}: {e}")
-
-    conn = sqlite3.connect(DB_FILE)
+    """
+    Writes the tag list for an image as a pure local upsert.
+    Only the tags column is touched, so an existing cached thumbnail is kept as-is.
+    New rows start with no thumbnail; load_data() fetches it lazily (in a batch)
+    the first time the image is displayed.
+    """
+    conn = connect_db()
     c = conn.cursor()
 
-    tags_json = json.dumps(tags)
+    tags_json = codec.dumps(tags)
     c.execute("""
-        INSERT OR REPLACE INTO images (id, tags, thumbnail)
-        VALUES (?, ?, ?)
-    """, (item_id, tags_json, thumb))
+        INSERT INTO images (id, tags, thumbnail)
+        VALUES (?, ?, NULL)
+        ON CONFLICT(id) DO UPDATE SET tags = excluded.tags
+    """, (item_id, tags_json))
 
+    bump_catalog_version(c)
     conn.commit()
     conn.close()
 
 
 def delete_item(item_id):
     # Opens a connection to the database to remove a specific record.
-    conn = sqlite3.connect(DB_FILE)
+    conn = connect_db()
     c = conn.cursor()
 
     # Deletes the image row with the matching ID from the "images" table.
     c.execute("DELETE FROM images WHERE id = ?", (item_id,))
+    c.execute("DELETE FROM image_aliases WHERE canonical_id = ?", (item_id,))
+    c.execute("DELETE FROM image_hashes WHERE id = ?", (item_id,))
 
     # Commits the changes, then closes the connection.
+    bump_catalog_version(c)
     conn.commit()
     conn.close()
 
 
-### - Folder Checker - ###
-def list_images_in_folder(folder_id, creds):
-    # Creates a Google Drive API service instance using the provided credentials.
-    service = googleapiclient.discovery.build("drive", GOOGLE_DRIVE_API_VERSION, credentials=creds)
+def add_tags(item_id, tags_to_add):
+    """
+    Appends tags to an existing image (skipping ones it already has).
+    Returns the updated tag list, or None if the image is not in the catalog.
+    """
+    conn = connect_db()
+    c = conn.cursor()
+    c.execute("SELECT tags FROM images WHERE id = ?", (item_id,))
+    result = c.fetchone()
+    conn.close()
 
-    # Defines a query to retrieve all non-trashed files and folders that are direct children of the specified folder ID.
-    query = "'" + folder_id + "' in parents and trashed = false"
+    if not result:
+        return None
 
-    # Executes the query, asking for essential fields and supporting shared drives (if enabled).
-    results = service.files().list(
-        q=query,
-        fields=f"files({DRIVE_FILE_FIELDS})",
-        supportsAllDrives=True,
-        includeItemsFromAllDrives=True
-    ).execute()
+    current_tags = decode_tags(result[0])
+    for tag in tags_to_add:
+        if tag not in current_tags:
+            current_tags.append(tag)
+    save_item(item_id, current_tags)
+    return current_tags
 
-    # Retrieves the list of files and folders from the results dictionary.
-    files = results.get("files", [])
 
-    # Initializes an empty list to hold image IDs found in this folder and any subfolders.
-    image_links = []
+def remove_tag(item_id, tag):
+    """
+    Removes one tag from an image.
+    Returns the updated tag list, or None if the image is not in the catalog.
+    """
+    conn = connect_db()
+    c = conn.cursor()
+    c.execute("SELECT tags FROM images WHERE id = ?", (item_id,))
+    result = c.fetchone()
+    conn.close()
 
-    # Iterates through each item in the folder to determine its type and decide how to process it.
-    for f in files:
-        file_id = f.get("id")
-        mime = f.get("mimeType")
+    if not result:
+        return None
 
-        # Checks if the file is a shortcut to another file.
-        if mime == MIME_SHORTCUT:
-            target_id = f.get("shortcutDetails", {}).get("targetId")
+    current_tags = decode_tags(result[0])
+    if tag in current_tags:
+        current_tags.remove(tag)
+        save_item(item_id, current_tags)
+    return current_tags
 
-            # Attempts to resolve the shortcut to its target and include if it's an image.
-            if target_id:
-                try:
-                    target = service.files().get(
-                        fileId=target_id,
-                        fields=DRIVE_TARGET_FIELDS,
-                        supportsAllDrives=True
-                    ).execute()
-                except Exception:
-                    continue
 
-                target_mime = target.get("mimeType")
+def count_tags(tags=None):
+    """
+    Returns {tag: number of images carrying it}, for the given tags or for every tag.
+    """
+    conn = connect_db()
+    c = conn.cursor()
+    if tags is None:
+        c.execute("SELECT tag, count FROM tag_counts")
+        counts = dict(c.fetchall())
+    else:
+        tags = list(set(tags))
+        counts = dict.fromkeys(tags, 0)
+        c.execute(f"SELECT tag, count FROM tag_counts WHERE tag IN ({','.join('?' for _ in tags)})", tags)
+        counts.update(c.fetchall())
+    conn.close()
+    return counts
 
-                if target_mime and target_mime.startswith(MIME_IMAGE_PREFIX):
-                    image_links.append(target.get("id"))
 
-        # Adds the file directly if it is an image (e.g., JPEG, PNG).
-        elif mime and mime.startswith(MIME_IMAGE_PREFIX):
-            image_links.append(f.get("id"))
+def related_tags(tag, limit=RELATED_TAGS_LIMIT, min_count=RELATED_TAGS_MIN_COUNT, rank="pmi"):
+    """
+    The tags that most often appear together with `tag`, as [{"tag", "count", "lift", "pmi"}].
+    lift is how many times more often the pair occurs than if the tags were independent, and
+    pmi is its log2, so both rank the same way; rank="count" ranks by co-occurrences instead.
+    Pairs seen fewer than min_count times are left out, since one shared image gives a rare
+    tag a huge lift.
+    """
+    conn = connect_db()
+    c = conn.cursor()
+    c.execute("SELECT value FROM catalog_meta WHERE key = 'image_count'")
+    total = c.fetchone()[0]
+    c.execute("SELECT count FROM tag_counts WHERE tag = ?", (tag,))
+    row = c.fetchone()
+    if row is None:
+        conn.close()
+        return []
+    tag_count = row[0]
+    c.execute("""
+        SELECT p.other, p.count, t.count FROM tag_pairs p JOIN tag_counts t ON t.tag = p.other
+        WHERE p.tag = ? AND p.count >= ?
+    """, (tag, min_count))
+    related = []
+    for other, count, other_count in c.fetchall():
+        lift = count * total / (tag_count * other_count)
+        related.append({"tag": other, "count": count, "lift": round(lift, 3), "pmi": round(math.log2(lift), 3)})
+    conn.close()
 
-        # Recursively processes folders by calling this function again with the subfolder's ID.
-        elif mime == MIME_FOLDER:
-            image_links.extend(list_images_in_folder(file_id, creds))
+    sort_key = (lambda r: (-r["count"], -r["lift"], r["tag"])) if rank == "count" else (lambda r: (-r["lift"], -r["count"], r["tag"]))
+    related.sort(key=sort_key)
+    return related[:limit]
 
-    # Returns a flat list containing all image IDs collected from this folder and its children.
-    return image_links
 
+### - Drive Metadata Cache - ###
+# Drive file metadata (name, type, parent, shortcut target) saved in drive_files, so repeat
+# imports of overlapping folders and repeat shortcut lookups skip most Drive calls. Entries
+# are revalidated once they are older than the TTL. Folders remember when their children
+# were last listed; a listing replaces the folder's cached children.
+DRIVE_FILE_COLUMNS = (
+    "id, name, mime_type, parent_id, trashed, shortcut_target, thumbnail, modified_time, md5_checksum, size, fetched_at"
+)
 
-### - Google Authentication - ###
-@app.route("/authorize")
-def authorize():
 
-    # Initializes an OAuth flow from the client_config dictionary.
-    flow = Flow.from_client_config(
-        client_config,
-        scopes=OAUTH_SCOPES,
-        redirect_uri=OAUTH_REDIRECT_URI
+def drive_file_row(f, fetched_at):
+    parents = f.get("parents") or [None]
+    return (
+        f["id"], f.get("name"), f.get("mimeType"), parents[0], int(bool(f.get("trashed"))),
+        (f.get("shortcutDetails") or {}).get("targetId"), f.get("thumbnailLink"), f.get("modifiedTime"),
+        f.get("md5Checksum"), int(f["size"]) if f.get("size") else None, fetched_at
     )
 
-    # Generates an authorization URL that users will visit to grant access and return a state token.
-    auth_url, state = flow.authorization_url(access_type="offline", include_granted_scopes="true", prompt="consent")
 
-    # Stores the state in session so it can be verified later when Google redirects back.
-    session["state"] = state
+def drive_file_resource(row):
+    """Turns a drive_files row back into the dict files.get returns."""
+    file_id, name, mime_type, parent_id, trashed, shortcut_target, thumbnail, modified_time, md5_checksum, size, _ = row
+    f = {"id": file_id, "name": name, "mimeType": mime_type, "trashed": bool(trashed)}
+    if parent_id:
+        f["parents"] = [parent_id]
+    if shortcut_target:
+        f["shortcutDetails"] = {"targetId": shortcut_target}
+    if thumbnail:
+        f["thumbnailLink"] = thumbnail
+    if modified_time:
+        f["modifiedTime"] = modified_time
+    if md5_checksum:
+        f["md5Checksum"] = md5_checksum
+    if size is not None:
+        f["size"] = str(size)
+    return f
+
+
+def remember_drive_files(files, listed_folders=()):
+    """
+    Saves Drive file resources to drive_files. listed_folders are folders whose complete
+    listings are in files: their cached children missing from files are dropped.
+    """
+    now = time.time()
+    conn = connect_db()
+    c = conn.cursor()
+    c.executemany(f"""
+        INSERT INTO drive_files ({DRIVE_FILE_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(id) DO UPDATE SET
+            name = excluded.name, mime_type = excluded.mime_type, parent_id = excluded.parent_id,
+            trashed = excluded.trashed, shortcut_target = excluded.shortcut_target, thumbnail = excluded.thumbnail,
+            modified_time = excluded.modified_time, md5_checksum = excluded.md5_checksum, size = excluded.size,
+            fetched_at = excluded.fetched_at
+    """, [drive_file_row(f, now) for f in files if f.get("id")])
+
+    listed_folders = list(listed_folders)
+    if listed_folders:
+        # Everything listed was just stamped with `now`; older children were moved, trashed or deleted
+        c.executemany("DELETE FROM drive_files WHERE parent_id = ? AND fetched_at < ?",
+                      [(folder_id, now) for folder_id in listed_folders])
+        c.executemany("INSERT OR IGNORE INTO drive_files (id, mime_type) VALUES (?, ?)",
+                      [(folder_id, MIME_FOLDER) for folder_id in listed_folders])
+        c.executemany("UPDATE drive_files SET children_fetched_at = ? WHERE id = ?",
+                      [(now, folder_id) for folder_id in listed_folders])
 
-    return redirect(auth_url)
+    conn.commit()
+    conn.close()
+
+
+def forget_drive_file(file_id):
+    conn = connect_db()
+    c = conn.cursor()
+    c.execute("DELETE FROM drive_files WHERE id = ?", (file_id,))
+    conn.commit()
+    conn.close()
+
+
+def cached_drive_file(file_id, max_age=DRIVE_FILE_CACHE_TTL_SECONDS):
+    """Returns (resource, fetched_at) from drive_files, or None if it is missing or stale."""
+    conn = connect_db()
+    c = conn.cursor()
+    c.execute(f"SELECT {DRIVE_FILE_COLUMNS} FROM drive_files WHERE id = ?", (file_id,))
+    row = c.fetchone()
+    conn.close()
+    if not row or row[-1] is None or time.time() - row[-1] > max_age:
+        return None
+    return drive_file_resource(row), row[-1]
+
+
+def cached_folder_children(folder_id, max_age=DRIVE_FOLDER_CACHE_TTL_SECONDS):
+    """Returns the folder's non-trashed children from its last listing, or None if it is stale."""
+    conn = connect_db()
+    c = conn.cursor()
+    c.execute("SELECT children_fetched_at FROM drive_files WHERE id = ?", (folder_id,))
+    row = c.fetchone()
+    if not row or row[0] is None or time.time() - row[0] > max_age:
+        conn.close()
+        return None
+    c.execute(f"SELECT {DRIVE_FILE_COLUMNS} FROM drive_files WHERE parent_id = ? AND trashed = 0", (folder_id,))
+    children = [drive_file_resource(child) for child in c.fetchall()]
+    conn.close()
+    return children
+
+
+def get_drive_file(service, file_id):
+    """files.get through the metadata cache. Raises what files.get raises on a miss."""
+    cached = cached_drive_file(file_id)
+    metrics.inc("photo_tagger_drive_cache_total", {"kind": "file", "result": "hit" if cached else "miss"})
+    if cached:
+        return cached[0]
+
+    try:
+        f = drive_execute(service.files().get(
+            fileId=file_id,
+            fields=DRIVE_FILE_FIELDS,
+            supportsAllDrives=True
+        ))
+    except Exception as e:
+        if rate_limit.error_status(e) == 404:
+            forget_drive_file(file_id)
+        raise
+    remember_drive_files([f])
+    return f
+
+
+def query_drive_files(service, query, **list_args):
+    """
+    Every file matching a files.list query, following nextPageToken. Returns (files, complete);
+    complete is False when Drive flags the search as incomplete (possible with corpora="allDrives").
+    """
+    files = []
+    complete = True
+    page_token = None
+    while True:
+        results = drive_execute(service.files().list(
+            q=query,
+            fields=f"nextPageToken, incompleteSearch, files({DRIVE_FILE_FIELDS})",
+            pageSize=DRIVE_LIST_PAGE_SIZE,
+            pageToken=page_token,
+            supportsAllDrives=True,
+            includeItemsFromAllDrives=True,
+            **list_args
+        ))
+        files.extend(results.get("files", []))
+        complete = complete and not results.get("incompleteSearch")
+        page_token = results.get("nextPageToken")
+        if not page_token:
+            return files, complete
+
+
+def fetch_folder_children(service, folder_id):
+    """Lists a folder's non-trashed children from Drive and caches the listing."""
+    children, _ = query_drive_files(service, f"'{folder_id}' in parents and trashed = false")
+    remember_drive_files(children, listed_folders=[folder_id])
+    return children
+
+
+### - Folder Checker - ###
+# Two ways to find the images under a folder. The crawl lists folders one at a time
+# (breadth-first, through the drive_files cache), which is cheap for small trees. The flat
+# import fetches every folder, image and shortcut the user can see in a few pages of 1000
+# and walks the parent graph in memory, which is cheap for large trees. Crawls start out
+# one folder at a time and switch to the flat import when the tree turns out to be large.
+def list_images_in_folder(folder_id, creds):
+    # Returns a flat list containing all image IDs found in the folder and its children.
+    return list(iter_images_in_folder(folder_id, creds))
+
+
+def iter_images_in_folder(folder_id, creds):
+    """Yields the ID of each image under the folder once, as the crawl finds it."""
+    # Creates a Google Drive API service instance using the provided credentials.
+    service = google_service("drive", GOOGLE_DRIVE_API_VERSION, creds)
+
+    # Image IDs already yielded (a shortcut and its target, or a flat import taking over, repeat them)
+    found = set()
+
+    # Folders still to be listed, and every folder queued so far (guards against cycles)
+    pending = deque([folder_id])
+    seen_folders = {folder_id}
+    listed_from_drive = 0
+    flat_tried = False
+
+    while pending:
+        current = pending.popleft()
+
+        # Retrieves the non-trashed files and folders directly inside the folder (from the cache when fresh).
+        files = cached_folder_children(current)
+        metrics.inc("photo_tagger_drive_cache_total", {"kind": "folder", "result": "miss" if files is None else "hit"})
+        if files is None:
+            # A large tree costs fewer calls as one flat import than as a call per remaining folder
+            if listed_from_drive >= FOLDER_CRAWL_FLAT_THRESHOLD and not flat_tried:
+                flat_tried = True
+                logger.info("Folder %s has at least %d subfolders; switching to a flat import", folder_id, len(seen_folders) - 1)
+                flat_links = list_images_in_folder_flat(service, folder_id)
+                if flat_links is not None:
+                    for image_id in flat_links:
+                        if image_id not in found:
+                            found.add(image_id)
+                            yield image_id
+                    return
+            files = fetch_folder_children(service, current)
+            listed_from_drive += 1
+
+        # Iterates through each item in the folder to determine its type and decide how to process it.
+        for f in files:
+            file_id = f.get("id")
+            mime = f.get("mimeType")
+            image_id = None
+
+            # Checks if the file is a shortcut to another file.
+            if mime == MIME_SHORTCUT:
+                target_id = f.get("shortcutDetails", {}).get("targetId")
+
+                # Attempts to resolve the shortcut to its target and include if it's an image.
+                if target_id:
+                    try:
+                        target = get_drive_file(service, target_id)
+                    except Exception:
+                        continue
+
+                    target_mime = target.get("mimeType")
+
+                    if target_mime and target_mime.startswith(MIME_IMAGE_PREFIX) and not target.get("trashed"):
+                        image_id = target.get("id")
+
+            # Adds the file directly if it is an image (e.g., JPEG, PNG).
+            elif mime and mime.startswith(MIME_IMAGE_PREFIX):
+                image_id = file_id
+
+            # Queues subfolders so their contents are processed too.
+            elif mime == MIME_FOLDER and file_id not in seen_folders:
+                seen_folders.add(file_id)
+                pending.append(file_id)
+
+            if image_id and image_id not in found:
+                found.add(image_id)
+                yield image_id
+
+
+def list_images_in_folder_flat(service, folder_id):
+    """
+    Finds the images under folder_id from one paged query over all the user's folders,
+    images and shortcuts, so the call count depends on the size of the Drive rather than
+    the shape of the tree. Returns None if Drive reports the search as incomplete.
+    """
+    with timed("flat_import"):
+        files, complete = query_drive_files(
+            service,
+            f"(mimeType = '{MIME_FOLDER}' or mimeType = '{MIME_SHORTCUT}' "
+            f"or mimeType contains '{MIME_IMAGE_PREFIX}') and trashed = false",
+            corpora="allDrives"
+        )
+    if not complete:
+        logger.warning("Flat import of %s: Drive returned incomplete results; crawling folders instead", folder_id)
+        return None
+
+    by_id = {f["id"]: f for f in files}
+    children = defaultdict(list)
+    for f in files:
+        for parent in f.get("parents", []):
+            children[parent].append(f)
+
+    image_links = []
+    subtree = []
+    pending = deque([folder_id])
+    seen_folders = {folder_id}
+    while pending:
+        for f in children.get(pending.popleft(), []):
+            subtree.append(f)
+            mime = f.get("mimeType", "")
+            if mime == MIME_FOLDER:
+                if f["id"] not in seen_folders:
+                    seen_folders.add(f["id"])
+                    pending.append(f["id"])
+            elif mime == MIME_SHORTCUT:
+                # Targets that are images the user can see are in the query results
+                target = by_id.get(f.get("shortcutDetails", {}).get("targetId"))
+                if target and target.get("mimeType", "").startswith(MIME_IMAGE_PREFIX):
+                    image_links.append(target["id"])
+            elif mime.startswith(MIME_IMAGE_PREFIX):
+                image_links.append(f["id"])
+
+    logger.info("Flat import of %s: %d images in %d folders, out of %d files listed",
+                folder_id, len(image_links), len(seen_folders), len(files))
+
+    # The subtree's listings are cached as complete: they hold every folder, image and shortcut,
+    # which is all a crawl looks at
+    remember_drive_files(subtree, listed_folders=seen_folders)
+    return image_links
+
+
+### - Duplicate Photos - ###
+# The same photo often sits in Drive under several file IDs (copies across shared folders).
+# Copies are recognized by md5Checksum and size, which crawls and thumbnail refreshes save in
+# drive_files. With DEDUP_IMPORTS on, a copy of a photo already in the catalog is recorded in
+# image_aliases and its tags go to that photo. /duplicates/merge collapses the copies that are
+# already in the catalog the same way.
+def resolve_duplicates(c, image_ids):
+    """
+    Maps each of image_ids that is a copy of another photo to the ID the catalog keeps for it:
+    known aliases, IDs with the same content as a catalog photo, and repeats within image_ids.
+    IDs already in the catalog are left alone.
+    """
+    placeholders = ",".join("?" for _ in image_ids)
+    c.execute(f"SELECT alias_id, canonical_id FROM image_aliases WHERE alias_id IN ({placeholders})", image_ids)
+    aliases = dict(c.fetchall())
+    c.execute(f"SELECT id FROM images WHERE id IN ({placeholders})", image_ids)
+    in_catalog = {row[0] for row in c.fetchall()}
+    c.execute(
+        f"SELECT id, md5_checksum, size FROM drive_files WHERE id IN ({placeholders}) AND md5_checksum IS NOT NULL",
+        image_ids
+    )
+    content = {file_id: (md5_checksum, size) for file_id, md5_checksum, size in c.fetchall()}
+    if not content:
+        return aliases
+
+    # The catalog photo kept for each content, lowest ID first
+    checksums = sorted({md5_checksum for md5_checksum, _ in content.values()})
+    c.execute(f"""
+        SELECT d.md5_checksum, d.size, d.id FROM drive_files d JOIN images i ON i.id = d.id
+        WHERE d.md5_checksum IN ({",".join("?" for _ in checksums)})
+        ORDER BY d.id DESC
+    """, checksums)
+    keepers = {(md5_checksum, size): file_id for md5_checksum, size, file_id in c.fetchall()}
+
+    for image_id in image_ids:
+        if image_id in aliases or image_id in in_catalog or image_id not in content:
+            continue
+        keeper = keepers.setdefault(content[image_id], image_id)
+        if keeper != image_id:
+            aliases[image_id] = keeper
+    return aliases
+
+
+def upsert_images(c, image_ids, tags, thumbnails=None, update_existing=True):
+    """
+    Adds image_ids to the catalog with tags, in the caller's transaction. Images already in
+    the catalog get the tags too, unless update_existing is False. With DEDUP_IMPORTS, copies
+    of catalog photos become aliases and their tags go to the photo. Returns (added, aliased).
+    """
+    thumbnails = thumbnails or {}
+    aliases = resolve_duplicates(c, image_ids) if DEDUP_IMPORTS else {}
+    targets = list(dict.fromkeys(aliases.get(image_id, image_id) for image_id in image_ids))
+
+    placeholders = ",".join("?" for _ in targets)
+    c.execute(f"SELECT id, tags FROM images WHERE id IN ({placeholders})", targets)
+    existing = {image_id: decode_tags(image_tags) for image_id, image_tags in c.fetchall()}
+
+    merged = {}
+    for image_id in image_ids:
+        target = aliases.get(image_id, image_id)
+        if target == image_id and target in existing and not update_existing:
+            continue
+        image_tags = merged.setdefault(target, list(existing.get(target, [])))
+        image_tags.extend(tag for tag in tags if tag not in image_tags)
+
+    c.executemany("""
+        INSERT INTO images (id, tags, thumbnail) VALUES (?, ?, ?)
+        ON CONFLICT(id) DO UPDATE SET tags = excluded.tags
+    """, [(image_id, codec.dumps(image_tags), thumbnails.get(image_id)) for image_id, image_tags in merged.items()])
+    c.executemany("INSERT OR IGNORE INTO image_aliases (alias_id, canonical_id) VALUES (?, ?)", list(aliases.items()))
+    aliased = max(c.rowcount, 0)
+
+    return sum(1 for image_id in merged if image_id not in existing), aliased
+
+
+def merge_duplicate_images():
+    """
+    Collapses catalog photos with the same content into the one with the lowest ID, merging
+    their tags. Returns (copies removed, photos they were merged into).
+    """
+    conn = connect_db()
+    c = conn.cursor()
+    c.execute("""
+        SELECT d.md5_checksum, d.size, i.id, i.tags, i.thumbnail
+        FROM images i JOIN drive_files d ON d.id = i.id
+        WHERE (d.md5_checksum, d.size) IN (
+            SELECT d2.md5_checksum, d2.size FROM images i2 JOIN drive_files d2 ON d2.id = i2.id
+            WHERE d2.md5_checksum IS NOT NULL
+            GROUP BY d2.md5_checksum, d2.size HAVING COUNT(*) > 1
+        )
+        ORDER BY d.md5_checksum, d.size, i.id
+    """)
+    rows = c.fetchall()
+
+    removed = 0
+    groups = 0
+    for _, copies in itertools.groupby(rows, key=lambda row: (row[0], row[1])):
+        copies = list(copies)
+        keeper_id, keeper_tags = copies[0][2], decode_tags(copies[0][3])
+        thumbnail = next((copy[4] for copy in copies if copy[4]), None)
+        for _, _, copy_id, copy_tags, _ in copies[1:]:
+            keeper_tags.extend(tag for tag in decode_tags(copy_tags) if tag not in keeper_tags)
+            c.execute("DELETE FROM images WHERE id = ?", (copy_id,))
+            c.execute("UPDATE image_aliases SET canonical_id = ? WHERE canonical_id = ?", (keeper_id, copy_id))
+            c.execute("INSERT OR REPLACE INTO image_aliases (alias_id, canonical_id) VALUES (?, ?)", (copy_id, keeper_id))
+            removed += 1
+        c.execute("UPDATE images SET tags = ?, thumbnail = ? WHERE id = ?", (codec.dumps(keeper_tags), thumbnail, keeper_id))
+        groups += 1
+
+    if removed:
+        bump_catalog_version(c)
+    conn.commit()
+    conn.close()
+    return removed, groups
+
+
+@app.route("/duplicates/merge", methods=["POST"])
+def duplicates_merge():
+    removed, groups = merge_duplicate_images()
+    if removed:
+        flash(f"Merged {removed} duplicate copies into {groups} photos.", FLASH_SUCCESS)
+    else:
+        flash("No duplicate photos found. Photos are matched by checksum, which is saved when folders are "
+              "imported and thumbnails are refreshed.", FLASH_INFO)
+    return redirect("/")
+
+
+### - Near-Duplicate Photos - ###
+# Resized, cropped or re-encoded versions of a photo have different checksums, so they are
+# matched by perceptual hash instead. `python -m perceptual_hash` downloads each photo's
+# thumbnail into THUMBNAIL_CACHE_DIR, hashes the bytes in a process pool and stores the
+# hashes in image_hashes. /duplicates groups photos whose hashes are a few bits apart, using
+# a BK-tree built once per worker for each state of image_hashes.
+_near_duplicate_index = None  # (image_hashes state, BKTree over pHash, {id: (dhash, phash)})
+_near_duplicate_lock = threading.Lock()
+
+
+def thumbnail_cache_path(image_id):
+    return os.path.join(THUMBNAIL_CACHE_DIR, image_id)
+
+
+def read_cached_thumbnail(image_id, thumb_url):
+    """Thumbnail bytes from THUMBNAIL_CACHE_DIR, downloading them first if needed. None on failure."""
+    path = thumbnail_cache_path(image_id)
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        pass
+
+    try:
+        with urllib.request.urlopen(thumb_url, timeout=THUMBNAIL_DOWNLOAD_TIMEOUT_SECONDS) as response:
+            data = response.read()
+    except Exception as e:
+        logger.debug("Could not download thumbnail for %s: %s", image_id, e)
+        return None
+
+    os.makedirs(THUMBNAIL_CACHE_DIR, exist_ok=True)
+    partial_path = f"{path}.{uuid.uuid4().hex}.part"
+    with open(partial_path, "wb") as f:
+        f.write(data)
+    os.replace(partial_path, path)
+    return data
+
+
+def update_image_hashes(workers=None, limit=None):
+    """
+    Hashes the catalog photos that have no row in image_hashes yet. Thumbnails are downloaded
+    in threads and hashed in a process pool of `workers`. Returns (hashed, failed); photos
+    whose thumbnail couldn't be downloaded are tried again next run, ones that couldn't be
+    decoded are not.
+    """
+    conn = connect_db()
+    c = conn.cursor()
+    c.execute("""
+        SELECT i.id, i.thumbnail FROM images i LEFT JOIN image_hashes h ON h.id = i.id
+        WHERE h.id IS NULL AND i.thumbnail IS NOT NULL
+        ORDER BY i.id
+    """ + (" LIMIT ?" if limit else ""), (limit,) if limit else ())
+    pending = [(image_id, thumb) for image_id, thumb in c.fetchall() if is_valid_thumbnail(thumb)]
+    conn.close()
+
+    downloaded = []
+    with ThreadPoolExecutor(max_workers=THUMBNAIL_DOWNLOAD_THREADS) as pool:
+        for (image_id, _), data in zip(pending, pool.map(lambda item: read_cached_thumbnail(*item), pending), strict=True):
+            if data:
+                downloaded.append((image_id, data))
+    failed = len(pending) - len(downloaded)
+
+    hashed = 0
+    conn = connect_db()
+    c = conn.cursor()
+    results = perceptual_hash.hash_images(downloaded, workers=workers)
+    while batch := list(itertools.islice(results, IMAGE_HASH_BATCH_SIZE)):
+        now = time.time()
+        rows = [
+            (image_id, dhash if dhash is None else f"{dhash:016x}", phash if phash is None else f"{phash:016x}", now)
+            for image_id, dhash, phash in batch
+        ]
+        c.executemany("INSERT OR REPLACE INTO image_hashes (id, dhash, phash, computed_at) VALUES (?, ?, ?, ?)", rows)
+        conn.commit()
+        decoded = sum(1 for row in rows if row[1] is not None)
+        hashed += decoded
+        failed += len(rows) - decoded
+    conn.close()
+
+    logger.info("Perceptual hashes: %d computed, %d failed", hashed, failed)
+    return hashed, failed
+
+
+def near_duplicate_index():
+    """The worker's BK-tree over the catalog's pHashes, rebuilt when image_hashes changes."""
+    global _near_duplicate_index
+
+    conn = connect_db()
+    c = conn.cursor()
+    c.execute("SELECT COUNT(*), MAX(computed_at) FROM image_hashes")
+    state = c.fetchone()
+    with _near_duplicate_lock:
+        if _near_duplicate_index is None or _near_duplicate_index[0] != state:
+            c.execute("SELECT id, dhash, phash FROM image_hashes WHERE phash IS NOT NULL")
+            hashes = {image_id: (int(dhash, 16), int(phash, 16)) for image_id, dhash, phash in c.fetchall()}
+            tree = perceptual_hash.BKTree((phash, image_id) for image_id, (_, phash) in hashes.items())
+            _near_duplicate_index = (state, tree, hashes)
+        index = _near_duplicate_index
+    conn.close()
+    return index[1], index[2]
+
+
+def near_duplicate_groups(max_distance=NEAR_DUPLICATE_DISTANCE):
+    """
+    Groups catalog photos whose pHash and dHash are both within max_distance bits of another
+    photo in the group. Returns [[(image_id, tags, thumbnail)]], largest groups first.
+    """
+    tree, hashes = near_duplicate_index()
+
+    # Union-find over every matching pair
+    parent = {image_id: image_id for image_id in hashes}
+
+    def find(image_id):
+        root = image_id
+        while parent[root] != root:
+            root = parent[root]
+        while image_id != root:
+            parent[image_id], image_id = root, parent[image_id]
+        return root
+
+    for image_id, (dhash, phash) in hashes.items():
+        for _, other_id in tree.search(phash, max_distance):
+            if other_id != image_id and perceptual_hash.hamming(dhash, hashes[other_id][0]) <= max_distance:
+                root, other_root = find(image_id), find(other_id)
+                if root != other_root:
+                    parent[max(root, other_root)] = min(root, other_root)
+
+    members = defaultdict(list)
+    for image_id in parent:
+        members[find(image_id)].append(image_id)
+    ids = [image_id for group in members.values() if len(group) > 1 for image_id in group]
+    if not ids:
+        return []
+
+    conn = connect_db()
+    c = conn.cursor()
+    c.execute(f"SELECT id, tags, thumbnail FROM images WHERE id IN ({','.join('?' for _ in ids)})", ids)
+    photos = {image_id: (image_id, decode_tags(tags), thumbnail) for image_id, tags, thumbnail in c.fetchall()}
+    conn.close()
+
+    groups = []
+    for group in members.values():
+        group = [photos[image_id] for image_id in sorted(group) if image_id in photos]
+        if len(group) > 1:
+            groups.append(group)
+    groups.sort(key=lambda group: (-len(group), group[0][0]))
+    return groups
+
+
+@app.route("/duplicates")
+def duplicates():
+    if "credentials" not in session:
+        flash("Please authenticate first.", FLASH_DANGER)
+        return redirect("/authorize")
+
+    distance = min(max(request.args.get("distance", NEAR_DUPLICATE_DISTANCE, type=int), 0), NEAR_DUPLICATE_MAX_DISTANCE)
+    conn = connect_db()
+    c = conn.cursor()
+    c.execute("SELECT COUNT(*) FROM images")
+    total = c.fetchone()[0]
+    c.execute("SELECT COUNT(*) FROM image_hashes h JOIN images i ON i.id = h.id WHERE h.phash IS NOT NULL")
+    hashed = c.fetchone()[0]
+    conn.close()
+
+    with timed("near_duplicates"):
+        groups = near_duplicate_groups(distance)
+    return render_template(
+        "duplicates.html",
+        groups=groups,
+        distance=distance,
+        max_distance=NEAR_DUPLICATE_MAX_DISTANCE,
+        total=total,
+        hashed=hashed,
+        default_thumbnail=DEFAULT_THUMBNAIL,
+    )
+
+
+### - Folder Ingest - ###
+# Folder imports run in a background thread as a pipeline of generators: the crawl yields
+# batches of image IDs, the thumbnail stage fetches thumbnails for the new ones in one Drive
+# batch, and the save stage upserts each batch in one transaction. Each stage adds its own
+# time and counts to the job, which is written to ingest_jobs after every batch and
+# polled by the page from /ingest/<id>. An import dies with the process running it (a
+# restart, or max_requests recycling the worker); its job is then marked interrupted.
+INGEST_JOB_COLUMNS = (
+    "id, folder_id, status, discovered, saved, failed, crawl_seconds, thumbnail_seconds, save_seconds, "
+    "error, started_at, updated_at, finished_at"
+)
+
+
+# IDs of the imports running in this process's threads
+_ingest_threads = set()
+_ingest_threads_lock = threading.Lock()
+
+
+class IngestJob:
+    __slots__ = ("id", "counts", "seconds")
+
+    def __init__(self, job_id):
+        self.id = job_id
+        self.counts = {"discovered": 0, "saved": 0, "failed": 0}
+        self.seconds = {"crawl": 0.0, "thumbnails": 0.0, "save": 0.0}
+
+    def add(self, stage, seconds, **counts):
+        self.seconds[stage] += seconds
+        for name, count in counts.items():
+            self.counts[name] += count
+
+    def save(self, status="running", error=None):
+        now = time.time()
+        conn = connect_db()
+        c = conn.cursor()
+        c.execute("""
+            UPDATE ingest_jobs SET
+                status = ?, discovered = ?, saved = ?, failed = ?,
+                crawl_seconds = ?, thumbnail_seconds = ?, save_seconds = ?,
+                error = ?, updated_at = ?, finished_at = ?
+            WHERE id = ? AND status = 'running'
+        """, (status, self.counts["discovered"], self.counts["saved"], self.counts["failed"],
+              self.seconds["crawl"], self.seconds["thumbnails"], self.seconds["save"],
+              error, now, None if status == "running" else now, self.id))
+        conn.commit()
+        conn.close()
+
+
+def ingest_crawl(folder_id, creds, job):
+    """Stage 1: batches of image IDs, as the folder crawl finds them."""
+    batch = []
+    started = time.perf_counter()
+    for image_id in iter_images_in_folder(folder_id, creds):
+        batch.append(image_id)
+        if len(batch) == INGEST_BATCH_SIZE:
+            job.add("crawl", time.perf_counter() - started, discovered=len(batch))
+            yield batch
+            batch = []
+            started = time.perf_counter()
+    if batch:
+        job.add("crawl", time.perf_counter() - started, discovered=len(batch))
+        yield batch
+
+
+def ingest_thumbnails(batches, creds, job):
+    """Stage 2: fetches thumbnails for the images not in the catalog yet (copies of catalog photos are skipped)."""
+    for batch in batches:
+        started = time.perf_counter()
+        try:
+            conn = connect_db()
+            c = conn.cursor()
+            placeholders = ",".join("?" for _ in batch)
+            c.execute(f"SELECT id FROM images WHERE id IN ({placeholders})", batch)
+            existing = {row[0] for row in c.fetchall()}
+            aliases = resolve_duplicates(c, batch) if DEDUP_IMPORTS else {}
+            conn.close()
+
+            new_ids = [image_id for image_id in batch if image_id not in existing and image_id not in aliases]
+            thumbnails = fetch_thumbnails_from_drive(new_ids, creds) if new_ids else {}
+        except Exception as e:
+            logger.warning("Ingest %s: thumbnail batch failed: %s", job.id, e)
+            job.add("thumbnails", time.perf_counter() - started, failed=len(batch))
+            continue
+        job.add("thumbnails", time.perf_counter() - started)
+        yield batch, thumbnails
+
+
+def ingest_save(batches, tags, job):
+    """Stage 3: saves each batch in one transaction (see upsert_images())."""
+    for batch, thumbnails in batches:
+        started = time.perf_counter()
+        # Failed fetches are left empty, so load_data() tries again when the photo is shown
+        thumbnails = {image_id: thumb for image_id, thumb in thumbnails.items() if thumb != DEFAULT_THUMBNAIL}
+
+        try:
+            conn = connect_db()
+            c = conn.cursor()
+            upsert_images(c, batch, tags, thumbnails)
+            bump_catalog_version(c)
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            logger.warning("Ingest %s: saving a batch failed: %s", job.id, e)
+            job.add("save", time.perf_counter() - started, failed=len(batch))
+            continue
+        job.add("save", time.perf_counter() - started, saved=len(batch))
+        yield batch
+
+
+def run_ingest_job(job, folder_id, tags, creds):
+    try:
+        run_ingest_stages(job, folder_id, tags, creds)
+    finally:
+        with _ingest_threads_lock:
+            _ingest_threads.discard(job.id)
+
+
+def run_ingest_stages(job, folder_id, tags, creds):
+    crawl_started = time.time()
+    try:
+        for _ in ingest_save(ingest_thumbnails(ingest_crawl(folder_id, creds, job), creds, job), tags, job):
+            job.save()
+        # Remembers the folder so photos added to it later are imported by scheduled syncs
+        register_folder(folder_id, tags, crawl_started)
+    except Exception as e:
+        logger.exception("Ingest %s of folder %s failed", job.id, folder_id)
+        job.save("failed", str(e))
+        return
+
+    logger.info("Ingest %s of folder %s finished", job.id, folder_id,
+                extra={**job.counts, "stage_seconds": {stage: round(t, 3) for stage, t in job.seconds.items()}})
+    job.save("done")
+
+
+def start_ingest_job(folder_id, tags, creds):
+    """Starts importing a folder in a background thread. Returns the job ID."""
+    job_id = uuid.uuid4().hex
+    now = time.time()
+    conn = connect_db()
+    c = conn.cursor()
+    c.execute(f"""
+        INSERT INTO ingest_jobs ({INGEST_JOB_COLUMNS}) VALUES (?, ?, 'running', 0, 0, 0, 0, 0, 0, NULL, ?, ?, NULL)
+    """, (job_id, folder_id, now, now))
+    conn.commit()
+    conn.close()
+
+    with _ingest_threads_lock:
+        _ingest_threads.add(job_id)
+
+    threading.Thread(
+        target=run_ingest_job, args=(IngestJob(job_id), folder_id, tags, creds),
+        name=f"ingest-{job_id[:8]}", daemon=True
+    ).start()
+    return job_id
+
+
+def interrupt_ingest_jobs(job_ids=None):
+    """
+    Marks running imports as interrupted: job_ids, or all of them when no worker is running
+    yet (create_app()). Returns how many were marked.
+    """
+    now = time.time()
+    condition, params = "", []
+    if job_ids is not None:
+        condition, params = f"AND id IN ({','.join('?' for _ in job_ids)})", list(job_ids)
+    conn = connect_db()
+    c = conn.cursor()
+    c.execute(f"""
+        UPDATE ingest_jobs SET status = 'interrupted', error = ?, updated_at = ?, finished_at = ?
+        WHERE status = 'running' {condition}
+    """, [INGEST_INTERRUPTED_MESSAGE, now, now] + params)
+    interrupted = c.rowcount
+    conn.commit()
+    conn.close()
+    return interrupted
+
+
+def interrupt_own_ingest_jobs():
+    """At exit: the imports this process was still running die with it, so say so in their jobs."""
+    with _ingest_threads_lock:
+        job_ids = list(_ingest_threads)
+    if not job_ids:
+        return
+    try:
+        interrupt_ingest_jobs(job_ids)
+    except sqlite3.Error as e:
+        logger.warning("Could not mark this worker's imports interrupted: %s", e)
+
+
+atexit.register(interrupt_own_ingest_jobs)
+
+
+def ingest_job_dict(row):
+    job = dict(zip([column.strip() for column in INGEST_JOB_COLUMNS.split(",")], row, strict=True))
+    # A worker killed outright (timeout, out of memory) never got to mark its jobs interrupted
+    if job["status"] == "running" and time.time() - job["updated_at"] > INGEST_STALE_SECONDS:
+        job["status"] = "interrupted"
+    return job
+
+
+def get_ingest_job(job_id):
+    conn = connect_db()
+    c = conn.cursor()
+    c.execute(f"SELECT {INGEST_JOB_COLUMNS} FROM ingest_jobs WHERE id = ?", (job_id,))
+    row = c.fetchone()
+    conn.close()
+    return ingest_job_dict(row) if row else None
+
+
+def recent_ingest_jobs():
+    """Imports still running or finished in the last INGEST_RECENT_SECONDS, newest first."""
+    conn = connect_db()
+    c = conn.cursor()
+    c.execute(f"""
+        SELECT {INGEST_JOB_COLUMNS} FROM ingest_jobs
+        WHERE finished_at IS NULL OR finished_at > ?
+        ORDER BY started_at DESC
+    """, (time.time() - INGEST_RECENT_SECONDS,))
+    jobs = [ingest_job_dict(row) for row in c.fetchall()]
+    conn.close()
+    return [job for job in jobs if job["status"] != "interrupted" or time.time() - job["updated_at"] < INGEST_RECENT_SECONDS]
+
+
+@app.route("/ingest/<job_id>")
+def ingest_status(job_id):
+    """The job's counts as JSON, polled by static/ingest.js while the import runs."""
+    if "credentials" not in session:
+        abort(401)
+
+    job = get_ingest_job(job_id)
+    if job is None:
+        return jsonify({"error": "No such import."}), 404
+    response = jsonify(job)
+    response.headers["Cache-Control"] = "no-store"
+    return response
+
+
+### - Watched Folders - ###
+# Folder links added through index() are remembered in the folders table with their tags.
+# A sync lists every folder the user can see (one paged query), lists again only the
+# subfolders whose modifiedTime moved past the mark saved in folder_sync_marks, and also
+# asks for photos created since the last sync (Drive doesn't always touch a folder's
+# modifiedTime when a file lands in it). Only photos not yet in the catalog are added.
+# Syncs start in a background thread from page loads once a folder is due.
+def drive_timestamp(seconds=None):
+    """RFC 3339 time in UTC, as Drive queries expect."""
+    moment = datetime.datetime.fromtimestamp(time.time() if seconds is None else seconds, datetime.timezone.utc)
+    return moment.strftime("%Y-%m-%dT%H:%M:%S")
+
+
+def register_folder(folder_id, tags, crawl_started):
+    """
+    Watches a folder that was just imported. The marks for its subfolders come from the
+    listings the crawl left in drive_files; the next sync also looks for photos created
+    since the oldest of those listings.
+    """
+    conn = connect_db()
+    c = conn.cursor()
+
+    c.execute("SELECT tags FROM folders WHERE id = ?", (folder_id,))
+    row = c.fetchone()
+    merged_tags = decode_tags(row[0]) if row else []
+    merged_tags.extend(tag for tag in tags if tag not in merged_tags)
+
+    c.execute("""
+        WITH RECURSIVE subtree(id) AS (
+            SELECT ?
+            UNION
+            SELECT d.id FROM drive_files d JOIN subtree s ON d.parent_id = s.id WHERE d.mime_type = ?
+        )
+        SELECT d.id, d.modified_time, d.children_fetched_at FROM subtree JOIN drive_files d ON d.id = subtree.id
+    """, (folder_id, MIME_FOLDER))
+    subtree = c.fetchall()
+    oldest_listing = min([crawl_started] + [listed for _, _, listed in subtree if listed])
+
+    c.execute("""
+        INSERT INTO folders (id, tags, added_at, synced_through, last_synced_at) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(id) DO UPDATE SET
+            tags = excluded.tags, synced_through = excluded.synced_through, last_synced_at = excluded.last_synced_at
+    """, (folder_id, codec.dumps(merged_tags), datetime.datetime.now().isoformat(timespec="seconds"),
+          drive_timestamp(oldest_listing), time.time()))
+    c.execute("DELETE FROM folder_sync_marks WHERE root_id = ?", (folder_id,))
+    c.executemany(
+        "INSERT INTO folder_sync_marks (root_id, folder_id, modified_time) VALUES (?, ?, ?)",
+        [(folder_id, subfolder_id, modified_time) for subfolder_id, modified_time, _ in subtree if modified_time]
+    )
+
+    bump_catalog_version(c)
+    conn.commit()
+    conn.close()
+
+
+def list_folders():
+    conn = connect_db()
+    c = conn.cursor()
+    c.execute("SELECT id, tags, last_synced_at, last_sync_result FROM folders ORDER BY added_at")
+    folders = [
+        {
+            "id": folder_id,
+            "tags": decode_tags(tags),
+            "last_synced": datetime.datetime.fromtimestamp(last_synced_at).isoformat(timespec="minutes")
+                           if last_synced_at else None,
+            "last_sync_result": last_sync_result,
+        }
+        for folder_id, tags, last_synced_at, last_sync_result in c.fetchall()
+    ]
+    conn.close()
+    return folders
+
+
+def sync_folder(folder_id, creds):
+    """Adds the photos that appeared under a watched folder since its last sync. Returns a summary."""
+    service = google_service("drive", GOOGLE_DRIVE_API_VERSION, creds)
+
+    conn = connect_db()
+    c = conn.cursor()
+    c.execute("SELECT tags, synced_through FROM folders WHERE id = ?", (folder_id,))
+    row = c.fetchone()
+    c.execute("SELECT folder_id, modified_time FROM folder_sync_marks WHERE root_id = ?", (folder_id,))
+    marks = dict(c.fetchall())
+    conn.close()
+    if not row:
+        raise LookupError(f"Folder {folder_id} is not watched")
+    tags, synced_through = decode_tags(row[0]), row[1]
+    started = drive_timestamp()
+
+    # Every folder the user can see, with its modifiedTime, in pages of 1000
+    folders, complete = query_drive_files(service, f"mimeType = '{MIME_FOLDER}' and trashed = false", corpora="allDrives")
+    if not complete:
+        raise RuntimeError("Drive returned an incomplete folder list")
+    by_id = {f["id"]: f for f in folders}
+    if folder_id not in by_id:
+        raise LookupError("The folder is no longer in Drive or no longer shared with you")
+
+    subfolders = defaultdict(list)
+    for f in folders:
+        for parent in f.get("parents", []):
+            subfolders[parent].append(f["id"])
+
+    subtree = [folder_id]
+    seen_folders = {folder_id}
+    for current in subtree:
+        for child_id in subfolders.get(current, []):
+            if child_id not in seen_folders:
+                seen_folders.add(child_id)
+                subtree.append(child_id)
+
+    changed = [
+        subfolder_id for subfolder_id in subtree
+        if marks.get(subfolder_id) is None or by_id[subfolder_id].get("modifiedTime", "") > marks[subfolder_id]
+    ]
+
+    candidates = []
+    if synced_through:
+        recent, _ = query_drive_files(
+            service,
+            f"(mimeType contains '{MIME_IMAGE_PREFIX}' or mimeType = '{MIME_SHORTCUT}') "
+            f"and trashed = false and createdTime > '{synced_through}'",
+            corpora="allDrives"
+        )
+        candidates.extend(f for f in recent if seen_folders.intersection(f.get("parents", [])))
+    for subfolder_id in changed:
+        candidates.extend(fetch_folder_children(service, subfolder_id))
+
+    image_ids = []
+    for f in candidates:
+        mime = f.get("mimeType", "")
+        if mime == MIME_SHORTCUT:
+            target_id = f.get("shortcutDetails", {}).get("targetId")
+            if not target_id:
+                continue
+            try:
+                target = get_drive_file(service, target_id)
+            except Exception:
+                continue
+            if target.get("mimeType", "").startswith(MIME_IMAGE_PREFIX) and not target.get("trashed"):
+                image_ids.append(target_id)
+        elif mime.startswith(MIME_IMAGE_PREFIX):
+            image_ids.append(f["id"])
+
+    conn = connect_db()
+    c = conn.cursor()
+    image_ids = list(dict.fromkeys(image_ids))
+    added = 0
+    for i in range(0, len(image_ids), INGEST_BATCH_SIZE):
+        # Photos already in the catalog keep their tags; new ones (and copies, see DEDUP_IMPORTS) get the folder's
+        batch_added, _ = upsert_images(c, image_ids[i:i + INGEST_BATCH_SIZE], tags, update_existing=False)
+        added += batch_added
+    c.execute("DELETE FROM folder_sync_marks WHERE root_id = ?", (folder_id,))
+    c.executemany(
+        "INSERT INTO folder_sync_marks (root_id, folder_id, modified_time) VALUES (?, ?, ?)",
+        [(folder_id, subfolder_id, by_id[subfolder_id].get("modifiedTime")) for subfolder_id in subtree]
+    )
+    c.execute("UPDATE folders SET synced_through = ? WHERE id = ?", (started, folder_id))
+    if added:
+        bump_catalog_version(c)
+    conn.commit()
+    conn.close()
+
+    logger.info("Synced folder %s: %d new photos, %d of %d folders listed again",
+                folder_id, added, len(changed), len(subtree))
+    return f"{added} new photos, {len(changed)} of {len(subtree)} folders listed again"
+
+
+def claim_folder_sync(folder_id):
+    """Marks the folder as being synced, unless another request or worker already is. Returns True if claimed."""
+    now = time.time()
+    conn = connect_db()
+    c = conn.cursor()
+    c.execute(
+        "UPDATE folders SET sync_claimed_until = ? WHERE id = ? AND (sync_claimed_until IS NULL OR sync_claimed_until < ?)",
+        (now + FOLDER_SYNC_CLAIM_SECONDS, folder_id, now)
+    )
+    claimed = c.rowcount == 1
+    conn.commit()
+    conn.close()
+    return claimed
+
+
+def finish_folder_sync(folder_id, result):
+    conn = connect_db()
+    c = conn.cursor()
+    c.execute(
+        "UPDATE folders SET last_synced_at = ?, last_sync_result = ?, sync_claimed_until = NULL WHERE id = ?",
+        (time.time(), result, folder_id)
+    )
+    bump_catalog_version(c)
+    conn.commit()
+    conn.close()
+
+
+def run_folder_sync(folder_id, creds):
+    """
+    Syncs a watched folder unless it is already being synced elsewhere.
+    Returns (success, message), or None if another sync holds the folder.
+    """
+    if not claim_folder_sync(folder_id):
+        return None
+    try:
+        success, message = True, sync_folder(folder_id, creds)
+    except Exception as e:
+        logger.warning("Sync of folder %s failed: %s", folder_id, e)
+        success, message = False, f"Sync failed: {e}"
+    finish_folder_sync(folder_id, message)
+    return success, message
+
+
+def schedule_folder_syncs(creds):
+    """Starts a background sync of the watched folders that are due, with the signed-in user's credentials."""
+    now = time.time()
+    conn = connect_db()
+    c = conn.cursor()
+    c.execute("""
+        SELECT id FROM folders
+        WHERE (last_synced_at IS NULL OR last_synced_at < ?) AND (sync_claimed_until IS NULL OR sync_claimed_until < ?)
+    """, (now - FOLDER_SYNC_INTERVAL_SECONDS, now))
+    due = [row[0] for row in c.fetchall()]
+    conn.close()
+    if not due:
+        return
+
+    def sync_due_folders():
+        for folder_id in due:
+            run_folder_sync(folder_id, creds)
+
+    threading.Thread(target=sync_due_folders, name="folder-sync", daemon=True).start()
+
+
+@app.route("/folders/sync/<folder_id>", methods=["POST"])
+def folder_sync(folder_id):
+    if "credentials" not in session:
+        flash("Please authenticate first.", FLASH_DANGER)
+        return redirect("/authorize")
+
+    outcome = run_folder_sync(folder_id, load_credentials(session["credentials"]))
+    if outcome is None:
+        flash("This folder is already being synced.", FLASH_INFO)
+    else:
+        success, message = outcome
+        flash(f"Folder synced: {message}" if success else message, FLASH_SUCCESS if success else FLASH_DANGER)
+    return redirect("/")
+
+
+@app.route("/folders/delete/<folder_id>", methods=["POST"])
+def folder_delete(folder_id):
+    conn = connect_db()
+    c = conn.cursor()
+    c.execute("DELETE FROM folders WHERE id = ?", (folder_id,))
+    deleted_rows = c.rowcount
+    c.execute("DELETE FROM folder_sync_marks WHERE root_id = ?", (folder_id,))
+    bump_catalog_version(c)
+    conn.commit()
+    conn.close()
+
+    if deleted_rows > 0:
+        flash("Stopped watching the folder. Its photos stay in the catalog.", FLASH_INFO)
+    else:
+        flash(f"Folder {folder_id} is not watched.", FLASH_WARNING)
+    return redirect("/")
+
+
+### - Google Authentication - ###
+@app.route("/authorize")
+def authorize():
+
+    # Initializes an OAuth flow from the client_config dictionary.
+    flow = oauth_flow()
+
+    # Generates an authorization URL that users will visit to grant access and return a state token.
+    auth_url, state = flow.authorization_url(access_type="offline", include_granted_scopes="true", prompt="consent")
+
+    # Stores the state in session so it can be verified later when Google redirects back.
+    session["state"] = state
+
+    return redirect(auth_url)
 
 
 @app.route("/callback/oauth2callback")
@@ -771,17 +2581,10 @@ def oauth2callback():
     # Retrieves the state token from session to verify that this callback is legitimate.
     state = session["state"]
 
-    print("[OAuth2 Callback] State:", state)
-    print("[OAuth2 Callback] Request URL:", request.url)
-    print("[OAuth2 Callback] Request args:", request.args)
+    logger.debug("OAuth2 callback", extra={"state": state, "url": request.url})
 
     # Sets up the OAuth flow again with the same config to complete token exchange.
-    flow = Flow.from_client_config(
-        client_config,
-        scopes=OAUTH_SCOPES,
-        state=state,
-        redirect_uri=OAUTH_REDIRECT_URI
-    )
+    flow = oauth_flow(state=state)
 
     try:
         # Exchanges the authorization response URL for a set of access tokens.
@@ -802,48 +2605,431 @@ def oauth2callback():
             "scopes": creds.scopes
         }
         
-        # Clean up the state from session
+        # Clean up the state from session (and any email cached for a previous login)
         session.pop("state", None)
+        session.pop("email", None)
         
         flash("Successfully authenticated!", FLASH_SUCCESS)
         return redirect("/")
         
     except Exception as e:
-        import traceback
-        print(f"[OAuth2 Callback] Error type: {type(e).__name__}")
-        print(f"[OAuth2 Callback] Error message: {e}")
-        print(f"[OAuth2 Callback] Request URL: {request.url}")
-        print(f"[OAuth2 Callback] Request args: {request.args}")
-        print(f"[OAuth2 Callback] Flow state: {getattr(flow, 'state', 'No state')}")
-        print(f"[OAuth2 Callback] Session state: {session.get('state', 'No state')}")
-        print(f"[OAuth2 Callback] Traceback: {traceback.format_exc()}")
+        logger.exception("OAuth2 callback failed", extra={
+            "error_type": type(e).__name__,
+            "url": request.url,
+            "flow_state": getattr(flow, "state", None),
+            "session_state": session.get("state"),
+        })
         flash(f"Authentication failed: {str(e)}", FLASH_DANGER)
         return redirect("/authorize")
 
-def get_thumbnail_url(file_id, creds):
-    service = build("drive", GOOGLE_DRIVE_API_VERSION, credentials=creds)
-    try:
-        file = service.files().get(
-            fileId=file_id,
-            fields=DRIVE_THUMBNAIL_FIELDS,
-            supportsAllDrives=True
-        ).execute()
-        return file.get("thumbnailLink")
-    except Exception as e:
-        print(f"Error retrieving thumbnail for {file_id}: {e}")
-        return None
+@app.route("/dev/login")
+def dev_login():
+    """Signs in as ?email= without OAuth. 404 unless DEV_LOGIN_ENABLED and the client is local."""
+    if not DEV_LOGIN_ENABLED or request.remote_addr not in LOOPBACK_ADDRESSES:
+        abort(404)
+
+    email = request.args.get("email", "").strip().lower()
+    if email not in ALLOWED_USERS:
+        return abort(403, description="You are not authorized to access this application.")
+
+    # Any token works against the fake Drive; Credentials() only needs one to be present
+    session["credentials"] = {"token": DEV_LOGIN_TOKEN}
+    session["email"] = email
+    return redirect("/")
+
+def get_user_email(creds):
+    """
+    Returns the signed-in user's email.
+    The userinfo API is only called once per session; the result is cached in the session cookie.
+    """
+    email = session.get("email")
+    if not email:
+        oauth2_service = google_service("oauth2", OAUTH2_API_VERSION, creds)
+        user_info = drive_execute(oauth2_service.userinfo().get())
+        email = user_info.get("email")
+        session["email"] = email
+    return email
+
+def get_thumbnail_url(file_id, creds):
+    service = google_service("drive", GOOGLE_DRIVE_API_VERSION, creds)
+    try:
+        file = drive_execute(service.files().get(
+            fileId=file_id,
+            fields=DRIVE_THUMBNAIL_FIELDS,
+            supportsAllDrives=True
+        ))
+        return file.get("thumbnailLink")
+    except Exception as e:
+        logger.warning("Error retrieving thumbnail for %s: %s", file_id, e)
+        return None
+
+### - Fragment Cache - ###
+# Rendered parts of index.html keyed on (catalog version, page, q). Every write bumps the
+# catalog version, so stale entries are never served; they just age out of the LRU.
+_fragment_lru = OrderedDict()
+_fragment_lock = threading.Lock()
+_template_fingerprint = None
+
+
+def init_fragment_cache():
+    conn = connect_db(FRAGMENT_CACHE_DB)
+    c = conn.cursor()
+    c.execute("PRAGMA journal_mode=WAL")
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS fragment_cache (
+            key TEXT PRIMARY KEY,
+            version INTEGER,
+            body TEXT,
+            used_at REAL
+        )
+    """)
+    conn.commit()
+    conn.close()
+
+
+def fragment_key(name, version, key_parts):
+    """
+    Builds the cache key. A fingerprint of the templates is included so a deploy
+    with changed templates never picks up fragments rendered by the old ones.
+    """
+    global _template_fingerprint
+    if _template_fingerprint is None:
+        digest = hashlib.md5()
+        template_dir = os.path.join(app.root_path, app.template_folder)
+        for filename in sorted(os.listdir(template_dir)):
+            with open(os.path.join(template_dir, filename), "rb") as f:
+                digest.update(f.read())
+        _template_fingerprint = digest.hexdigest()[:8]
+
+    return codec.dumps([_template_fingerprint, name, version, *key_parts])
+
+
+def get_cached_fragment(key):
+    with _fragment_lock:
+        body = _fragment_lru.get(key)
+        if body is not None:
+            _fragment_lru.move_to_end(key)
+            return body
+
+    # Fall back to the store shared with the other workers
+    try:
+        conn = connect_db(FRAGMENT_CACHE_DB)
+        c = conn.cursor()
+        c.execute("SELECT body FROM fragment_cache WHERE key = ?", (key,))
+        row = c.fetchone()
+        if row:
+            c.execute("UPDATE fragment_cache SET used_at = ? WHERE key = ?", (time.time(), key))
+            conn.commit()
+        conn.close()
+    except sqlite3.Error as e:
+        logger.warning("Fragment cache shared store read failed: %s", e)
+        return None
+
+    if not row:
+        return None
+
+    remember_fragment(key, row[0])
+    return row[0]
+
+
+def remember_fragment(key, body):
+    with _fragment_lock:
+        _fragment_lru[key] = body
+        _fragment_lru.move_to_end(key)
+        while len(_fragment_lru) > FRAGMENT_CACHE_SIZE:
+            _fragment_lru.popitem(last=False)
+
+
+def put_cached_fragment(key, version, body):
+    remember_fragment(key, body)
+
+    try:
+        conn = connect_db(FRAGMENT_CACHE_DB)
+        c = conn.cursor()
+        c.execute(
+            "INSERT OR REPLACE INTO fragment_cache (key, version, body, used_at) VALUES (?, ?, ?, ?)",
+            (key, version, body, time.time())
+        )
+        # Entries for older catalog versions can never be hit again
+        c.execute("DELETE FROM fragment_cache WHERE version < ?", (version,))
+        c.execute("""
+            DELETE FROM fragment_cache WHERE key NOT IN (
+                SELECT key FROM fragment_cache ORDER BY used_at DESC LIMIT ?
+            )
+        """, (FRAGMENT_CACHE_SHARED_SIZE,))
+        conn.commit()
+        conn.close()
+    except sqlite3.Error as e:
+        logger.warning("Fragment cache shared store write failed: %s", e)
+
+
+def cached_fragment(name, template_name, build_context, *key_parts):
+    """
+    Returns the rendered template fragment for the current catalog version,
+    rendering it (and calling build_context) only on a cache miss.
+    """
+    version = request_catalog_version()
+    key = fragment_key(name, version, key_parts)
+    body = get_cached_fragment(key)
+    if body is None:
+        body = render_template(template_name, **build_context())
+        # Stored under the version read before building: writes made meanwhile can only leave the
+        # entry newer than its key, never older. A build that itself wrote (thumbnail refresh) has
+        # already moved the catalog past the key, so its output isn't stored at all.
+        if request_catalog_version() == version:
+            put_cached_fragment(key, version, body)
+    return Markup(body)
+
+
+### - Search - ###
+# Search queries (see tag_query.py for the syntax) run against an inverted index: by default
+# each worker's MemoryTagIndex, or with SEARCH_INDEX=sqlite the image_tags table, which
+# triggers on images keep current (tag counts for its planner come from tag_counts).
+app.add_template_filter(tag_query.quote, "search_term")
+SEARCH_PROBE_CHUNK_SIZE = 500  # IDs per "IN (...)" when probing the index for candidates
+
+
+class CatalogTagIndex:
+    """The tag_query index interface over image_tags (tags) and images (id: terms), on one cursor."""
+
+    def __init__(self, c):
+        self.c = c
+        self._counts = {}
+
+    @staticmethod
+    def _source(term):
+        """(table, ID column, condition, parameters) for the rows matching term."""
+        table, column, id_column = ("images", "id", "id") if term.field == "id" else ("image_tags", "tag", "image_id")
+        if term.prefix:
+            upper = tag_query.prefix_end(term.value)
+            if upper is None:
+                return table, id_column, f"{column} >= ?", [term.value]
+            return table, id_column, f"{column} >= ? AND {column} < ?", [term.value, upper]
+        return table, id_column, f"{column} = ?", [term.value]
+
+    def count(self, term):
+        if term not in self._counts:
+            if term.field == "tag":
+                # tag_counts has the same key as image_tags, so the condition carries over
+                _, _, condition, params = self._source(term)
+                self.c.execute(f"SELECT COALESCE(SUM(count), 0) FROM tag_counts WHERE {condition}", params)
+            else:
+                table, _, condition, params = self._source(term)
+                self.c.execute(f"SELECT COUNT(*) FROM {table} WHERE {condition}", params)
+            self._counts[term] = self.c.fetchone()[0]
+        return self._counts[term]
+
+    def postings(self, term):
+        table, id_column, condition, params = self._source(term)
+        self.c.execute(f"SELECT {id_column} FROM {table} WHERE {condition}", params)
+        return {row[0] for row in self.c.fetchall()}
+
+    def probe(self, term, candidates):
+        table, id_column, condition, params = self._source(term)
+        candidates = list(candidates)
+        matched = set()
+        for start in range(0, len(candidates), SEARCH_PROBE_CHUNK_SIZE):
+            chunk = candidates[start:start + SEARCH_PROBE_CHUNK_SIZE]
+            self.c.execute(
+                f"SELECT {id_column} FROM {table} WHERE {condition} AND {id_column} IN ({','.join('?' for _ in chunk)})",
+                params + chunk
+            )
+            matched.update(row[0] for row in self.c.fetchall())
+        return matched
+
+    def all_ids(self):
+        self.c.execute("SELECT id FROM images")
+        return {row[0] for row in self.c.fetchall()}
+
+    def image_ids(self, keys):
+        return sorted(keys)
+
+
+class MemoryTagIndex:
+    """
+    The tag_query index interface held in a worker's memory. Photos are numbered with dense
+    ordinals, and each tag has a sorted array('I') of the ordinals carrying it (4 bytes per
+    tag assignment). refresh() catches up from image_tag_changes, whose triggers record every
+    tag change with the tags before and after; a worker that fell behind the trimmed log
+    rebuilds from image_tags instead. Callers hold _tag_index_lock.
+    """
+
+    def __init__(self):
+        self.seq = None          # Last image_tag_changes entry applied; None until built
+        self.ids = []            # Ordinal -> image ID (None once deleted)
+        self.ordinals = {}       # Image ID -> ordinal
+        self.sorted_ids = []     # Image IDs in order, for id: prefixes
+        self.tag_ids = {}        # Tag -> tag ID
+        self.lists = []          # Tag ID -> ordinals carrying the tag, ascending
+        self.sorted_tags = None  # Tags in order, for prefixes; None after a new tag appears
+
+    def build(self, c):
+        # The log position is read first: changes made while building are applied again by refresh(), harmlessly
+        c.execute("SELECT COALESCE(MAX(seq), 0) FROM image_tag_changes")
+        self.seq = c.fetchone()[0]
+        c.execute("SELECT id FROM images ORDER BY id")
+        self.ids = [row[0] for row in c.fetchall()]
+        self.ordinals = {image_id: ordinal for ordinal, image_id in enumerate(self.ids)}
+        self.sorted_ids = list(self.ids)
+        self.tag_ids = {}
+        self.lists = []
+        self.sorted_tags = None
+        # Ordinals follow ID order, so each tag's list comes out sorted
+        c.execute("SELECT tag, image_id FROM image_tags ORDER BY tag, image_id")
+        for tag, rows in itertools.groupby(c, key=lambda row: row[0]):
+            ordinals = array("I", (self.ordinals[image_id] for _, image_id in rows if image_id in self.ordinals))
+            self.tag_ids[tag] = len(self.lists)
+            self.lists.append(ordinals)
+        logger.debug("Built tag index: %d photos, %d tags", len(self.ids), len(self.lists))
+
+    def refresh(self, c):
+        # MIN and MAX in separate queries: each alone is a single index lookup
+        c.execute("SELECT MAX(seq) FROM image_tag_changes")
+        last = c.fetchone()[0]
+        if self.seq is None:
+            self.build(c)
+            return
+        if last is None or last <= self.seq:
+            return
+        c.execute("SELECT MIN(seq) FROM image_tag_changes")
+        first = c.fetchone()[0]
+        if first > self.seq + 1:
+            self.build(c)
+            return
+
+        c.execute("SELECT seq, image_id, deleted, old_tags, new_tags FROM image_tag_changes WHERE seq > ? ORDER BY seq",
+                  (self.seq,))
+        for seq, image_id, deleted, old_tags, new_tags in c.fetchall():
+            self.apply(image_id, deleted, old_tags, new_tags)
+            self.seq = seq
+
+        # Whichever worker notices the log has grown trims it
+        if last - first > 2 * TAG_INDEX_CHANGE_LOG_KEEP:
+            c.execute("DELETE FROM image_tag_changes WHERE seq <= ?", (last - TAG_INDEX_CHANGE_LOG_KEEP,))
+            c.connection.commit()
+
+    @staticmethod
+    def _tags(tags_json):
+        # Same tags the image_tags triggers index: the distinct strings of a valid JSON list
+        try:
+            tags = decode_json(tags_json) if tags_json else None
+        except ValueError:
+            return set()
+        return {tag for tag in tags if isinstance(tag, str)} if isinstance(tags, list) else set()
+
+    def apply(self, image_id, deleted, old_tags, new_tags):
+        ordinal = self.ordinals.get(image_id)
+        if ordinal is None:
+            if deleted:
+                return
+            ordinal = self.ordinals[image_id] = len(self.ids)
+            self.ids.append(image_id)
+            bisect.insort(self.sorted_ids, image_id)
+
+        for tag in self._tags(old_tags):
+            ordinals = self.lists[self.tag_ids[tag]] if tag in self.tag_ids else ()
+            position = bisect.bisect_left(ordinals, ordinal)
+            if position < len(ordinals) and ordinals[position] == ordinal:
+                ordinals.pop(position)
+
+        if deleted:
+            self.ids[ordinal] = None
+            del self.ordinals[image_id]
+            self.sorted_ids.pop(bisect.bisect_left(self.sorted_ids, image_id))
+            return
+
+        for tag in self._tags(new_tags):
+            if tag not in self.tag_ids:
+                self.tag_ids[tag] = len(self.lists)
+                self.lists.append(array("I"))
+                self.sorted_tags = None
+            ordinals = self.lists[self.tag_ids[tag]]
+            position = bisect.bisect_left(ordinals, ordinal)
+            if position == len(ordinals) or ordinals[position] != ordinal:
+                ordinals.insert(position, ordinal)
+
+    def _tag_lists(self, term):
+        if not term.prefix:
+            tag_id = self.tag_ids.get(term.value)
+            return [] if tag_id is None else [self.lists[tag_id]]
+        if self.sorted_tags is None:
+            self.sorted_tags = sorted(self.tag_ids)
+        start = bisect.bisect_left(self.sorted_tags, term.value)
+        upper = tag_query.prefix_end(term.value)
+        end = len(self.sorted_tags) if upper is None else bisect.bisect_left(self.sorted_tags, upper)
+        return [self.lists[self.tag_ids[tag]] for tag in self.sorted_tags[start:end]]
+
+    def _id_ordinals(self, term):
+        if not term.prefix:
+            ordinal = self.ordinals.get(term.value)
+            return set() if ordinal is None else {ordinal}
+        start = bisect.bisect_left(self.sorted_ids, term.value)
+        upper = tag_query.prefix_end(term.value)
+        end = len(self.sorted_ids) if upper is None else bisect.bisect_left(self.sorted_ids, upper)
+        return {self.ordinals[image_id] for image_id in self.sorted_ids[start:end]}
+
+    def count(self, term):
+        if term.field == "id":
+            return len(self._id_ordinals(term))
+        return sum(len(ordinals) for ordinals in self._tag_lists(term))
+
+    def postings(self, term):
+        if term.field == "id":
+            return self._id_ordinals(term)
+        matched = set()
+        for ordinals in self._tag_lists(term):
+            matched.update(ordinals)
+        return matched
+
+    def probe(self, term, candidates):
+        if term.field == "id":
+            return candidates & self._id_ordinals(term)
+        matched = set()
+        for ordinals in self._tag_lists(term):
+            for ordinal in candidates:
+                position = bisect.bisect_left(ordinals, ordinal)
+                if position < len(ordinals) and ordinals[position] == ordinal:
+                    matched.add(ordinal)
+        return matched
+
+    def all_ids(self):
+        return set(self.ordinals.values())
+
+    def image_ids(self, keys):
+        # A photo deleted and re-added while the index was being built can leave its old ordinal behind
+        return sorted(image_id for image_id in map(self.ids.__getitem__, keys) if image_id is not None)
+
+
+_tag_index = MemoryTagIndex()
+_tag_index_lock = threading.Lock()
+
+
+def search_image_ids(search_query):
+    """IDs of the photos matching a search query, in ID order. Raises tag_query.QueryError if it is malformed."""
+    node = tag_query.parse(search_query)
+    conn = connect_db()
+    c = conn.cursor()
+    with timed("search"):
+        if SEARCH_INDEX == "sqlite":
+            index = CatalogTagIndex(c)
+            matching_ids = index.image_ids(tag_query.evaluate(node, index))
+        else:
+            with _tag_index_lock:
+                _tag_index.refresh(c)
+                matching_ids = _tag_index.image_ids(tag_query.evaluate(node, _tag_index))
+    conn.close()
+    return matching_ids
+
 
 ### - Main Route - ###
 @app.route("/", methods=["GET", "POST"])
 def index():
     if "credentials" not in session:
-        print("No credentials found in session, redirecting to authorize.")
+        logger.debug("No credentials found in session, redirecting to authorize.")
         return redirect("/authorize")
 
-    creds = Credentials(**session["credentials"])
-    oauth2_service = build("oauth2", OAUTH2_API_VERSION, credentials=creds)
-    user_info = oauth2_service.userinfo().get().execute()
-    email = user_info.get("email")
+    creds = load_credentials(session["credentials"])
+    email = get_user_email(creds)
 
     if email not in ALLOWED_USERS:
         return abort(403, description="You are not authorized to access this application.")
@@ -856,20 +3042,7 @@ def index():
         if photo_id and new_tag:
             # Handle individual photo tagging
             tags_to_add = [t.strip() for t in new_tag.split(",") if t.strip()]
-            
-            # Get current tags for this photo from database
-            conn = sqlite3.connect(DB_FILE)
-            c = conn.cursor()
-            c.execute("SELECT tags FROM images WHERE id = ?", (photo_id,))
-            result = c.fetchone()
-            conn.close()
-            
-            if result:
-                current_tags = json.loads(result[0])
-                for tag in tags_to_add:
-                    if tag not in current_tags:
-                        current_tags.append(tag)
-                save_item(photo_id, current_tags)
+            add_tags(photo_id, tags_to_add)
             
             return redirect(f"/?{request.query_string.decode()}")  # Preserve search/page params
 
@@ -886,14 +3059,14 @@ def index():
             if match_file:
                 file_id = match_file.group(1)
                 # Check if file already exists
-                conn = sqlite3.connect(DB_FILE)
+                conn = connect_db()
                 c = conn.cursor()
                 c.execute("SELECT tags FROM images WHERE id = ?", (file_id,))
                 existing = c.fetchone()
                 conn.close()
                 
                 if existing:
-                    existing_tags = json.loads(existing[0])
+                    existing_tags = decode_tags(existing[0])
                     for tag in tag_list:
                         if tag not in existing_tags:
                             existing_tags.append(tag)
@@ -902,93 +3075,126 @@ def index():
                     save_item(file_id, tag_list)
 
             elif match_folder:
+                # Folders are imported in the background; the page shows the progress
                 folder_id = match_folder.group(1)
-                image_ids = list_images_in_folder(folder_id, creds)
-                for file_id in image_ids:
-                    # Check if file already exists  
-                    conn = sqlite3.connect(DB_FILE)
-                    c = conn.cursor()
-                    c.execute("SELECT tags FROM images WHERE id = ?", (file_id,))
-                    existing = c.fetchone()
-                    conn.close()
-                    
-                    if existing:
-                        existing_tags = json.loads(existing[0])
-                        for tag in tag_list:
-                            if tag not in existing_tags:
-                                existing_tags.append(tag)
-                        save_item(file_id, existing_tags)
-                    else:
-                        save_item(file_id, tag_list)
+                start_ingest_job(folder_id, tag_list, creds)
+                flash(f"Importing folder {folder_id}. Progress is shown below.", FLASH_INFO)
 
         return redirect("/")
 
     # GET request handling - Load and display data
+    schedule_folder_syncs(creds)
+
     page = int(request.args.get("page", DEFAULT_PAGE))
     per_page = ITEMS_PER_PAGE
-    search_query = request.args.get("q", "").strip().lower()
+    search_query = request.args.get("q", "").strip()
+    if search_query:
+        try:
+            tag_query.parse(search_query)
+        except tag_query.QueryError as e:
+            flash(f"Invalid search: {e}.", FLASH_WARNING)
+            return redirect("/")
+
+    # Each part of the page is a fragment cached on (catalog version, page, q).
+    # The page data is only loaded when a fragment that needs it misses the cache.
+    page_state = {}
+
+    def page_data():
+        if not page_state:
+            data, total_pages = load_page(page, per_page, search_query, creds)
+            page_state.update(data=data, total_pages=total_pages)
+        return page_state
+
+    def grid_context():
+        state = page_data()
+        data = state["data"]
+
+        # The infinite-scroll grid continues page 1 from /api/images, starting after its last ID
+        next_cursor = None
+        if page == 1 and state["total_pages"] > 1 and data:
+            next_cursor = encode_cursor(max(item.id for item in data))
+
+        return {
+            "data": data,
+            "page": page,
+            "total_pages": state["total_pages"],
+            "next_cursor": next_cursor,
+            "search_query": search_query,
+        }
+
+    tag_state = {}
+
+    def tag_context():
+        if not tag_state:
+            # Get all unique tags (with their library-wide counts) for the tag dropdown
+            tag_counts = count_tags()
+            if search_query:
+                # For search results, only show tags from visible results
+                all_tags = sorted({tag for item in page_data()["data"] for tag in item.tags})
+            else:
+                # For normal view, show all tags in database
+                all_tags = sorted(tag_counts)
+            tag_state.update(all_tags=all_tags, tag_counts=tag_counts)
+        return tag_state
+
+    # The grid goes first: refreshing its thumbnails bumps the version the other fragments are keyed on
+    grid_html = cached_fragment("grid", "_grid.html", grid_context, page, search_query)
+
+    # In search mode the tag list comes from the visible results, so it is keyed like the grid
+    tag_key = (page, search_query) if search_query else ()
+    tag_cloud_html = cached_fragment("tag_cloud", "_tag_cloud.html", tag_context, *tag_key)
+    tag_options_html = cached_fragment("tag_options", "_tag_options.html", tag_context, *tag_key)
+
+    # Load backups list
+    backups_html = cached_fragment("backups", "_backups.html", lambda: {"backups": list_backups()})
+
+    # Load watched folders list
+    folders_html = cached_fragment("folders", "_folders.html", lambda: {"folders": list_folders()})
+
+    # Folder imports in progress (not cached: their counts change without a catalog write)
+    ingest_jobs = recent_ingest_jobs()
 
+    return render_template("index.html",
+        grid_html=grid_html,
+        tag_cloud_html=tag_cloud_html,
+        tag_options_html=tag_options_html,
+        backups_html=backups_html,
+        folders_html=folders_html,
+        ingest_jobs=ingest_jobs,
+        ingest_poll_seconds=INGEST_POLL_SECONDS,
+        search_query=search_query
+    )
+
+def load_page(page, per_page, search_query, creds):
+    """
+    Loads one page of the grid (refreshing stale thumbnails on it).
+    Returns (data, total_pages).
+    """
     # Get total count and filtered count for proper pagination
-    conn = sqlite3.connect(DB_FILE)
+    conn = connect_db()
     c = conn.cursor()
     
     if search_query:
-        # If searching, we need to handle this differently
-        # Get ALL data first, then filter, then paginate
-        c.execute("SELECT id, tags, thumbnail FROM images ORDER BY id")
-        all_rows = c.fetchall()
-        
-        # Build the full dataset
-        all_data = []
-        expired_files = {}
-        
-        for file_id, tag_str, thumb in all_rows:
-            if not thumb or is_expired_thumbnail(thumb):
-                expired_files[file_id] = tag_str
-            else:
-                all_data.append({
-                    "id": file_id,
-                    "tags": json.loads(tag_str),
-                    "thumb_url": thumb
-                })
-        
-        # Add expired files with placeholder thumbnails for now
-        for file_id, tag_str in expired_files.items():
-            all_data.append({
-                "id": file_id,
-                "tags": json.loads(tag_str),
-                "thumb_url": DEFAULT_THUMBNAIL
-            })
-        
-        # Apply search filter
-        terms = [q.strip() for q in search_query.split(",") if q.strip()]
-        def matches_all(item):
-            return all(
-                term in item["id"].lower() or any(term in t.lower() for t in item["tags"])
-                for term in terms
-            )
-        
-        filtered_data = [item for item in all_data if matches_all(item)]
-        
-        # Calculate pagination for filtered results
-        total_filtered = len(filtered_data)
-        total_pages = (total_filtered + per_page - 1) // per_page if total_filtered > 0 else 1
-        
-        # Apply pagination to filtered results
-        start_idx = (page - 1) * per_page
-        end_idx = start_idx + per_page
-        data = filtered_data[start_idx:end_idx]
-        
-        # Now refresh expired thumbnails for the current page only
+        # The query runs against the image_tags index; only the requested page is read from images
+        matching_ids = search_image_ids(search_query)
+        total_pages = (len(matching_ids) + per_page - 1) // per_page if matching_ids else 1
+        page_ids = matching_ids[(page - 1) * per_page:page * per_page]
+
+        rows = {}
+        if page_ids:
+            c.execute(f"SELECT id, tags, thumbnail FROM images WHERE id IN ({','.join('?' for _ in page_ids)})", page_ids)
+            rows = {file_id: (tag_str, thumb) for file_id, tag_str, thumb in c.fetchall()}
+
+        # Expired thumbnails get the placeholder until the refresh below replaces them
+        data = []
         page_expired_files = {}
-        for item in data:
-            if item["thumb_url"] == DEFAULT_THUMBNAIL:
-                # Find the original tag string for this file
-                for fid, tag_str in expired_files.items():
-                    if fid == item["id"]:
-                        page_expired_files[fid] = tag_str
-                        break
-        
+        for file_id in page_ids:
+            tag_str, thumb = rows[file_id]
+            if not thumb or is_expired_thumbnail(thumb):
+                page_expired_files[file_id] = tag_str
+                thumb = DEFAULT_THUMBNAIL
+            data.append(ImageRecord(file_id, tag_str, thumb))
+
         # Refresh thumbnails for current page
         if page_expired_files and "credentials" in session:
             refresh_thumbnails_batch(page_expired_files, data, creds)
@@ -1003,36 +3209,7 @@ def index():
     
     conn.close()
 
-    # Get all unique tags for the tag dropdown
-    all_tags_set = set()
-    if search_query:
-        # For search results, only show tags from visible results
-        for item in data:
-            all_tags_set.update(item["tags"])
-    else:
-        # For normal view, show all tags in database
-        conn = sqlite3.connect(DB_FILE)
-        c = conn.cursor()
-        c.execute("SELECT tags FROM images")
-        for row in c.fetchall():
-            if row[0]:  # Check if tags is not None
-                tags = json.loads(row[0])
-                all_tags_set.update(tags)
-        conn.close()
-    
-    all_tags = sorted(all_tags_set)
-
-    # Load backups list
-    backups = list_backups()
-
-    return render_template("index.html",
-        data=data,
-        all_tags=all_tags,
-        backups=backups,
-        page=page,
-        total_pages=total_pages,
-        search_query=search_query
-    )
+    return data, total_pages
 
 def refresh_thumbnails_batch(expired_files, data, creds):
     """Helper function to refresh thumbnails for a batch of files"""
@@ -1040,54 +3217,197 @@ def refresh_thumbnails_batch(expired_files, data, creds):
         return
         
     try:
-        service = build("drive", GOOGLE_DRIVE_API_VERSION, credentials=creds)
-        batch = BatchHttpRequest(batch_uri='https://www.googleapis.com/batch/drive/v3')
-        refreshed_thumbnails = {}
-
-        def callback(request_id, response, exception):
-            if exception:
-                print(f"Thumbnail fetch failed for {request_id}: {exception}")
-                refreshed_thumbnails[request_id] = DEFAULT_THUMBNAIL
+        refreshed_thumbnails = refresh_thumbnails_single_flight(list(expired_files.keys()), creds)
+    except Exception as e:
+        # Items keep their default thumbnails; the next page view tries again
+        logger.warning("Batch thumbnail refresh failed: %s", e)
+        return
+
+    for item in data:
+        if item.id in refreshed_thumbnails:
+            item.thumb_url = refreshed_thumbnails[item.id]
+
+
+### - Thumbnail Single-Flight - ###
+# Concurrent page loads often find the same stale thumbnails. Each file ID is fetched from
+# Drive by one request at a time: other threads in this worker wait on its in-flight entry,
+# and other workers see its claim in thumbnail_refresh_locks and wait for the claim to go.
+class ThumbnailFlight:
+    __slots__ = ("done", "thumbnail")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.thumbnail = None
+
+
+_thumbnail_flights = {}
+_thumbnail_flights_lock = threading.Lock()
+
+
+def fetch_thumbnails_from_drive(file_ids, creds):
+    """
+    Drive batches of files.get calls. Returns {file_id: thumbnail URL or DEFAULT_THUMBNAIL}.
+    Parts that fail with a rate-limit or transient error are retried in a smaller batch.
+    """
+    service = google_service("drive", GOOGLE_DRIVE_API_VERSION, creds)
+    refreshed_thumbnails = {}
+    fetched_files = []
+    pending = list(file_ids)
+    retry = []  # (file_id, exception) of this round's parts to try again
+    can_retry = True
+
+    def callback(request_id, response, exception):
+        if exception:
+            if can_retry and rate_limit.is_retryable(exception):
+                retry.append((request_id, exception))
                 return
-            
-            new_thumbnail = response.get("thumbnailLink")
-            if new_thumbnail and is_valid_thumbnail(new_thumbnail):
-                refreshed_thumbnails[request_id] = new_thumbnail
-            else:
-                refreshed_thumbnails[request_id] = DEFAULT_THUMBNAIL
+            logger.debug("Thumbnail fetch failed for %s: %s", request_id, exception)
+            refreshed_thumbnails[request_id] = DEFAULT_THUMBNAIL
+            return
+
+        fetched_files.append(response)
+        new_thumbnail = response.get("thumbnailLink")
+        if new_thumbnail and is_valid_thumbnail(new_thumbnail):
+            refreshed_thumbnails[request_id] = new_thumbnail
+        else:
+            refreshed_thumbnails[request_id] = DEFAULT_THUMBNAIL
 
-        for file_id in expired_files.keys():
+    for attempt in range(DRIVE_MAX_RETRIES + 1):
+        batch = drive_batch()
+        retry.clear()
+        can_retry = attempt < DRIVE_MAX_RETRIES
+
+        for file_id in pending:
             batch.add(
                 service.files().get(
                     fileId=file_id,
-                    fields=DRIVE_THUMBNAIL_FIELDS,
+                    fields=DRIVE_FILE_FIELDS,
                     supportsAllDrives=True
                 ),
                 request_id=file_id,
                 callback=callback
             )
 
-        batch.execute()
-        
-        # Update both the data list and the database
-        conn = sqlite3.connect(DB_FILE)
-        c = conn.cursor()
-        
-        for item in data:
-            if item["id"] in refreshed_thumbnails:
-                new_thumb = refreshed_thumbnails[item["id"]]
-                item["thumb_url"] = new_thumb
-                c.execute("UPDATE images SET thumbnail = ? WHERE id = ?", (new_thumb, item["id"]))
-        
-        conn.commit()
-        conn.close()
-        
-    except Exception as e:
-        print(f"Batch thumbnail refresh failed: {e}")
-        # Fallback: just use default thumbnails
-        for item in data:
-            if item["thumb_url"] == DEFAULT_THUMBNAIL:
-                pass  # Already set to default
+        drive_execute(batch)
+        if not retry:
+            break
+
+        logger.debug("Retrying %d thumbnail fetches (attempt %d)", len(retry), attempt + 1)
+        drive_limiter.wait_before_retry(retry[0][1], attempt, user=drive_user())
+        pending = [file_id for file_id, _ in retry]
+
+    # The rest of the metadata comes along for free
+    remember_drive_files(fetched_files)
+    return refreshed_thumbnails
+
+
+def claim_thumbnail_refresh(file_ids, owner):
+    """Claims the IDs no other worker is fetching. Returns the claimed IDs."""
+    now = time.time()
+    conn = connect_db()
+    c = conn.cursor()
+    c.execute("DELETE FROM thumbnail_refresh_locks WHERE expires_at < ?", (now,))
+    c.executemany(
+        "INSERT OR IGNORE INTO thumbnail_refresh_locks (file_id, owner, expires_at) VALUES (?, ?, ?)",
+        [(file_id, owner, now + THUMBNAIL_CLAIM_TTL_SECONDS) for file_id in file_ids]
+    )
+    c.execute("SELECT file_id FROM thumbnail_refresh_locks WHERE owner = ?", (owner,))
+    claimed = [row[0] for row in c.fetchall()]
+    conn.commit()
+    conn.close()
+    return claimed
+
+
+def release_thumbnail_claims(owner, thumbnails=None):
+    """Saves the fetched thumbnails (if any) and drops the claims in one transaction."""
+    conn = connect_db()
+    c = conn.cursor()
+    if thumbnails:
+        # Rows whose thumbnail came back unchanged (a placeholder for a file Drive no longer has) aren't rewritten
+        c.executemany(
+            "UPDATE images SET thumbnail = ? WHERE id = ? AND thumbnail IS NOT ?",
+            [(thumb, file_id, thumb) for file_id, thumb in thumbnails.items()]
+        )
+        if c.rowcount > 0:
+            bump_catalog_version(c)
+    c.execute("DELETE FROM thumbnail_refresh_locks WHERE owner = ?", (owner,))
+    conn.commit()
+    conn.close()
+
+
+def wait_for_other_workers(file_ids):
+    """Waits until other workers' claims on file_ids are gone, then reads what they saved."""
+    deadline = time.monotonic() + THUMBNAIL_WAIT_SECONDS
+    pending = list(file_ids)
+    conn = connect_db()
+    c = conn.cursor()
+
+    with timed("thumbnail_wait"):
+        while pending and time.monotonic() < deadline:
+            time.sleep(THUMBNAIL_POLL_SECONDS)
+            placeholders = ",".join("?" for _ in pending)
+            c.execute(
+                f"SELECT file_id FROM thumbnail_refresh_locks WHERE file_id IN ({placeholders}) AND expires_at >= ?",
+                (*pending, time.time())
+            )
+            still_claimed = {row[0] for row in c.fetchall()}
+            pending = [file_id for file_id in pending if file_id in still_claimed]
+
+    placeholders = ",".join("?" for _ in file_ids)
+    c.execute(f"SELECT id, thumbnail FROM images WHERE id IN ({placeholders})", list(file_ids))
+    thumbnails = {file_id: thumb for file_id, thumb in c.fetchall() if thumb}
+    conn.close()
+    return thumbnails
+
+
+def refresh_thumbnails_single_flight(file_ids, creds):
+    """
+    Returns {file_id: thumbnail} for file_ids, fetching each from Drive at most once among
+    concurrent requests, and saves the fetched ones. IDs missing from the result could not
+    be refreshed (the caller shows the default thumbnail). Raises if this request's own
+    Drive batch fails.
+    """
+    owner = uuid.uuid4().hex
+    mine, joined = {}, {}
+    with _thumbnail_flights_lock:
+        for file_id in dict.fromkeys(file_ids):
+            flight = _thumbnail_flights.get(file_id)
+            if flight is None:
+                mine[file_id] = _thumbnail_flights[file_id] = ThumbnailFlight()
+            else:
+                joined[file_id] = flight
+
+    results = {}
+    try:
+        if mine:
+            claimed = claim_thumbnail_refresh(list(mine), owner)
+            if claimed:
+                try:
+                    fetched = fetch_thumbnails_from_drive(claimed, creds)
+                except Exception:
+                    release_thumbnail_claims(owner)
+                    raise
+                release_thumbnail_claims(owner, fetched)
+                results.update(fetched)
+
+            claimed_elsewhere = [file_id for file_id in mine if file_id not in results]
+            if claimed_elsewhere:
+                results.update(wait_for_other_workers(claimed_elsewhere))
+    finally:
+        with _thumbnail_flights_lock:
+            for file_id, flight in mine.items():
+                flight.thumbnail = results.get(file_id)
+                flight.done.set()
+                _thumbnail_flights.pop(file_id, None)
+
+    if joined:
+        with timed("thumbnail_wait"):
+            for file_id, flight in joined.items():
+                flight.done.wait(THUMBNAIL_WAIT_SECONDS)
+                if flight.thumbnail:
+                    results[file_id] = flight.thumbnail
+
+    return results
 
 
 ### - Remove Tag - ###
@@ -1099,18 +3419,7 @@ def removetag():
     return_url = request.form.get("return_url", "/")
 
     # Load the current tags from database and remove the specified tag
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("SELECT tags FROM images WHERE id = ?", (file_id,))
-    result = c.fetchone()
-    
-    if result:
-        current_tags = json.loads(result[0])
-        if tag in current_tags:
-            current_tags.remove(tag)
-            save_item(file_id, current_tags)
-    
-    conn.close()
+    remove_tag(file_id, tag)
     return redirect(return_url)
 
 
@@ -1135,28 +3444,33 @@ def edit_tag():
         flash("Invalid tag rename.", FLASH_DANGER)
         return redirect("/")
 
-    conn = sqlite3.connect(DB_FILE)
+    conn = connect_db()
     c = conn.cursor()
 
-    # Fetch all images containing the old tag
-    c.execute("SELECT id, tags FROM images")
+    # Fetch only the images containing the old tag (image_tags is the inverted index), so a
+    # rename costs as much as its matches, not the catalog
+    c.execute("SELECT id, tags FROM images WHERE id IN (SELECT image_id FROM image_tags WHERE tag = ?)", (old_tag,))
     rows = c.fetchall()
 
-    updated = 0
+    changes = []
     for file_id, tags_json in rows:
-        tags = json.loads(tags_json)
+        tags = decode_tags(tags_json)
         if old_tag in tags:
             # Replace old_tag with new_tag
             tags = [new_tag if t == old_tag else t for t in tags]
             # Remove duplicates (in case new_tag already existed)
             tags = list(dict.fromkeys(tags))
-            # Save back
-            c.execute(
-                "UPDATE images SET tags = ? WHERE id = ?",
-                (json.dumps(tags), file_id)
-            )
-            updated += 1
+            changes.append((codec.dumps(tags), file_id))
 
+    # Save back. Only the two tags' statistics change, so they are recounted once afterwards
+    # instead of the trigger redoing every tag pair of every matched image.
+    defer_tag_stats(c)
+    c.executemany("UPDATE images SET tags = ? WHERE id = ?", changes)
+    recount_tag_stats(c, [old_tag, new_tag])
+    updated = len(changes)
+
+    if updated:
+        bump_catalog_version(c)
     conn.commit()
     conn.close()
 
@@ -1182,7 +3496,7 @@ def backup_load(backup_id):
     creds = None
     if "credentials" in session:
         try:
-            creds = Credentials(**session["credentials"])
+            creds = load_credentials(session["credentials"])
         except Exception as e:
             flash(f"Authentication error: {str(e)}", FLASH_WARNING)
             creds = None
@@ -1198,7 +3512,7 @@ def backup_load(backup_id):
 
 @app.route("/backup/delete/<int:backup_id>", methods=["POST"])
 def backup_delete(backup_id):
-    conn = sqlite3.connect(DB_FILE)
+    conn = connect_db()
     c = conn.cursor()
     
     # Get backup info before deleting for the flash message
@@ -1207,6 +3521,7 @@ def backup_delete(backup_id):
     
     c.execute("DELETE FROM backups WHERE id = ?", (backup_id,))
     deleted_rows = c.rowcount
+    bump_catalog_version(c)
     conn.commit()
     conn.close()
 
@@ -1226,7 +3541,7 @@ def backup_refresh_thumbnails(backup_id):
         return redirect("/authorize")
     
     try:
-        creds = Credentials(**session["credentials"])
+        creds = load_credentials(session["credentials"])
         success, message = force_refresh_backup_thumbnails(backup_id, creds)
         
         if success:
@@ -1243,7 +3558,7 @@ def backup_refresh_thumbnails(backup_id):
 @app.route("/delete/all", methods=["POST"])
 def delete_all_photos():
     """Enhanced delete all that properly cleans up everything"""
-    conn = sqlite3.connect(DB_FILE)
+    conn = connect_db()
     c = conn.cursor()
     
     # Get count before deleting for flash message
@@ -1252,6 +3567,9 @@ def delete_all_photos():
     
     # Delete all images
     c.execute("DELETE FROM images")
+    c.execute("DELETE FROM image_aliases")
+    c.execute("DELETE FROM image_hashes")
+    bump_catalog_version(c)
     conn.commit()
     conn.close()
     
@@ -1266,25 +3584,25 @@ def refresh_thumbnails():
         return redirect("/authorize")
     
     try:
-        creds = Credentials(**session["credentials"])
+        creds = load_credentials(session["credentials"])
         
         # Test credentials first
-        oauth2_service = build("oauth2", OAUTH2_API_VERSION, credentials=creds)
-        user_info = oauth2_service.userinfo().get().execute()
-        print(f"[DEBUG] Authenticated as: {user_info.get('email')}")
+        oauth2_service = google_service("oauth2", OAUTH2_API_VERSION, creds)
+        user_info = drive_execute(oauth2_service.userinfo().get())
+        logger.debug("refresh_thumbnails: authenticated as %s", user_info.get("email"))
         
-        service = build("drive", GOOGLE_DRIVE_API_VERSION, credentials=creds)
+        service = google_service("drive", GOOGLE_DRIVE_API_VERSION, creds)
         
         # Test basic Drive API access
-        about = service.about().get(fields="user").execute()
-        print(f"[DEBUG] Drive API access confirmed for user: {about.get('user', {}).get('emailAddress')}")
+        about = drive_execute(service.about().get(fields="user"))
+        logger.debug("refresh_thumbnails: Drive API access confirmed for %s", about.get("user", {}).get("emailAddress"))
         
     except Exception as e:
-        print(f"[DEBUG] Authentication/API test failed: {e}")
+        logger.warning("refresh_thumbnails: authentication/API test failed: %s", e)
         flash(f"Authentication error: {str(e)}", FLASH_DANGER)
         return redirect("/authorize")
     
-    conn = sqlite3.connect(DB_FILE)
+    conn = connect_db()
     c = conn.cursor()
     
     # Get a small sample first for testing (limit to 5 files)
@@ -1301,90 +3619,79 @@ def refresh_thumbnails():
         flash("No files found to refresh.", FLASH_INFO)
         return redirect("/")
     
-    print(f"[DEBUG] Found {len(all_files)} files to process")
-    print(f"[DEBUG] Sample file IDs: {all_files[:3]}")
+    logger.info("refresh_thumbnails: %d files to process", len(all_files), extra={"sample_ids": all_files[:3]})
     
     # STEP 1: Clear existing thumbnails
     if not test_mode:
         c.execute("UPDATE images SET thumbnail = NULL")
+        bump_catalog_version(c)
         conn.commit()
     
     refreshed_count = 0
     failed_count = 0
     error_details = {}
+    progress = log_config.ProgressLog(logger, "refresh_thumbnails", total=len(all_files))
     
     # STEP 2: Process in very small batches for debugging
     batch_size = 3 if test_mode else 10  # Smaller batches for better error tracking
     
     for i in range(0, len(all_files), batch_size):
         batch_files = all_files[i:i + batch_size]
-        print(f"[DEBUG] Processing batch {i//batch_size + 1}: {batch_files}")
+        logger.debug("refresh_thumbnails: processing batch %d: %s", i // batch_size + 1, batch_files)
+        
+        fetched_files = []
         
         # Try individual requests first instead of batch for better error tracking
         for file_id in batch_files:
             try:
-                print(f"[DEBUG] Fetching thumbnail for file: {file_id}")
-                
                 # Single request with detailed error handling
-                file_metadata = service.files().get(
+                file_metadata = drive_execute(service.files().get(
                     fileId=file_id,
-                    fields="id,name,mimeType,thumbnailLink,trashed,parents",
+                    fields=DRIVE_FILE_FIELDS,
                     supportsAllDrives=True
-                ).execute()
-                
-                print(f"[DEBUG] File metadata for {file_id}:")
-                print(f"  - Name: {file_metadata.get('name', 'Unknown')}")
-                print(f"  - MimeType: {file_metadata.get('mimeType', 'Unknown')}")
-                print(f"  - Trashed: {file_metadata.get('trashed', False)}")
-                print(f"  - Has thumbnail: {'thumbnailLink' in file_metadata}")
+                ))
+                fetched_files.append(file_metadata)
                 
                 thumbnail_url = file_metadata.get("thumbnailLink")
                 
                 if thumbnail_url:
-                    print(f"[DEBUG] Got thumbnail URL: {thumbnail_url[:100]}...")
-                    
                     if is_valid_thumbnail(thumbnail_url):
                         c.execute("UPDATE images SET thumbnail = ? WHERE id = ?", (thumbnail_url, file_id))
                         refreshed_count += 1
-                        print(f"[DEBUG] ✓ Updated thumbnail for {file_id}")
+                        progress.item("refreshed", "Updated thumbnail for %s (%s)", file_id, file_metadata.get("name"))
                     else:
-                        print(f"[DEBUG] ✗ Invalid thumbnail URL for {file_id}")
+                        progress.item("invalid", "Invalid thumbnail URL for %s: %.100s", file_id, thumbnail_url)
                         c.execute("UPDATE images SET thumbnail = ? WHERE id = ?", (DEFAULT_THUMBNAIL, file_id))
                         failed_count += 1
                         error_details[file_id] = "Invalid thumbnail URL"
                 else:
-                    print(f"[DEBUG] ✗ No thumbnail available for {file_id}")
+                    progress.item("missing", "No thumbnail for %s (mimeType=%s, trashed=%s)",
+                                  file_id, file_metadata.get("mimeType"), file_metadata.get("trashed", False))
                     c.execute("UPDATE images SET thumbnail = ? WHERE id = ?", (DEFAULT_THUMBNAIL, file_id))
                     failed_count += 1
                     error_details[file_id] = "No thumbnail in response"
                 
             except Exception as e:
-                print(f"[DEBUG] ✗ Error processing {file_id}: {e}")
+                progress.item("error", "Error processing %s: %s", file_id, e)
                 c.execute("UPDATE images SET thumbnail = ? WHERE id = ?", (DEFAULT_THUMBNAIL, file_id))
                 failed_count += 1
                 error_details[file_id] = str(e)
         
+        bump_catalog_version(c)
         conn.commit()  # Commit after each batch
-        
-        # Small delay to avoid hitting rate limits
-        import time
-        time.sleep(0.5)
+        remember_drive_files(fetched_files)
     
     conn.close()
     
-    # Print detailed error summary
-    print(f"[DEBUG] Final results:")
-    print(f"  - Successful: {refreshed_count}")
-    print(f"  - Failed: {failed_count}")
-    print(f"  - Error breakdown:")
+    progress.finish()
     
     error_summary = {}
     for file_id, error in error_details.items():
         error_type = error.split(':')[0] if ':' in error else error
         error_summary[error_type] = error_summary.get(error_type, 0) + 1
     
-    for error_type, count in error_summary.items():
-        print(f"    - {error_type}: {count} files")
+    if error_summary:
+        logger.info("refresh_thumbnails: error breakdown", extra={"errors": error_summary})
     
     # Create detailed flash message
     total_files = len(all_files)
@@ -1405,12 +3712,13 @@ def refresh_thumbnails():
 @app.route("/clear/thumbnails", methods=["POST"])
 def clear_all_thumbnails():
     """Route to completely clear all thumbnails without refreshing"""
-    conn = sqlite3.connect(DB_FILE)
+    conn = connect_db()
     c = conn.cursor()
     
     # Clear ALL thumbnails
     c.execute("UPDATE images SET thumbnail = NULL")
     affected_rows = c.rowcount
+    bump_catalog_version(c)
     conn.commit()
     conn.close()
     
@@ -1425,24 +3733,22 @@ def test_single_thumbnail(file_id):
         return redirect("/authorize")
     
     try:
-        creds = Credentials(**session["credentials"])
-        service = build("drive", GOOGLE_DRIVE_API_VERSION, credentials=creds)
+        creds = load_credentials(session["credentials"])
+        service = google_service("drive", GOOGLE_DRIVE_API_VERSION, creds)
         
-        print(f"[SINGLE TEST] Testing file: {file_id}")
+        logger.info("Single thumbnail test for %s", file_id)
         
         # Get full file metadata
-        file_metadata = service.files().get(
+        file_metadata = drive_execute(service.files().get(
             fileId=file_id,
             fields="*",  # Get all fields for debugging
             supportsAllDrives=True
-        ).execute()
+        ))
         
-        print(f"[SINGLE TEST] Full metadata:")
-        for key, value in file_metadata.items():
-            if key != 'thumbnailLink' or len(str(value)) < 200:
-                print(f"  {key}: {value}")
-            else:
-                print(f"  {key}: {str(value)[:100]}...")
+        logger.info("Single thumbnail test metadata", extra={
+            "metadata": {key: (str(value)[:100] + "...") if key == "thumbnailLink" and len(str(value)) >= 200 else value
+                         for key, value in file_metadata.items()}
+        })
         
         thumbnail_url = file_metadata.get("thumbnailLink")
         
@@ -1454,7 +3760,7 @@ def test_single_thumbnail(file_id):
         
     except Exception as e:
         flash(f"Error testing file {file_id}: {str(e)}", FLASH_DANGER)
-        print(f"[SINGLE TEST] Error: {e}")
+        logger.warning("Single thumbnail test for %s failed: %s", file_id, e)
     
     return redirect("/")
 
@@ -1469,21 +3775,21 @@ def diagnostics():
     
     try:
         # Test 1: Basic authentication
-        creds = Credentials(**session["credentials"])
+        creds = load_credentials(session["credentials"])
         results.append("✓ Credentials loaded successfully")
         
         # Test 2: OAuth2 API access
-        oauth2_service = build("oauth2", OAUTH2_API_VERSION, credentials=creds)
-        user_info = oauth2_service.userinfo().get().execute()
+        oauth2_service = google_service("oauth2", OAUTH2_API_VERSION, creds)
+        user_info = drive_execute(oauth2_service.userinfo().get())
         results.append(f"✓ OAuth2 API: Authenticated as {user_info.get('email')}")
         
         # Test 3: Drive API access
-        service = build("drive", GOOGLE_DRIVE_API_VERSION, credentials=creds)
-        about = service.about().get(fields="user,storageQuota").execute()
+        service = google_service("drive", GOOGLE_DRIVE_API_VERSION, creds)
+        about = drive_execute(service.about().get(fields="user,storageQuota"))
         results.append(f"✓ Drive API: Access confirmed")
         
         # Test 4: Check database
-        conn = sqlite3.connect(DB_FILE)
+        conn = connect_db()
         c = conn.cursor()
         c.execute("SELECT COUNT(*) FROM images")
         total_images = c.fetchone()[0]
@@ -1493,23 +3799,32 @@ def diagnostics():
         
         c.execute("SELECT id FROM images LIMIT 1")
         sample_file = c.fetchone()
+        
+        c.execute("SELECT COUNT(*), COUNT(children_fetched_at) FROM drive_files")
+        cached_files, listed_folders = c.fetchone()
         conn.close()
         
         results.append(f"✓ Database: {total_images} total images, {with_thumbnails} have thumbnails")
+        results.append(f"✓ Drive metadata cache: {cached_files} files, {listed_folders} folder listings")
         
         if sample_file:
             file_id = sample_file[0]
             results.append(f"✓ Sample file ID: {file_id}")
             
-            # Test 5: Try to fetch one file's metadata
+            # Test 5: Try to fetch one file's metadata (the metadata cache is used when fresh)
             try:
-                file_metadata = service.files().get(
-                    fileId=file_id,
-                    fields="id,name,mimeType,thumbnailLink,trashed,parents,capabilities",
-                    supportsAllDrives=True
-                ).execute()
-                
-                results.append(f"✓ Sample file metadata retrieved:")
+                cached = cached_drive_file(file_id)
+                if cached:
+                    file_metadata, fetched_at = cached
+                    results.append(f"✓ Sample file metadata from cache (fetched {int(time.time() - fetched_at)}s ago):")
+                else:
+                    file_metadata = drive_execute(service.files().get(
+                        fileId=file_id,
+                        fields=f"{DRIVE_FILE_FIELDS}, capabilities",
+                        supportsAllDrives=True
+                    ))
+                    remember_drive_files([file_metadata])
+                    results.append(f"✓ Sample file metadata retrieved:")
                 results.append(f"  - Name: {file_metadata.get('name', 'Unknown')}")
                 results.append(f"  - Type: {file_metadata.get('mimeType', 'Unknown')}")
                 results.append(f"  - Trashed: {file_metadata.get('trashed', 'Unknown')}")
@@ -1522,10 +3837,11 @@ def diagnostics():
                 else:
                     results.append(f"  - No thumbnail available for this file type")
                 
-                # Check file capabilities
-                caps = file_metadata.get('capabilities', {})
-                results.append(f"  - Can read: {caps.get('canDownload', 'Unknown')}")
-                results.append(f"  - Can view: {caps.get('canReadRevisions', 'Unknown')}")
+                # Check file capabilities (not cached)
+                if 'capabilities' in file_metadata:
+                    caps = file_metadata['capabilities']
+                    results.append(f"  - Can read: {caps.get('canDownload', 'Unknown')}")
+                    results.append(f"  - Can view: {caps.get('canReadRevisions', 'Unknown')}")
                 
             except Exception as e:
                 results.append(f"✗ Error fetching sample file: {str(e)}")
@@ -1533,12 +3849,12 @@ def diagnostics():
                 # If individual file fails, try a different approach
                 try:
                     # Test with a simple files.list call
-                    list_result = service.files().list(
+                    list_result = drive_execute(service.files().list(
                         pageSize=1,
                         fields="files(id,name,mimeType)",
                         supportsAllDrives=True,
                         includeItemsFromAllDrives=True
-                    ).execute()
+                    ))
                     
                     if list_result.get('files'):
                         results.append(f"✓ Files.list works - found accessible files")
@@ -1569,11 +3885,18 @@ def diagnostics():
                 results.append("? OAuth scopes: Unknown or not available")
         except Exception as e:
             results.append(f"? OAuth scopes: Error reading scopes - {str(e)}")
+
+        # Test 8: Drive rate limiter (per worker)
+        limits = drive_limiter.snapshot()
+        results.append(f"✓ Drive rate limit: {limits['project_rate']} requests/s for this worker")
+        for user, rate in limits["user_rates"].items():
+            results.append(f"  - {user or 'background jobs'}: {rate} requests/s")
         
-        # Test 8: Check if credentials need refresh
+        # Test 9: Check if credentials need refresh
         if creds.expired:
             results.append("⚠ Credentials are expired - attempting refresh...")
             try:
+                from google.auth.transport.requests import Request
                 creds.refresh(Request())
                 results.append("✓ Credentials refreshed successfully")
                 
@@ -1593,6 +3916,7 @@ def diagnostics():
             
     except Exception as e:
         results.append(f"✗ Major error in diagnostics: {str(e)}")
+        logger.exception("Diagnostics failed")
         import traceback
         results.append(f"Traceback: {traceback.format_exc()}")
     
@@ -1641,10 +3965,302 @@ def diagnostics_template():
     
     return html
 
+### - JSON API - ###
+# Registered under /api/v1 and under /api (which always points at the current version).
+api = Blueprint("api", __name__)
+
+
+def api_error(message, status):
+    response = jsonify({"error": message})
+    response.status_code = status
+    return response
+
+
+def encode_cursor(file_id):
+    # Opaque keyset cursor: the last image ID of the previous page.
+    return base64.urlsafe_b64encode(file_id.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    padded = cursor + "=" * (-len(cursor) % 4)
+    return base64.urlsafe_b64decode(padded.encode()).decode()
+
+
+def parse_image_fields():
+    """Parses the ?fields= selection for image resources. Raises ValueError for unknown fields."""
+    raw = request.args.get("fields", "")
+    fields = tuple(f.strip() for f in raw.split(",") if f.strip())
+    if not fields:
+        return API_IMAGE_FIELDS
+    unknown = [f for f in fields if f not in API_IMAGE_FIELDS]
+    if unknown:
+        raise ValueError(f"unknown field(s) {', '.join(unknown)}")
+    return fields
+
+
+def fill_page_thumbnails(items):
+    """
+    Swaps missing/expired thumbnails on a page of items for fresh ones.
+    Uses the same single Drive batch as the HTML view, so it only costs a call when something is stale.
+    """
+    expired_files = {}
+    for item in items:
+        if not item.thumb_url or is_expired_thumbnail(item.thumb_url):
+            expired_files[item.id] = None
+            item.thumb_url = DEFAULT_THUMBNAIL
+
+    if expired_files and "credentials" in session:
+        refresh_thumbnails_batch(expired_files, items, load_credentials(session["credentials"]))
+
+
+def conditional_json(build_payload):
+    """
+    Serves a JSON payload with an ETag built on the catalog version.
+    When the client already holds the current version, answers 304 without building the payload.
+    """
+    version = request_catalog_version()
+    etag = f"v{API_VERSION}-{version}"
+    if request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+        response.set_etag(etag, weak=True)
+        response.headers["Cache-Control"] = "private, no-cache"
+        return response
+
+    # Tagged with the version read before building: writes made meanwhile can only leave the
+    # payload newer than its ETag, never older
+    payload = build_payload()
+    payload["version"] = version
+    response = jsonify(payload)
+    if request_catalog_version() == version:
+        response.set_etag(etag, weak=True)
+        response.headers["Cache-Control"] = "private, no-cache"
+    else:
+        # The build's own writes (lazily refreshed thumbnails) moved the catalog; nothing to revalidate against
+        response.headers["Cache-Control"] = "no-store"
+    return response
+
+
+@api.before_request
+def api_require_login():
+    if "credentials" not in session:
+        return api_error("Not authenticated. Visit /authorize first.", 401)
+
+    try:
+        email = get_user_email(load_credentials(session["credentials"]))
+    except Exception as e:
+        return api_error(f"Authentication error: {str(e)}", 401)
+
+    if email not in ALLOWED_USERS:
+        return api_error("You are not authorized to access this application.", 403)
+
+
+@api.route("/images")
+def api_images():
+    try:
+        fields = parse_image_fields()
+        limit = min(max(int(request.args.get("limit", ITEMS_PER_PAGE)), 1), API_MAX_LIMIT)
+        cursor = request.args.get("cursor", "")
+        after_id = decode_cursor(cursor) if cursor else ""
+    except ValueError as e:
+        return api_error(f"Invalid request: {str(e)}", 400)
+
+    search_query = request.args.get("q", "").strip()
+    if search_query:
+        try:
+            tag_query.parse(search_query)
+        except tag_query.QueryError as e:
+            return api_error(f"Invalid search: {str(e)}", 400)
+
+    def build_payload():
+        conn = connect_db()
+        c = conn.cursor()
+
+        # Keyset pagination: fetch one extra row to know whether there is a next page
+        if search_query:
+            page_ids = [file_id for file_id in search_image_ids(search_query) if file_id > after_id][:limit + 1]
+            c.execute(f"SELECT id, tags, thumbnail FROM images WHERE id IN ({','.join('?' for _ in page_ids)}) ORDER BY id",
+                      page_ids)
+        else:
+            c.execute("SELECT id, tags, thumbnail FROM images WHERE id > ? ORDER BY id LIMIT ?", (after_id, limit + 1))
+
+        items = [ImageRecord(file_id, tags_json, thumb) for file_id, tags_json, thumb in c]
+        conn.close()
+        has_more = len(items) > limit
+        items = items[:limit]
+
+        if "thumb_url" in fields:
+            fill_page_thumbnails(items)
+
+        return {
+            "items": [item.to_dict(fields) for item in items],
+            "next_cursor": encode_cursor(items[-1].id) if has_more else None,
+        }
+
+    return conditional_json(build_payload)
+
+
+@api.route("/images/<file_id>")
+def api_image(file_id):
+    try:
+        fields = parse_image_fields()
+    except ValueError as e:
+        return api_error(f"Invalid request: {str(e)}", 400)
+
+    conn = connect_db()
+    c = conn.cursor()
+    c.execute("SELECT tags, thumbnail FROM images WHERE id = ?", (file_id,))
+    row = c.fetchone()
+    conn.close()
+
+    if not row:
+        return api_error(f"Image {file_id} not found.", 404)
+
+    def build_payload():
+        item = ImageRecord(file_id, row[0], row[1])
+        if "thumb_url" in fields:
+            fill_page_thumbnails([item])
+        return {"item": item.to_dict(fields)}
+
+    return conditional_json(build_payload)
+
+
+@api.route("/tags")
+def api_tags():
+    def build_payload():
+        counts = count_tags()
+        return {"tags": [{"tag": tag, "count": counts[tag]} for tag in sorted(counts)]}
+
+    return conditional_json(build_payload)
+
+
+@api.route("/tags/related")
+def api_related_tags():
+    tag = request.args.get("tag", "").strip().lower()
+    rank = request.args.get("rank", "pmi")
+    try:
+        limit = min(max(int(request.args.get("limit", RELATED_TAGS_LIMIT)), 1), API_MAX_LIMIT)
+        min_count = max(int(request.args.get("min_count", RELATED_TAGS_MIN_COUNT)), 1)
+    except ValueError as e:
+        return api_error(f"Invalid request: {str(e)}", 400)
+    if not tag:
+        return api_error("No tag given.", 400)
+    if rank not in ("pmi", "lift", "count"):
+        return api_error("rank must be pmi, lift or count.", 400)
+
+    def build_payload():
+        return {"tag": tag, "related": related_tags(tag, limit, min_count, rank)}
+
+    return conditional_json(build_payload)
+
+
+def mutation_response(payload):
+    # Mutations are never cached; they just report the catalog version they produced
+    payload["version"] = get_catalog_version()
+    return jsonify(payload)
+
+
+@api.route("/images/<file_id>/tags", methods=["POST"])
+def api_add_tags(file_id):
+    body = request.get_json(silent=True) or request.form
+    new_tag = str(body.get("tag", "")).strip().lower()
+    tags_to_add = [t.strip() for t in new_tag.split(",") if t.strip()]
+    if not tags_to_add:
+        return api_error("No tag given.", 400)
+
+    tags = add_tags(file_id, tags_to_add)
+    if tags is None:
+        return api_error(f"Image {file_id} not found.", 404)
+
+    return mutation_response({
+        "item": {"id": file_id, "tags": tags},
+        "tag_counts": count_tags(tags_to_add),
+    })
+
+
+@api.route("/images/<file_id>/tags/<path:tag>", methods=["DELETE"])
+def api_remove_tag(file_id, tag):
+    tags = remove_tag(file_id, tag)
+    if tags is None:
+        return api_error(f"Image {file_id} not found.", 404)
+
+    return mutation_response({
+        "item": {"id": file_id, "tags": tags},
+        "tag_counts": count_tags([tag]),
+    })
+
+
+@api.route("/images/<file_id>", methods=["DELETE"])
+def api_remove_image(file_id):
+    conn = connect_db()
+    c = conn.cursor()
+    c.execute("SELECT tags FROM images WHERE id = ?", (file_id,))
+    result = c.fetchone()
+    conn.close()
+
+    if not result:
+        return api_error(f"Image {file_id} not found.", 404)
+
+    tags = decode_tags(result[0])
+    delete_item(file_id)
+
+    return mutation_response({
+        "deleted": file_id,
+        "tag_counts": count_tags(tags),
+    })
+
+
+@api.route("/backups")
+def api_backups():
+    def build_payload():
+        return {"backups": [{"id": b[0], "timestamp": b[1]} for b in list_backups()]}
+
+    return conditional_json(build_payload)
+
+
+app.register_blueprint(api, url_prefix=f"/api/v{API_VERSION}")
+app.register_blueprint(api, url_prefix="/api", name="api_latest")
+
+
+### - App Factory - ###
+def create_app():
+    """
+    Gets the app ready to serve and returns it: creates or upgrades the schema, closes out
+    imports left running by the previous server, imports the Google client libraries and
+    builds the in-memory tag index. wsgi.py calls this, so with gunicorn's preload_app it runs
+    once in the master and every worker (including the ones max_requests recycles) forks with
+    it already done, sharing those pages with the master.
+    """
+    timings = {}
+
+    started = time.perf_counter()
+    init_db()
+    timings["init_db"] = time.perf_counter() - started
+
+    # No worker has started yet, so any import still marked running died with the previous server
+    interrupted = interrupt_ingest_jobs()
+    if interrupted:
+        logger.warning("Marked %d unfinished folder imports as interrupted", interrupted)
+
+    started = time.perf_counter()
+    warm_google_clients()
+    timings["google_imports"] = time.perf_counter() - started
+
+    if SEARCH_INDEX == "memory":
+        started = time.perf_counter()
+        conn = connect_db()
+        with _tag_index_lock:
+            _tag_index.refresh(conn.cursor())
+        conn.close()
+        timings["tag_index"] = time.perf_counter() - started
+
+    logger.info("App ready", extra={f"{name}_ms": round(seconds * 1000, 1) for name, seconds in timings.items()})
+    return app
+
+
 ### - Program Start - ###
 if __name__ == "__main__":
-    # Initializes the database (creates tables if needed) on startup.
-    init_db()
+    # Initializes the database (creates tables if needed) and warms up before serving.
+    create_app()
 
     # Add production configuration
     PRODUCTION = os.getenv("PRODUCTION", "false").lower() == "true"
@@ -0,0 +1,177 @@
+"""
+Perceptual hashes for finding near-duplicate photos (resized or re-encoded copies).
+
+dhash() compares neighbouring pixels of a 9x8 grayscale thumbnail; phash() keeps the signs of
+the lowest 8x8 DCT frequencies of a 32x32 one. Both give 64-bit integers, and two versions of
+the same shot are usually a few bits apart (Hamming distance), while different photos are
+around 32 apart. BKTree answers "every hash within distance d of this one" without comparing
+against the whole archive.
+
+Decoding and hashing need NumPy and Pillow (pip install numpy pillow). Without them the module
+still imports, so the BK-tree and the /duplicates view keep working on hashes already stored;
+hash_images() raises RuntimeError.
+
+Run the offline pipeline (downloads missing thumbnails into data/thumbnail_cache, hashes them
+in a process pool and stores the results in image_hashes):
+
+    python -m perceptual_hash --workers 4
+"""
+import argparse
+import functools
+import io
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import numpy as np  # Optional: only the hashing needs these
+    from PIL import Image
+except ImportError:
+    np = None
+    Image = None
+
+
+HASH_SIZE = 8          # 8x8 bits = 64-bit hashes
+PHASH_FACTOR = 4       # pHash works on a (HASH_SIZE * PHASH_FACTOR) square image before the DCT
+POOL_CHUNK_SIZE = 32   # Images handed to a pool worker at a time
+
+
+def available():
+    return np is not None and Image is not None
+
+
+def _grayscale(data, width, height):
+    with Image.open(io.BytesIO(data)) as image:
+        return np.asarray(image.convert("L").resize((width, height), Image.LANCZOS), dtype=np.float64)
+
+
+def _pack(bits):
+    return int.from_bytes(np.packbits(bits.flatten()).tobytes(), "big")
+
+
+@functools.lru_cache(maxsize=4)
+def _dct_matrix(n):
+    # Orthonormal DCT-II basis: row k holds cos(pi * (2i + 1) * k / 2n)
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix
+
+
+def dhash(data, hash_size=HASH_SIZE):
+    """Difference hash of encoded image bytes: is each pixel brighter than its left neighbour?"""
+    pixels = _grayscale(data, hash_size + 1, hash_size)
+    return _pack(pixels[:, 1:] > pixels[:, :-1])
+
+
+def phash(data, hash_size=HASH_SIZE):
+    """DCT hash of encoded image bytes: is each low-frequency coefficient above their median?"""
+    size = hash_size * PHASH_FACTOR
+    dct = _dct_matrix(size)
+    coefficients = dct @ _grayscale(data, size, size) @ dct.T
+    low = coefficients[:hash_size, :hash_size]
+    return _pack(low > np.median(low))
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+def _hash_one(item):
+    image_id, data = item
+    try:
+        return image_id, dhash(data), phash(data)
+    except Exception:
+        # Not an image Pillow can read (an HTML error page saved as a thumbnail, say)
+        return image_id, None, None
+
+
+def hash_images(items, workers=None):
+    """
+    Hashes (image_id, bytes) pairs in a process pool. Yields (image_id, dhash, phash) as results
+    come in; both hashes are None for bytes that can't be decoded.
+    """
+    if not available():
+        raise RuntimeError("Perceptual hashing needs NumPy and Pillow: pip install numpy pillow")
+    if workers == 1:
+        yield from map(_hash_one, items)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(_hash_one, items, chunksize=POOL_CHUNK_SIZE)
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over 64-bit hashes under Hamming distance. Each node keeps its
+    children by their distance to it, so a search only descends into children whose
+    distance is within max_distance of the query's distance to the node.
+    """
+
+    __slots__ = ("root", "size")
+
+    def __init__(self, items=()):
+        self.root = None  # [hash, [ids], {distance: child node}]
+        self.size = 0
+        for value, item_id in items:
+            self.add(value, item_id)
+
+    def add(self, value, item_id):
+        self.size += 1
+        if self.root is None:
+            self.root = [value, [item_id], {}]
+            return
+        node = self.root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                node[1].append(item_id)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, [item_id], {}]
+                return
+            node = child
+
+    def search(self, value, max_distance):
+        """Returns [(distance, item_id)] for every hash within max_distance of value."""
+        if self.root is None:
+            return []
+        found = []
+        stack = [self.root]
+        while stack:
+            node_value, ids, children = stack.pop()
+            distance = hamming(value, node_value)
+            if distance <= max_distance:
+                found.extend((distance, item_id) for item_id in ids)
+            for child_distance, child in children.items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        return found
+
+    def __len__(self):
+        return self.size
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Compute perceptual hashes for catalog thumbnails.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Hashing processes (default: one per CPU)")
+    parser.add_argument("--limit", type=int, help="Hash at most this many images this run")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not available():
+        print("Perceptual hashing needs NumPy and Pillow: pip install numpy pillow", file=sys.stderr)
+        return 1
+    # Imported here: the app imports this module for BKTree
+    import main as photo_tagger
+    photo_tagger.init_db()
+    hashed, failed = photo_tagger.update_image_hashes(workers=args.workers, limit=args.limit)
+    print(f"Hashed {hashed} images ({failed} thumbnails could not be fetched or decoded)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
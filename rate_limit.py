@@ -0,0 +1,192 @@
+"""
+Client-side rate limiting and retries for Google Drive API calls.
+
+Every Drive call takes tokens from two buckets: one for the whole worker (the project's
+quota) and one for the signed-in user (Drive's per-user quota). The bucket rates adapt
+AIMD-style: each success nudges the rate up by a small fixed step, and each rate-limit
+error (429, or 403 rateLimitExceeded / userRateLimitExceeded) halves it, at most once per
+cooldown. Calls that fail with a rate-limit or transient server error are retried with
+jittered exponential backoff.
+"""
+import json
+import logging
+import random
+import threading
+import time
+
+logger = logging.getLogger("photo_tagger.drive")
+
+TRANSIENT_STATUSES = {500, 502, 503, 504}
+PROJECT_RATE_LIMIT_REASONS = {"rateLimitExceeded"}
+USER_RATE_LIMIT_REASONS = {"userRateLimitExceeded"}
+
+
+def error_status(error):
+    resp = getattr(error, "resp", None)
+    return getattr(resp, "status", None)
+
+
+def error_reasons(error):
+    """Reasons listed in a Google API error body, e.g. {"userRateLimitExceeded"}."""
+    content = getattr(error, "content", None)
+    if not content:
+        return set()
+    try:
+        body = json.loads(content.decode("utf-8") if isinstance(content, bytes) else content)
+        return {detail.get("reason") for detail in body.get("error", {}).get("errors", [])}
+    except (ValueError, AttributeError):
+        return set()
+
+
+def throttle_scope(error):
+    """Returns "user" or "project" for a rate-limit error, None for anything else."""
+    status = error_status(error)
+    if status not in (403, 429):
+        return None
+    reasons = error_reasons(error)
+    if reasons & USER_RATE_LIMIT_REASONS:
+        return "user"
+    if status == 429 or reasons & PROJECT_RATE_LIMIT_REASONS:
+        return "project"
+    return None
+
+
+def is_retryable(error):
+    """Rate-limit errors, 5xx responses and dropped connections are worth another try."""
+    if throttle_scope(error):
+        return True
+    if error_status(error) in TRANSIENT_STATUSES:
+        return True
+    return isinstance(error, (ConnectionError, TimeoutError))
+
+
+class TokenBucket:
+    """
+    Token bucket whose refill rate is tuned by AIMD. acquire() reserves tokens even when
+    the bucket is empty (the balance goes negative), so waiters are served in order.
+    """
+
+    def __init__(self, rate, burst, min_rate, max_rate, increase=0.1, decrease=0.5, cooldown=1.0):
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.tokens = float(burst)
+        self._updated = time.monotonic()
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, cost=1):
+        """Takes `cost` tokens and returns how long the caller must wait before using them."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens -= cost
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def on_success(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_throttled(self):
+        """Halves the rate (once per cooldown, since one burst brings many errors at once)."""
+        with self._lock:
+            now = time.monotonic()
+            if now - self._last_decrease < self.cooldown:
+                return False
+            self._last_decrease = now
+            self._refill(now)
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            self.tokens = min(self.tokens, 0.0)
+            return True
+
+
+class DriveRateLimiter:
+    """Shared by all threads in a worker. Users are keyed by email; None means no signed-in user."""
+
+    def __init__(self, rate, user_rate, burst, min_rate, max_rate,
+                 max_retries=5, backoff_base=0.5, backoff_cap=32.0, on_wait=None):
+        self.user_rate = user_rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.on_wait = on_wait
+        self.project = TokenBucket(rate, burst, min_rate, max_rate)
+        self._users = {}
+        self._users_lock = threading.Lock()
+
+    def user_bucket(self, user):
+        with self._users_lock:
+            bucket = self._users.get(user)
+            if bucket is None:
+                bucket = self._users[user] = TokenBucket(self.user_rate, self.burst, self.min_rate, self.max_rate)
+            return bucket
+
+    def _sleep(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds)
+            if self.on_wait:
+                self.on_wait(seconds)
+
+    def acquire(self, user=None, cost=1):
+        # Both reservations are made up front, so the wait is the longer of the two, not the sum
+        self._sleep(max(self.project.reserve(cost), self.user_bucket(user).reserve(cost)))
+
+    def record_success(self, user=None):
+        self.project.on_success()
+        self.user_bucket(user).on_success()
+
+    def record_failure(self, error, user=None):
+        scope = throttle_scope(error)
+        if scope is None:
+            return
+        bucket = self.user_bucket(user) if scope == "user" else self.project
+        if bucket.on_throttled():
+            logger.warning("Drive %s rate limit hit; slowing to %.1f requests/s", scope, bucket.rate,
+                           extra={"user": user, "status": error_status(error)})
+
+    def backoff(self, attempt):
+        """Full-jitter exponential backoff for retry number `attempt` (0-based)."""
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+
+    def wait_before_retry(self, error, attempt, user=None):
+        """Records a failed call and sleeps before retry number `attempt`."""
+        self.record_failure(error, user)
+        self._sleep(self.backoff(attempt))
+
+    def call(self, fn, user=None, cost=1):
+        """
+        Runs fn() under the rate limit, retrying retryable errors up to max_retries times.
+        The last error is re-raised.
+        """
+        attempt = 0
+        while True:
+            self.acquire(user, cost)
+            try:
+                result = fn()
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    self.record_failure(e, user)
+                    raise
+                logger.debug("Drive call failed (%s); retry %d of %d", e, attempt + 1, self.max_retries)
+                self.wait_before_retry(e, attempt, user)
+                attempt += 1
+                continue
+            self.record_success(user)
+            return result
+
+    def snapshot(self):
+        """Current rates, for diagnostics."""
+        with self._users_lock:
+            users = {user: round(bucket.rate, 2) for user, bucket in self._users.items()}
+        return {"project_rate": round(self.project.rate, 2), "user_rates": users}
@@ -0,0 +1,208 @@
+// Photo grid edits without full page reloads.
+// Add tag, remove tag and remove photo go through the JSON API, and only the
+// affected card and tag counts are patched. Every form still works without
+// JavaScript: if an API call fails we fall back to submitting the form normally.
+(function () {
+  const API_BASE = '/api/v1';
+
+  async function callApi(method, url, body) {
+    const options = { method, credentials: 'same-origin', headers: { Accept: 'application/json' } };
+    if (body !== undefined) {
+      options.headers['Content-Type'] = 'application/json';
+      options.body = JSON.stringify(body);
+    }
+    const response = await fetch(url, options);
+    if (!response.ok) {
+      throw new Error(`${method} ${url} failed with ${response.status}`);
+    }
+    return response.json();
+  }
+
+  function imageUrl(photoId) {
+    return `${API_BASE}/images/${encodeURIComponent(photoId)}`;
+  }
+
+  function hiddenInput(name, value) {
+    const input = document.createElement('input');
+    input.type = 'hidden';
+    input.name = name;
+    input.value = value;
+    return input;
+  }
+
+  // Builds the same markup as the remove-tag forms in index.html
+  function removeTagForm(photoId, tag) {
+    const form = document.createElement('form');
+    form.method = 'post';
+    form.action = '/removetag';
+    form.className = 'd-inline-block me-1 mb-1 remove-tag-form';
+    form.appendChild(hiddenInput('id', photoId));
+    form.appendChild(hiddenInput('tag', tag));
+    form.appendChild(hiddenInput('return_url', window.location.pathname + window.location.search));
+
+    const button = document.createElement('button');
+    button.className = 'btn btn-sm btn-outline-danger tag-btn';
+    button.textContent = `${tag} ✕`;
+    form.appendChild(button);
+    return form;
+  }
+
+  function renderCardTags(card, photoId, tags) {
+    const list = card.querySelector('.tags-list');
+    if (!list) return;
+    list.replaceChildren(...tags.map((tag) => removeTagForm(photoId, tag)));
+  }
+
+  function findByTag(container, selector, tag) {
+    return Array.from(container.querySelectorAll(selector)).find((el) => (el.dataset.tag ?? el.value) === tag);
+  }
+
+  // Inserts el among siblings matching selector, keeping them sorted by tag
+  function insertSorted(container, selector, el, tag) {
+    const next = Array.from(container.querySelectorAll(selector)).find((other) => (other.dataset.tag ?? other.value) > tag);
+    container.insertBefore(el, next || null);
+  }
+
+  // Same as tag_query.quote(): plain words as-is, anything else in quotes
+  function searchTerm(tag) {
+    const plain = /^[^\s(),|"*-][^\s(),|"*]*$/.test(tag) && !['or', 'and', 'not'].includes(tag) && !tag.startsWith('id:');
+    return plain ? tag : `"${tag}"`;
+  }
+
+  function tagCloudLink(tag, count) {
+    const link = document.createElement('a');
+    link.href = `/?q=${encodeURIComponent(searchTerm(tag))}`;
+    link.className = 'btn btn-sm btn-outline-secondary m-1';
+    link.dataset.tag = tag;
+    link.append(`${tag} `);
+
+    const badge = document.createElement('span');
+    badge.className = 'tag-count';
+    badge.textContent = count;
+    link.appendChild(badge);
+    return link;
+  }
+
+  // Applies {tag: count} from an API response to the tag cloud and the rename dropdown
+  function applyTagCounts(counts) {
+    const cloud = document.getElementById('tag-cloud');
+    const select = document.getElementById('old_tag');
+
+    Object.entries(counts || {}).forEach(([tag, count]) => {
+      if (cloud) {
+        const link = findByTag(cloud, 'a[data-tag]', tag);
+        if (count <= 0) {
+          if (link) link.remove();
+        } else if (link) {
+          link.querySelector('.tag-count').textContent = count;
+        } else {
+          insertSorted(cloud, 'a[data-tag]', tagCloudLink(tag, count), tag);
+        }
+        cloud.hidden = !cloud.querySelector('a[data-tag]');
+      }
+
+      if (select) {
+        const option = findByTag(select, 'option:not([disabled])', tag);
+        if (count <= 0 && option) {
+          option.remove();
+        } else if (count > 0 && !option) {
+          insertSorted(select, 'option:not([disabled])', new Option(tag, tag), tag);
+        }
+      }
+    });
+  }
+
+  // Lets virtual-grid.js keep its item store in sync. Returns false if a listener
+  // called preventDefault() (i.e. it takes care of the DOM change itself).
+  function notifyChange(detail) {
+    return document.dispatchEvent(new CustomEvent('photo-grid:change', { detail, cancelable: true }));
+  }
+
+  async function addTag(form) {
+    const photoId = form.querySelector('[name="photo_id"]').value;
+    const input = form.querySelector('[name="tag"]');
+    const data = await callApi('POST', `${imageUrl(photoId)}/tags`, { tag: input.value });
+    renderCardTags(form.closest('[data-photo-id]'), photoId, data.item.tags);
+    applyTagCounts(data.tag_counts);
+    notifyChange({ photoId, tags: data.item.tags });
+    input.value = '';
+  }
+
+  async function removeTag(form) {
+    const photoId = form.querySelector('[name="id"]').value;
+    const tag = form.querySelector('[name="tag"]').value;
+    const card = form.closest('[data-photo-id]');
+    const data = await callApi('DELETE', `${imageUrl(photoId)}/tags/${encodeURIComponent(tag)}`);
+    renderCardTags(card, photoId, data.item.tags);
+    applyTagCounts(data.tag_counts);
+    notifyChange({ photoId, tags: data.item.tags });
+  }
+
+  async function removePhoto(form) {
+    const photoId = form.querySelector('[name="id"]').value;
+    const data = await callApi('DELETE', imageUrl(photoId));
+    if (notifyChange({ photoId, deleted: true })) {
+      form.closest('[data-photo-id]').remove();
+    }
+    applyTagCounts(data.tag_counts);
+  }
+
+  // Suggests tags that often go with the photo's newest tag (/api/tags/related) in a shared datalist
+  const relatedTags = new Map();
+
+  async function suggestTags(input) {
+    const card = input.closest('[data-photo-id]');
+    const tags = Array.from(card.querySelectorAll('.remove-tag-form [name="tag"]')).map((el) => el.value);
+    const tag = tags[tags.length - 1];
+    if (!tag) return;
+
+    if (!relatedTags.has(tag)) {
+      relatedTags.set(tag, callApi('GET', `${API_BASE}/tags/related?tag=${encodeURIComponent(tag)}`)
+        .then((data) => data.related.map((related) => related.tag)));
+    }
+    const suggestions = (await relatedTags.get(tag)).filter((related) => !tags.includes(related));
+
+    let list = document.getElementById('related-tags');
+    if (!list) {
+      list = document.createElement('datalist');
+      list.id = 'related-tags';
+      document.body.appendChild(list);
+    }
+    list.replaceChildren(...suggestions.map((related) => new Option(related, related)));
+    input.setAttribute('list', list.id);
+  }
+
+  document.addEventListener('focusin', (event) => {
+    if (!event.target.matches('.add-tag-form [name="tag"]')) return;
+    suggestTags(event.target).catch((err) => {
+      relatedTags.clear();
+      console.error(err);
+    });
+  });
+
+  window.PhotoGrid = { renderCardTags };
+
+  const HANDLERS = {
+    'add-tag-form': addTag,
+    'remove-tag-form': removeTag,
+    'remove-photo-form': removePhoto
+  };
+
+  document.addEventListener('submit', async (event) => {
+    const form = event.target;
+    const handlerClass = Object.keys(HANDLERS).find((cls) => form.classList.contains(cls));
+    if (!handlerClass || !form.closest('[data-photo-id]')) return;
+
+    event.preventDefault();
+    const buttons = form.querySelectorAll('button');
+    buttons.forEach((button) => { button.disabled = true; });
+    try {
+      await HANDLERS[handlerClass](form);
+    } catch (err) {
+      console.error(err);
+      form.submit();
+    } finally {
+      buttons.forEach((button) => { button.disabled = false; });
+    }
+  });
+})();
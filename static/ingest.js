@@ -0,0 +1,61 @@
+// Live progress for folder imports.
+// Each running import on the page asks /ingest/<id> for its counts every few seconds (one
+// short request each, so no worker is held open) and patches them in until it is finished.
+(function () {
+  function formatSeconds(seconds) {
+    return `${(seconds || 0).toFixed(1)}s`;
+  }
+
+  function render(panel, job) {
+    panel.dataset.status = job.status;
+    panel.querySelector('.ingest-status').textContent = job.status;
+    panel.querySelector('.ingest-discovered').textContent = job.discovered;
+    panel.querySelector('.ingest-saved').textContent = job.saved;
+    panel.querySelector('.ingest-failed').textContent = job.failed;
+    panel.querySelector('.ingest-timing').textContent =
+      `crawl ${formatSeconds(job.crawl_seconds)}, thumbnails ${formatSeconds(job.thumbnail_seconds)}, save ${formatSeconds(job.save_seconds)}`;
+    panel.querySelector('.ingest-error').textContent = job.error || '';
+  }
+
+  function finish(panel) {
+    const link = document.createElement('a');
+    link.href = window.location.href;
+    link.className = 'ms-2';
+    link.textContent = 'Reload to see the photos';
+    panel.querySelector('.ingest-status').after(link);
+  }
+
+  function watch(panel, intervalMs) {
+    const url = `/ingest/${encodeURIComponent(panel.dataset.jobId)}`;
+
+    async function poll() {
+      let response;
+      try {
+        response = await fetch(url, { headers: { Accept: 'application/json' } });
+      } catch (error) {
+        // Offline or the server is restarting; try again on the next tick
+        setTimeout(poll, intervalMs);
+        return;
+      }
+      // Gone, or signed out: nothing more to show
+      if (response.status === 404 || response.status === 401) return;
+      if (response.ok) {
+        const job = await response.json();
+        render(panel, job);
+        if (job.status !== 'running') {
+          finish(panel);
+          return;
+        }
+      }
+      setTimeout(poll, intervalMs);
+    }
+
+    setTimeout(poll, intervalMs);
+  }
+
+  document.addEventListener('DOMContentLoaded', () => {
+    document.querySelectorAll('.ingest-job[data-status="running"]').forEach((panel) => {
+      watch(panel, Number(panel.dataset.pollSeconds || 2) * 1000);
+    });
+  });
+})();
@@ -0,0 +1,220 @@
+// Infinite, virtualized photo grid for page 1 of index.html.
+// Photos stream from the cursor-paginated /api/images endpoint as the user scrolls.
+// Only the rows near the viewport are in the DOM (spacers stand in for the rest), and
+// card nodes are recycled through a pool instead of being recreated. The next page's
+// metadata and thumbnails are prefetched while the browser is idle.
+(function () {
+  const API_IMAGES = '/api/v1/images';
+  const PAGE_SIZE = 40;
+  const OVERSCAN_ROWS = 3;        // Rows kept rendered above and below the viewport
+  const LOAD_AHEAD_ROWS = 6;      // Load the next page when this close to the last loaded row
+
+  const grid = document.getElementById('photo-grid');
+  const template = document.getElementById('photo-card-template');
+  if (!grid || !template || !grid.hasAttribute('data-infinite') || !window.PhotoGrid) return;
+
+  const idle = window.requestIdleCallback || ((fn) => setTimeout(fn, 200));
+  const query = grid.dataset.query || '';
+  const state = {
+    items: [],                    // {id, tags, thumb_url} in catalog (ID) order
+    nextCursor: grid.dataset.nextCursor || null,
+    prefetched: null,             // Promise for the page after the loaded items
+    loading: false,
+    columns: 1,
+    rowHeight: 0,
+    gutter: 0,
+    first: -1,                    // Rendered item range [first, last)
+    last: -1
+  };
+  const pool = [];
+
+  function byId(a, b) {
+    if (a.id < b.id) return -1;
+    return a.id > b.id ? 1 : 0;
+  }
+
+  // Adopt the server-rendered first page as the start of the item list
+  const serverCards = Array.from(grid.querySelectorAll(':scope > [data-photo-id]'));
+  serverCards.forEach((card) => {
+    state.items.push({
+      id: card.dataset.photoId,
+      tags: Array.from(card.querySelectorAll('.remove-tag-form [name="tag"]')).map((input) => input.value),
+      thumb_url: card.querySelector('img').getAttribute('src')
+    });
+  });
+  if (!state.items.length) return;
+  state.items.sort(byId);
+
+  function spacer() {
+    const el = document.createElement('div');
+    el.className = 'w-100 virtual-spacer';
+    return el;
+  }
+  const topSpacer = spacer();
+  const bottomSpacer = spacer();
+
+  function renderedCards() {
+    return Array.from(grid.querySelectorAll(':scope > [data-photo-id]'));
+  }
+
+  // Cards have a fixed height in .virtual-grid, so one measurement covers every row
+  function measure() {
+    const card = renderedCards()[0];
+    if (!card) return;
+    state.columns = Math.max(1, Math.round(grid.clientWidth / card.offsetWidth));
+    state.gutter = parseFloat(getComputedStyle(card).marginTop) || 0;
+    state.rowHeight = card.offsetHeight + state.gutter;
+  }
+
+  function setSpacer(el, rows) {
+    // Spacers are row children too, so they get the gutter margin on top of their height
+    el.style.display = rows > 0 ? '' : 'none';
+    el.style.height = rows > 0 ? `${rows * state.rowHeight - state.gutter}px` : '0';
+  }
+
+  function bindCard(node, item) {
+    const changed = node.dataset.photoId !== item.id;
+    node.dataset.photoId = item.id;
+
+    const img = node.querySelector('img');
+    if (img.getAttribute('src') !== item.thumb_url) img.src = item.thumb_url;
+    img.alt = `Photo thumbnail for ${item.id}`;
+
+    node.querySelector('.remove-photo-form [name="id"]').value = item.id;
+    node.querySelector('.remove-photo-form [name="return_url"]').value = window.location.pathname + window.location.search;
+    node.querySelector('.add-tag-form [name="photo_id"]').value = item.id;
+    node.querySelector('.photo-id').textContent = item.id;
+    node.querySelector('.drive-link').href = `https://drive.google.com/file/d/${encodeURIComponent(item.id)}/view`;
+    window.PhotoGrid.renderCardTags(node, item.id, item.tags);
+    if (changed) node.querySelector('.add-tag-form [name="tag"]').value = '';
+  }
+
+  function render(force) {
+    if (!state.rowHeight) measure();
+    const rowHeight = state.rowHeight || 1;
+    const columns = state.columns;
+    const totalRows = Math.ceil(state.items.length / columns);
+
+    const gridTop = grid.getBoundingClientRect().top + window.scrollY;
+    const viewTop = window.scrollY - gridTop;
+    const viewBottom = viewTop + window.innerHeight;
+    const firstRow = Math.min(Math.max(Math.floor(viewTop / rowHeight) - OVERSCAN_ROWS, 0), totalRows);
+    const lastRow = Math.min(Math.max(Math.ceil(viewBottom / rowHeight) + OVERSCAN_ROWS, firstRow), totalRows);
+    const first = firstRow * columns;
+    const last = Math.min(lastRow * columns, state.items.length);
+
+    if (force || first !== state.first || last !== state.last) {
+      state.first = first;
+      state.last = last;
+      setSpacer(topSpacer, firstRow);
+      setSpacer(bottomSpacer, totalRows - lastRow);
+
+      // Recycle: park surplus cards in the pool, take missing ones from it
+      const cards = renderedCards();
+      while (cards.length > last - first) {
+        const card = cards.pop();
+        card.remove();
+        pool.push(card);
+      }
+      while (cards.length < last - first) {
+        const card = pool.pop() || template.content.firstElementChild.cloneNode(true);
+        grid.insertBefore(card, bottomSpacer);
+        cards.push(card);
+      }
+      cards.forEach((card, i) => bindCard(card, state.items[first + i]));
+    }
+
+    if (lastRow >= totalRows - LOAD_AHEAD_ROWS) loadMore();
+  }
+
+  async function fetchPage(cursor) {
+    const params = new URLSearchParams({ cursor, limit: PAGE_SIZE });
+    if (query) params.set('q', query);
+    const response = await fetch(`${API_IMAGES}?${params}`, {
+      credentials: 'same-origin',
+      headers: { Accept: 'application/json' }
+    });
+    if (!response.ok) throw new Error(`GET ${API_IMAGES} failed with ${response.status}`);
+    return response.json();
+  }
+
+  // Fetches the page after the loaded items and warms the browser cache with its thumbnails
+  function prefetchNext() {
+    if (!state.nextCursor || state.prefetched) return;
+    state.prefetched = fetchPage(state.nextCursor).then((page) => {
+      page.items.forEach((item) => { new Image().src = item.thumb_url; });
+      return page;
+    });
+    state.prefetched.catch(() => { state.prefetched = null; });
+  }
+
+  async function loadMore() {
+    if (state.loading || !state.nextCursor) return;
+    state.loading = true;
+    let loaded = false;
+    try {
+      prefetchNext();
+      const page = await state.prefetched;
+      state.prefetched = null;
+      state.items.push(...page.items);
+      state.nextCursor = page.next_cursor;
+      loaded = true;
+    } catch (err) {
+      // Keep the cursor; the next scroll retries
+      console.error(err);
+      state.prefetched = null;
+    } finally {
+      state.loading = false;
+    }
+
+    if (loaded) {
+      // May immediately ask for another page if the viewport is still near the end
+      render(true);
+      idle(prefetchNext);
+    }
+  }
+
+  // Keep the item list in sync with edits made through grid.js
+  document.addEventListener('photo-grid:change', (event) => {
+    const { photoId, tags, deleted } = event.detail;
+    const index = state.items.findIndex((item) => item.id === photoId);
+    if (index === -1) return;
+    if (deleted) {
+      event.preventDefault();
+      state.items.splice(index, 1);
+      render(true);
+    } else {
+      state.items[index].tags = tags;
+    }
+  });
+
+  let frame = 0;
+  let forceNext = false;
+  function schedule(force) {
+    forceNext = forceNext || force;
+    if (frame) return;
+    frame = window.requestAnimationFrame(() => {
+      frame = 0;
+      const forced = forceNext;
+      forceNext = false;
+      render(forced);
+    });
+  }
+
+  // Switch the server-rendered page over to the virtual grid
+  grid.classList.add('virtual-grid');
+  const pagination = document.getElementById('pagination');
+  if (pagination) pagination.hidden = true;
+  measure();
+  serverCards.forEach((card) => { card.remove(); pool.push(card); });
+  grid.prepend(topSpacer);
+  grid.append(bottomSpacer);
+  render(true);
+  idle(prefetchNext);
+
+  window.addEventListener('scroll', () => schedule(false), { passive: true });
+  window.addEventListener('resize', () => {
+    state.rowHeight = 0;
+    schedule(true);
+  });
+})();
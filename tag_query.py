@@ -0,0 +1,225 @@
+"""
+Search query language for the photo catalog, compiled into a plan over an inverted index.
+
+    beach sunset          photos tagged both "beach" and "sunset" (a comma works too)
+    beach | lake          either tag ("or" works too)
+    event:gala -blurry    tagged "event:gala" and not "blurry" ("not" works too)
+    event:*               any tag starting with "event:"
+    "black and white"     a tag with spaces in it
+    id:1AbC               the photo with that Drive ID; id:1AbC* for IDs starting with it
+    (beach | lake) -dog   parentheses group
+
+Tags are matched exactly and case-insensitively (they are stored lowercase); IDs are
+case-sensitive. AND binds tighter than OR.
+
+evaluate() runs a parsed query against an index object providing, for a Term:
+
+    count(term)               estimated number of matching photos
+    postings(term)            set of keys of the matching photos
+    probe(term, candidates)   the subset of candidates that match
+    all_ids()                 every photo's key (only needed for purely negative queries)
+
+Keys are whatever the index uses to identify photos (Drive IDs, or ordinals); evaluate()
+returns a set of them and the index turns them back into IDs.
+
+An AND starts from its most selective operand and narrows the candidates with the others,
+probing the index for each candidate instead of reading a long posting list when that is
+cheaper; negated operands are subtracted the same way. So a query costs about as much as
+its smallest posting list, not the size of the catalog.
+"""
+import re
+from collections import namedtuple
+
+PROBE_RATIO = 4  # Probe candidates one by one when a posting list is this many times longer
+KEYWORDS = {"or", "and", "not"}
+
+Term = namedtuple("Term", "field value prefix")  # field is "tag" or "id"
+And = namedtuple("And", "children")
+Or = namedtuple("Or", "children")
+Not = namedtuple("Not", "child")
+
+TOKEN_PATTERN = re.compile(r'\s*(?:([(),|])|(-?)"([^"]*)"(\*?)|([^\s(),|"]+))')
+PLAIN_TAG_PATTERN = re.compile(r'^[^\s(),|"*-][^\s(),|"*]*$')
+
+
+class QueryError(ValueError):
+    pass
+
+
+def tokenize(text):
+    tokens = []
+    pos = 0
+    text = text.strip()
+    while pos < len(text):
+        match = TOKEN_PATTERN.match(text, pos)
+        if not match or match.end() == pos:
+            raise QueryError(f"unexpected {text[pos:].strip()[:1]!r}")
+        pos = match.end()
+        punct, negated, quoted, star, word = match.groups()
+        if punct:
+            tokens.append((punct, None))
+        elif quoted is not None:
+            if negated:
+                tokens.append(("-", None))
+            if not quoted.strip():
+                raise QueryError("empty search term")
+            tokens.append(("term", Term("tag", quoted.strip().lower(), bool(star))))
+        elif word.lower() in KEYWORDS:
+            tokens.append((word.lower(), None))
+        else:
+            while word.startswith("-"):
+                tokens.append(("-", None))
+                word = word[1:]
+            if word:  # A lone "-" negates the group after it
+                tokens.append(("term", word_term(word)))
+    return tokens
+
+
+def word_term(word):
+    prefix = word.endswith("*")
+    value = word.rstrip("*")
+    if value[:3].lower() == "id:":
+        if not value[3:]:
+            raise QueryError("id: needs a photo ID")
+        return Term("id", value[3:], prefix)
+    if not value:
+        raise QueryError("empty search term")
+    return Term("tag", value.lower(), prefix)
+
+
+class Parser:
+    """Recursive descent: query = and ("|" and)*, and = unary (","? unary)*, unary = "-" unary | "(" query ")" | term."""
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self):
+        return self.tokens[self.pos][0] if self.pos < len(self.tokens) else None
+
+    def take(self):
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def parse(self):
+        node = self.parse_or()
+        if self.peek() is not None:
+            raise QueryError(f"unexpected {self.peek()!r}")
+        return node
+
+    def parse_or(self):
+        children = [self.parse_and()]
+        while self.peek() in ("|", "or"):
+            self.take()
+            children.append(self.parse_and())
+        return children[0] if len(children) == 1 else Or(tuple(children))
+
+    def parse_and(self):
+        children = [self.parse_unary()]
+        while True:
+            # Stray commas (leading, trailing or doubled, as the old comma-separated search allowed) are ignored
+            while self.peek() in (",", "and"):
+                self.take()
+            if self.peek() in (None, ")", "|", "or"):
+                break
+            children.append(self.parse_unary())
+        return children[0] if len(children) == 1 else And(tuple(children))
+
+    def parse_unary(self):
+        while self.peek() == ",":
+            self.take()
+        kind = self.peek()
+        if kind in ("-", "not"):
+            self.take()
+            return Not(self.parse_unary())
+        if kind == "(":
+            self.take()
+            node = self.parse_or()
+            if self.peek() != ")":
+                raise QueryError("missing )")
+            self.take()
+            return node
+        if kind == "term":
+            return self.take()[1]
+        raise QueryError("expected a tag" if kind is None else f"unexpected {kind!r}")
+
+
+def prefix_end(prefix):
+    """The least string above every string starting with prefix, or None when there is none ("")."""
+    if not prefix:
+        return None
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def parse(text):
+    """Parses a search query into Term/And/Or/Not nodes. Raises QueryError if it is malformed."""
+    tokens = tokenize(text)
+    if not any(kind == "term" for kind, _ in tokens):
+        raise QueryError("empty query")
+    return Parser(tokens).parse()
+
+
+def quote(tag):
+    """How a tag is written in a query: as-is when it is a plain word, in quotes otherwise."""
+    if PLAIN_TAG_PATTERN.match(tag) and tag.lower() not in KEYWORDS and not tag.lower().startswith("id:"):
+        return tag
+    return f'"{tag}"'
+
+
+def estimate(node, index):
+    """Expected number of photos matching node, for ordering operands cheapest first."""
+    if isinstance(node, Term):
+        return index.count(node)
+    if isinstance(node, And):
+        positives = [estimate(child, index) for child in node.children if not isinstance(child, Not)]
+        return min(positives) if positives else float("inf")
+    if isinstance(node, Or):
+        return sum(estimate(child, index) for child in node.children)
+    return float("inf")  # A bare Not matches nearly everything
+
+
+def narrow(node, candidates, index):
+    """The candidates that match node, probing the index when that beats reading the postings."""
+    if not candidates:
+        return set()
+    if isinstance(node, Term):
+        if index.count(node) > len(candidates) * PROBE_RATIO:
+            return index.probe(node, candidates)
+        return candidates & index.postings(node)
+    if isinstance(node, And):
+        for child in node.children:
+            candidates = narrow(child, candidates, index)
+        return candidates
+    if isinstance(node, Or):
+        matched = set()
+        for child in node.children:
+            matched |= narrow(child, candidates - matched, index)
+        return matched
+    return candidates - narrow(node.child, candidates, index)
+
+
+def evaluate(node, index):
+    """The set of photo IDs matching node."""
+    if isinstance(node, Term):
+        return index.postings(node)
+    if isinstance(node, Or):
+        matched = set()
+        for child in node.children:
+            matched |= evaluate(child, index)
+        return matched
+    if isinstance(node, Not):
+        return narrow(node, index.all_ids(), index)
+
+    positives = sorted((child for child in node.children if not isinstance(child, Not)),
+                       key=lambda child: estimate(child, index))
+    negatives = [child for child in node.children if isinstance(child, Not)]
+    candidates = evaluate(positives[0], index) if positives else index.all_ids()
+    for child in positives[1:] + negatives:
+        candidates = narrow(child, candidates, index)
+    return candidates
+
+
+def search(text, index):
+    """Parses and runs a query. Returns the set of matching photo IDs."""
+    return evaluate(parse(text), index)
@@ -0,0 +1,82 @@
+"""
+Shared fixtures. main.py keeps its databases under a relative data/ directory, so every test
+runs in its own temporary working directory with a fresh schema and empty caches, and Drive
+calls go to the in-process fake from bench/fake_drive.py.
+"""
+import os
+import sqlite3
+import sys
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+os.environ.setdefault("FLASK_SECRET_KEY", "test")
+os.environ.setdefault("GOOGLE_CLIENT_ID", "test")
+os.environ.setdefault("GOOGLE_CLIENT_SECRET", "test")
+os.environ.setdefault("GOOGLE_PROJECT_ID", "test")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ["PROFILE_SAMPLE_RATE"] = "0"
+
+import main  # noqa: E402  (needs the settings above)
+from bench.fake_drive import FAKE_USER_EMAIL, FakeDrive, install  # noqa: E402
+
+
+@pytest.fixture
+def drive():
+    return FakeDrive()
+
+
+@pytest.fixture
+def app_module(tmp_path, monkeypatch, drive):
+    """main.py on an empty catalog in tmp_path, with a fake Drive and no state from other tests."""
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("data")
+    main.init_db()
+    main._fragment_lru.clear()
+    monkeypatch.setattr(main, "_tag_index", main.MemoryTagIndex())
+    monkeypatch.setattr(main, "_ingest_threads", set())
+    monkeypatch.setattr(main, "metrics", main.instrumentation.MetricsStore(main.METRICS_DB))
+    uninstall = install(drive, main)
+    yield main
+    uninstall()
+
+
+@pytest.fixture
+def client(app_module):
+    client = app_module.app.test_client()
+    with client.session_transaction() as session:
+        session["credentials"] = {"token": "test-token"}
+        session["email"] = FAKE_USER_EMAIL
+    return client
+
+
+def add_images(rows):
+    """Inserts (id, tags) rows directly, with a thumbnail that doesn't need refreshing."""
+    conn = main.connect_db()
+    conn.executemany(
+        "INSERT INTO images (id, tags, thumbnail) VALUES (?, ?, ?)",
+        [(image_id, main.codec.dumps(tags), f"https://lh3.googleusercontent.com/drive-storage/{image_id}")
+         for image_id, tags in rows]
+    )
+    main.bump_catalog_version(conn.cursor())
+    conn.commit()
+    conn.close()
+
+
+def query(sql, params=()):
+    conn = sqlite3.connect(main.DB_FILE)
+    rows = conn.execute(sql, params).fetchall()
+    conn.close()
+    return rows
+
+
+def write_elsewhere(sql, params=()):
+    """A write committed by another worker, bumping the catalog version but bypassing this process's state."""
+    conn = sqlite3.connect(main.DB_FILE)
+    conn.execute(sql, params)
+    conn.execute("UPDATE catalog_meta SET value = value + 1 WHERE key = 'version'")
+    conn.commit()
+    conn.close()
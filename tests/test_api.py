@@ -0,0 +1,58 @@
+import pytest
+from conftest import add_images, write_elsewhere
+
+
+def etag_of(version, app_module):
+    return f'W/"v{app_module.API_VERSION}-{version}"'
+
+
+def test_a_write_during_the_build_never_gets_the_newer_etag(app_module, client, monkeypatch):
+    add_images([("img001", ["beach"]), ("img002", ["beach"])])
+    version = app_module.get_catalog_version()
+    fill_page_thumbnails = app_module.fill_page_thumbnails
+    written = []
+
+    def fill_then_write(items):
+        fill_page_thumbnails(items)
+        if not written:
+            # Another worker tags a photo after this payload's rows were read
+            written.append(1)
+            write_elsewhere("UPDATE images SET tags = ? WHERE id = 'img001'", (app_module.codec.dumps(["sunset"]),))
+
+    monkeypatch.setattr(app_module, "fill_page_thumbnails", fill_then_write)
+    stale = client.get("/api/images")
+    assert stale.get_json()["version"] == version
+    assert stale.headers.get("ETag") != etag_of(version + 1, app_module)
+
+    # Revalidating what the client holds brings the write, and the fresh payload then revalidates
+    revalidated = client.get("/api/images", headers={"If-None-Match": stale.headers.get("ETag", "")})
+    assert revalidated.status_code == 200
+    assert revalidated.get_json()["items"][0]["tags"] == ["sunset"]
+    assert revalidated.headers["ETag"] == etag_of(version + 1, app_module)
+    assert client.get("/api/images", headers={"If-None-Match": revalidated.headers["ETag"]}).status_code == 304
+
+
+def test_a_payload_whose_build_refreshed_thumbnails_is_not_tagged(app_module, client):
+    add_images([("img001", ["beach"])])
+    conn = app_module.connect_db()
+    conn.execute("UPDATE images SET thumbnail = NULL")
+    conn.commit()
+    conn.close()
+
+    refreshed = client.get("/api/images")
+    assert "ETag" not in refreshed.headers
+    assert refreshed.headers["Cache-Control"] == "no-store"
+
+    settled = client.get("/api/images")
+    assert settled.get_json()["items"] == refreshed.get_json()["items"]
+    assert client.get("/api/images", headers={"If-None-Match": settled.headers["ETag"]}).status_code == 304
+
+
+@pytest.mark.parametrize("search_index", ["memory", "sqlite"])
+@pytest.mark.parametrize("q", ['""*', '" "*', '""', "beach -\"\""])
+def test_empty_quoted_terms_are_rejected(app_module, client, monkeypatch, search_index, q):
+    monkeypatch.setattr(app_module, "SEARCH_INDEX", search_index)
+    add_images([("img001", ["beach"])])
+    response = client.get("/api/images", query_string={"q": q})
+    assert response.status_code == 400
+    assert "empty search term" in response.get_json()["error"]
@@ -0,0 +1,72 @@
+import json
+
+import pytest
+from conftest import add_images, query
+
+import codec
+import main
+
+DATA = [{"id": "img001", "tags": ["beach", "café", "東京"], "thumb_url": None}]
+
+
+@pytest.fixture(params=["orjson", "json"])
+def backend(request, monkeypatch):
+    """Runs a test on orjson (when installed) and on the standard library fallback."""
+    if request.param == "orjson" and codec.orjson is None:
+        pytest.skip("orjson is not installed")
+    if request.param == "json":
+        monkeypatch.setattr(codec, "orjson", None)
+
+
+@pytest.mark.usefixtures("backend")
+def test_dumps_writes_compact_utf8_json():
+    assert codec.dumps(DATA) == json.dumps(DATA, separators=(",", ":"), ensure_ascii=False)
+    assert codec.dumps_bytes(DATA) == codec.dumps(DATA).encode("utf-8")
+
+
+@pytest.mark.parametrize("stored", [
+    codec.pack(DATA),                      # BACKUP_FORMAT=packed
+    json.dumps(DATA),                      # Backups from before the codec (spaces, ASCII escapes)
+    json.dumps(DATA).encode("utf-8"),
+    codec.dumps(DATA),
+])
+@pytest.mark.usefixtures("backend")
+def test_unpack_reads_packed_and_legacy_backups(stored):
+    assert codec.unpack(stored) == DATA
+
+
+def test_packed_backups_are_smaller():
+    data = DATA * 500
+    assert codec.is_packed(codec.pack(data))
+    assert not codec.is_packed(codec.dumps(data).encode("utf-8"))
+    assert len(codec.pack(data)) < len(codec.dumps_bytes(data)) / 5
+
+
+@pytest.mark.parametrize("stored", [
+    codec.PACKED_MAGIC + b"not zlib",
+    codec.pack(DATA)[:-4],
+    '[{"id": "img001",',
+    b"\xff\xfe",
+])
+@pytest.mark.usefixtures("backend")
+def test_corrupt_backups_raise_value_error(stored):
+    with pytest.raises(ValueError):
+        codec.unpack(stored)
+
+
+@pytest.mark.parametrize("backup_format", ["json", "packed"])
+def test_backup_round_trip(app_module, monkeypatch, backup_format):
+    monkeypatch.setattr(app_module, "BACKUP_FORMAT", backup_format)
+    add_images([("img001", ["beach", "café"]), ("img002", [])])
+    main.save_backup()
+    backup_id = main.list_backups()[0][0]
+    assert isinstance(query("SELECT data FROM backups")[0][0], bytes) == (backup_format == "packed")
+
+    conn = main.connect_db()
+    conn.execute("UPDATE images SET tags = '[]'")
+    conn.commit()
+    conn.close()
+
+    ok, _ = main.load_backup(backup_id, try_refresh_missing=False)
+    assert ok
+    assert query("SELECT id, tags FROM images ORDER BY id") == [("img001", '["beach","café"]'), ("img002", "[]")]
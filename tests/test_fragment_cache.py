@@ -0,0 +1,121 @@
+from conftest import add_images, query, write_elsewhere
+
+
+def count_fragment_renders(main, monkeypatch):
+    """Counts renders of each cached fragment template ("_grid.html", ...)."""
+    renders = {}
+    render_template = main.render_template
+
+    def counting_render(template_name, **context):
+        if template_name.startswith("_"):
+            renders[template_name] = renders.get(template_name, 0) + 1
+        return render_template(template_name, **context)
+
+    monkeypatch.setattr(main, "render_template", counting_render)
+    return renders
+
+
+def catalog(count):
+    return [(f"img{i:03}", ["beach", f"tag{i % 3}"]) for i in range(count)]
+
+
+def test_alternating_pages_hit_the_cache_and_keep_the_etag(app_module, client, monkeypatch):
+    add_images(catalog(3 * app_module.ITEMS_PER_PAGE))
+    etag = client.get("/api/images?limit=5").headers["ETag"]
+    version = app_module.get_catalog_version()
+    renders = count_fragment_renders(app_module, monkeypatch)
+
+    for page in (1, 2, 1, 2, 3, 1):
+        assert client.get(f"/?page={page}").status_code == 200
+
+    # One grid render per distinct page; the shared fragments are rendered once
+    assert renders == {"_grid.html": 3, "_tag_cloud.html": 1, "_tag_options.html": 1,
+                       "_backups.html": 1, "_folders.html": 1}
+    assert app_module.get_catalog_version() == version
+    assert client.get("/api/images?limit=5", headers={"If-None-Match": etag}).status_code == 304
+
+
+def test_placeholder_for_a_missing_drive_file_is_not_a_change(app_module, client, drive, monkeypatch):
+    drive.synthesize_missing = False  # Drive has none of these files, so refreshes fall back to the placeholder
+    add_images(catalog(app_module.ITEMS_PER_PAGE))
+    conn = app_module.connect_db()
+    conn.execute("UPDATE images SET thumbnail = ? WHERE id = 'img001'", (app_module.DEFAULT_THUMBNAIL,))
+    conn.commit()
+    conn.close()
+    version = app_module.get_catalog_version()
+    renders = count_fragment_renders(app_module, monkeypatch)
+
+    for _ in range(3):
+        assert client.get("/?page=1").status_code == 200
+
+    assert renders["_grid.html"] == 1
+    assert app_module.get_catalog_version() == version
+    assert query("SELECT thumbnail FROM images WHERE id = 'img001'") == [(app_module.DEFAULT_THUMBNAIL,)]
+
+
+def test_a_tag_edit_invalidates_the_cached_grid(app_module, client, monkeypatch):
+    add_images(catalog(10))
+    renders = count_fragment_renders(app_module, monkeypatch)
+    etag = client.get("/api/images?limit=5").headers["ETag"]
+    client.get("/?page=1")
+
+    client.post("/api/images/img001/tags", json={"tag": "sunset"})
+    html = client.get("/?page=1").get_data(as_text=True)
+
+    assert renders["_grid.html"] == 2
+    assert "sunset" in html
+    assert client.get("/api/images?limit=5", headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_a_write_during_a_build_is_not_cached_under_the_newer_version(app_module):
+    builds = []
+
+    def build_context():
+        builds.append(1)
+        if len(builds) == 1:
+            write_elsewhere("UPDATE images SET tags = '[]' WHERE 0")
+        return {"backups": []}
+
+    for _ in range(2):
+        with app_module.app.test_request_context("/"):
+            app_module.cached_fragment("test", "_backups.html", build_context)
+
+    assert len(builds) == 2
+
+
+def test_a_tag_written_during_a_grid_render_shows_on_the_next_view(app_module, client, monkeypatch):
+    add_images(catalog(3))
+    load_page = app_module.load_page
+    written = []
+
+    def load_page_then_write(*args):
+        result = load_page(*args)
+        if not written:
+            # Another worker tags a photo after this page's rows were read
+            written.append(1)
+            write_elsewhere("UPDATE images SET tags = ? WHERE id = 'img001'", (app_module.codec.dumps(["sunset"]),))
+        return result
+
+    monkeypatch.setattr(app_module, "load_page", load_page_then_write)
+    renders = count_fragment_renders(app_module, monkeypatch)
+    client.get("/?page=1")
+    client.get("/?page=1")
+
+    # The first grid was built from rows older than the version after the write, so it isn't reused
+    assert renders["_grid.html"] == 2
+
+
+def test_a_page_view_reads_the_catalog_version_once(app_module, client, monkeypatch):
+    add_images(catalog(10))
+    reads = []
+    get_catalog_version = app_module.get_catalog_version
+
+    def counting_get_catalog_version():
+        reads.append(1)
+        return get_catalog_version()
+
+    monkeypatch.setattr(app_module, "get_catalog_version", counting_get_catalog_version)
+    for path in ("/?page=1", "/?page=1", "/api/images", "/api/images"):
+        reads.clear()
+        assert client.get(path).status_code == 200
+        assert len(reads) == 1, path
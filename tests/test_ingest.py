@@ -0,0 +1,70 @@
+import time
+
+from conftest import query
+
+
+def wait_for(client, job_id, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(f"/ingest/{job_id}").get_json()
+        if job["status"] != "running":
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"import {job_id} still running")
+
+
+def test_import_progress_is_polled_as_json(app_module, client, drive):
+    image_ids = [f"1img{i:04}" for i in range(250)]
+    root_id = drive.build_tree(image_ids, depth=2, fanout=3, shortcut_fraction=0)
+    creds = app_module.load_credentials({"token": "test-token"})
+
+    job_id = app_module.start_ingest_job(root_id, ["archive"], creds)
+    job = wait_for(client, job_id)
+
+    assert job["status"] == "done"
+    assert job["saved"] == job["discovered"] == len(image_ids)
+    assert query("SELECT COUNT(*) FROM images") == [(len(image_ids),)]
+    assert client.get("/ingest/no-such-job").status_code == 404
+
+
+def insert_running_job(app_module, job_id):
+    now = time.time()
+    conn = app_module.connect_db()
+    conn.execute(f"""
+        INSERT INTO ingest_jobs ({app_module.INGEST_JOB_COLUMNS})
+        VALUES (?, 'folder', 'running', 10, 5, 0, 0, 0, 0, NULL, ?, ?, NULL)
+    """, (job_id, now, now))
+    conn.commit()
+    conn.close()
+
+
+def test_exiting_worker_interrupts_only_its_own_imports(app_module, monkeypatch):
+    insert_running_job(app_module, "mine")
+    insert_running_job(app_module, "other")  # Running in another worker
+    monkeypatch.setattr(app_module, "_ingest_threads", {"mine"})
+
+    app_module.interrupt_own_ingest_jobs()
+
+    assert app_module.get_ingest_job("mine")["status"] == "interrupted"
+    assert app_module.get_ingest_job("mine")["error"] == app_module.INGEST_INTERRUPTED_MESSAGE
+    assert app_module.get_ingest_job("other")["status"] == "running"
+
+
+def test_startup_interrupts_every_unfinished_import(app_module):
+    insert_running_job(app_module, "left-over")
+
+    app_module.create_app()
+
+    assert app_module.get_ingest_job("left-over")["status"] == "interrupted"
+
+
+def test_a_late_progress_write_does_not_revive_an_interrupted_import(app_module):
+    insert_running_job(app_module, "late")
+    app_module.interrupt_ingest_jobs()
+
+    job = app_module.IngestJob("late")
+    job.add("save", 1.0, saved=50)
+    job.save()
+
+    assert app_module.get_ingest_job("late")["status"] == "interrupted"
+    assert app_module.get_ingest_job("late")["saved"] == 5
@@ -0,0 +1,14 @@
+def test_metrics_need_a_session(app_module):
+    assert app_module.app.test_client().get("/metrics").status_code == 401
+
+
+def test_metrics_for_a_signed_in_user(client):
+    client.get("/api/images?limit=5")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+
+
+def test_metrics_public_flag(app_module, monkeypatch):
+    monkeypatch.setattr(app_module, "METRICS_PUBLIC", True)
+    assert app_module.app.test_client().get("/metrics").status_code == 200
@@ -0,0 +1,74 @@
+import io
+import random
+
+import pytest
+
+import perceptual_hash
+from perceptual_hash import BKTree, hamming
+
+
+def random_hashes(count, seed=0):
+    """Random 64-bit hashes, with clusters of near and exact duplicates among them."""
+    rng = random.Random(seed)
+    hashes = [rng.getrandbits(64) for _ in range(count)]
+    for base in hashes[:count // 10]:
+        hashes.append(base)
+        for _ in range(3):
+            flipped = base
+            for bit in rng.sample(range(64), rng.randint(1, 8)):
+                flipped ^= 1 << bit
+            hashes.append(flipped)
+    return [(value, f"img{i}") for i, value in enumerate(hashes)]
+
+
+@pytest.mark.parametrize("max_distance", [0, 3, 6, 16])
+def test_bk_tree_search_matches_brute_force(max_distance):
+    items = random_hashes(500)
+    tree = BKTree(items)
+    assert len(tree) == len(items)
+
+    for query_value, _ in items[::25]:
+        expected = sorted((hamming(query_value, value), item_id) for value, item_id in items
+                          if hamming(query_value, value) <= max_distance)
+        assert sorted(tree.search(query_value, max_distance)) == expected
+
+
+def test_empty_bk_tree():
+    assert BKTree().search(0, 64) == []
+
+
+needs_imaging = pytest.mark.skipif(not perceptual_hash.available(), reason="needs NumPy and Pillow")
+
+
+def jpeg(seed, size=(320, 240)):
+    from PIL import Image, ImageDraw
+    rng = random.Random(seed)
+    image = Image.new("RGB", size, tuple(rng.randrange(256) for _ in range(3)))
+    draw = ImageDraw.Draw(image)
+    for _ in range(12):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        draw.ellipse((x, y, x + rng.randrange(20, 160), y + rng.randrange(20, 120)),
+                     fill=tuple(rng.randrange(256) for _ in range(3)))
+    return image
+
+
+def encode(image, **options):
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", **options)
+    return buffer.getvalue()
+
+
+@needs_imaging
+@pytest.mark.parametrize("hash_function", [perceptual_hash.dhash, perceptual_hash.phash])
+def test_resized_copy_is_a_near_duplicate(hash_function):
+    original = jpeg(1)
+    copy = encode(original.resize((160, 120)), quality=60)
+    other = encode(jpeg(2))
+
+    assert hamming(hash_function(encode(original)), hash_function(copy)) <= 6
+    assert hamming(hash_function(encode(original)), hash_function(other)) > 16
+
+
+@needs_imaging
+def test_undecodable_bytes_hash_to_none():
+    assert list(perceptual_hash.hash_images([("bad", b"<html>")], workers=1)) == [("bad", None, None)]
@@ -0,0 +1,87 @@
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+import rate_limit
+from bench.fake_drive import not_found_error, rate_limit_error
+
+
+def user_rate_limit_error():
+    content = b'{"error": {"code": 403, "errors": [{"reason": "userRateLimitExceeded"}]}}'
+    return HttpError(httplib2.Response({"status": 403, "reason": "Forbidden"}), content)
+
+
+def limiter(**options):
+    limiter = rate_limit.DriveRateLimiter(rate=100, user_rate=100, burst=10, min_rate=1, max_rate=200,
+                                          backoff_base=0, **options)
+    limiter.slept = []
+    limiter._sleep = limiter.slept.append
+    return limiter
+
+
+def test_errors_are_classified():
+    assert rate_limit.throttle_scope(rate_limit_error()) == "project"
+    assert rate_limit.throttle_scope(user_rate_limit_error()) == "user"
+    assert rate_limit.throttle_scope(not_found_error("x")) is None
+    assert rate_limit.is_retryable(rate_limit_error())
+    assert rate_limit.is_retryable(ConnectionError())
+    assert not rate_limit.is_retryable(not_found_error("x"))
+
+
+def test_bucket_halves_once_per_cooldown_and_creeps_back_up():
+    bucket = rate_limit.TokenBucket(rate=10, burst=2, min_rate=1, max_rate=11, increase=1, cooldown=60)
+    assert bucket.reserve() == 0 and bucket.reserve() == 0
+    assert bucket.reserve() > 0  # Past the burst: the caller waits for its token
+
+    assert bucket.on_throttled()
+    assert not bucket.on_throttled()  # The rest of the same burst of errors
+    assert bucket.rate == 5
+    for _ in range(10):
+        bucket.on_success()
+    assert bucket.rate == 11
+
+
+def test_call_retries_retryable_errors():
+    drive_limiter = limiter()
+    errors = [rate_limit_error(), ConnectionError()]
+
+    def flaky():
+        if errors:
+            raise errors.pop(0)
+        return "ok"
+
+    assert drive_limiter.call(flaky, user="a@example.com") == "ok"
+    assert drive_limiter.project.rate < 100  # The 429 slowed the worker down
+
+
+def test_call_gives_up_on_other_errors_and_after_max_retries():
+    drive_limiter = limiter(max_retries=2)
+    calls = []
+
+    def missing():
+        calls.append(1)
+        raise not_found_error("x")
+
+    with pytest.raises(HttpError):
+        drive_limiter.call(missing)
+    assert len(calls) == 1
+
+    def throttled():
+        calls.append(1)
+        raise rate_limit_error()
+
+    with pytest.raises(HttpError):
+        drive_limiter.call(throttled)
+    assert len(calls) == 1 + 3
+
+
+def test_batch_parts_that_hit_the_rate_limit_are_retried(app_module, drive, monkeypatch):
+    monkeypatch.setattr(app_module, "drive_limiter", limiter())
+    # The first 429 fails the whole batch request (retried as is), the second only part "a",
+    # which goes out again in a batch of its own
+    drive.fail_next(2)
+
+    thumbnails = app_module.fetch_thumbnails_from_drive(["a", "b", "c"], creds=None)
+
+    assert thumbnails == {file_id: drive.thumbnail_link(file_id) for file_id in "abc"}
+    assert drive.calls["drive.batch"] == 3
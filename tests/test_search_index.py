@@ -0,0 +1,76 @@
+import random
+
+import pytest
+from conftest import add_images, query
+
+import main
+
+QUERIES = ["a", "b", "a b", "a | c", "a -b", "-a", "(a | b) -c", "a*", "id:img01*", "id:img003", "new"]
+
+
+def results(monkeypatch):
+    """{query: matching IDs} from the worker's memory index and from image_tags."""
+    found = {}
+    for search_index in ("memory", "sqlite"):
+        monkeypatch.setattr(main, "SEARCH_INDEX", search_index)
+        found[search_index] = {text: main.search_image_ids(text) for text in QUERIES}
+    return found["memory"], found["sqlite"]
+
+
+def write(sql, params=()):
+    """A write made by another worker: it only reaches this one through image_tag_changes."""
+    conn = main.connect_db()
+    conn.executemany(sql, params)
+    conn.commit()
+    conn.close()
+
+
+def test_memory_index_follows_other_workers_writes(client, monkeypatch):
+    rng = random.Random(0)
+    add_images([(f"img{i:03}", rng.sample(["a", "ab", "b", "c"], rng.randint(0, 3))) for i in range(40)])
+    memory, sqlite = results(monkeypatch)
+    assert memory == sqlite
+
+    write("UPDATE images SET tags = ? WHERE id = ?",
+          [(main.codec.dumps(rng.sample(["a", "b", "c", "new"], 2)), f"img{i:03}") for i in range(0, 40, 3)])
+    write("DELETE FROM images WHERE id = ?", [(f"img{i:03}",) for i in range(1, 40, 7)])
+    write("INSERT INTO images (id, tags) VALUES (?, ?)", [("img100", '["new", "a"]'), ("img101", "not json")])
+    client.post("/tag/edit", data={"old_tag": "ab", "new_tag": "b"})
+
+    memory, sqlite = results(monkeypatch)
+    assert memory == sqlite
+    assert "img100" in memory["new"]
+
+
+def test_memory_index_rebuilds_when_the_log_was_trimmed_past_it(monkeypatch, app_module):
+    add_images([("img001", ["a"]), ("img002", ["b"])])
+    assert results(monkeypatch)[0]["a"] == ["img001"]
+
+    write("UPDATE images SET tags = ? WHERE id = ?", [('["b"]', "img001"), ('["a"]', "img002")])
+    write("INSERT INTO images (id, tags) VALUES (?, ?)", [("img003", '["a"]')])
+    last_seq = query("SELECT MAX(seq) FROM image_tag_changes")[0][0]
+    write("DELETE FROM image_tag_changes WHERE seq < ?", [(last_seq,)])
+    assert app_module._tag_index.seq < last_seq - 1
+
+    memory, sqlite = results(monkeypatch)
+    assert memory == sqlite
+    assert memory["a"] == ["img002", "img003"]
+
+
+@pytest.mark.usefixtures("app_module")
+def test_an_empty_prefix_matches_every_tagged_photo():
+    add_images([("img001", ["a"]), ("img002", ["b", "c"]), ("img003", [])])
+    term = main.tag_query.Term("tag", "", True)
+    conn = main.connect_db()
+    c = conn.cursor()
+    catalog_index = main.CatalogTagIndex(c)
+    memory_index = main.MemoryTagIndex()
+    memory_index.build(c)
+
+    assert catalog_index.image_ids(catalog_index.postings(term)) == ["img001", "img002"]
+    assert memory_index.image_ids(memory_index.postings(term)) == ["img001", "img002"]
+    assert catalog_index.count(term) == memory_index.count(term) == 3
+    id_term = main.tag_query.Term("id", "", True)
+    assert memory_index.image_ids(memory_index.postings(id_term)) == ["img001", "img002", "img003"]
+    assert catalog_index.image_ids(catalog_index.postings(id_term)) == ["img001", "img002", "img003"]
+    conn.close()
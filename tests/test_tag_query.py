@@ -0,0 +1,110 @@
+import random
+
+import pytest
+
+import tag_query
+from tag_query import And, Not, Or, QueryError, Term
+
+
+def tag(value, prefix=False):
+    return Term("tag", value, prefix)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("beach", tag("beach")),
+    ("Beach, Sunset", And((tag("beach"), tag("sunset")))),
+    ("beach sunset", And((tag("beach"), tag("sunset")))),
+    ("beach and sunset", And((tag("beach"), tag("sunset")))),
+    ("beach | lake or river", Or((tag("beach"), tag("lake"), tag("river")))),
+    ("a b | c", Or((And((tag("a"), tag("b"))), tag("c")))),
+    ("a (b | c)", And((tag("a"), Or((tag("b"), tag("c")))))),
+    ("event:gala -blurry", And((tag("event:gala"), Not(tag("blurry"))))),
+    ("not blurry", Not(tag("blurry"))),
+    ("- (a | b)", Not(Or((tag("a"), tag("b"))))),
+    ("event:*", tag("event:", prefix=True)),
+    ('"Black and White"', tag("black and white")),
+    ('-"black and white"*', Not(tag("black and white", prefix=True))),
+    ("id:1AbC", Term("id", "1AbC", False)),
+    ("ID:1ab*", Term("id", "1ab", True)),
+    (",beach,,sunset,", And((tag("beach"), tag("sunset")))),
+])
+def test_parse(text, expected):
+    assert tag_query.parse(text) == expected
+
+
+@pytest.mark.parametrize("text", ["", "   ", ",", "(beach", "beach)", "beach |", "id:", "*", '"beach',
+                                  '""', '""*', '" "*', 'beach -""'])
+def test_malformed_queries_raise(text):
+    with pytest.raises(QueryError):
+        tag_query.parse(text)
+
+
+@pytest.mark.parametrize("value", ["beach", "black and white", "or", "id:tag", "-dash", "a,b", "x*"])
+def test_quoted_tags_parse_back_to_themselves(value):
+    assert tag_query.parse(tag_query.quote(value)) == tag(value)
+
+
+def test_prefix_end():
+    assert tag_query.prefix_end("event:") == "event;"
+    assert all("event:" <= tag < tag_query.prefix_end("event:") for tag in ["event:", "event:gala", "event:\uffff"])
+    assert tag_query.prefix_end("") is None
+
+
+class DictIndex:
+    """The index interface over {id: set of tags}, scanning everything."""
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+
+    def matches(self, term, image_id):
+        values = [image_id] if term.field == "id" else self.catalog[image_id]
+        if term.prefix:
+            return any(value.startswith(term.value) for value in values)
+        return term.value in values
+
+    def count(self, term):
+        return len(self.postings(term))
+
+    def postings(self, term):
+        return {image_id for image_id in self.catalog if self.matches(term, image_id)}
+
+    def probe(self, term, candidates):
+        return {image_id for image_id in candidates if self.matches(term, image_id)}
+
+    def all_ids(self):
+        return set(self.catalog)
+
+
+def brute_force(node, index, image_id):
+    if isinstance(node, Term):
+        return index.matches(node, image_id)
+    if isinstance(node, And):
+        return all(brute_force(child, index, image_id) for child in node.children)
+    if isinstance(node, Or):
+        return any(brute_force(child, index, image_id) for child in node.children)
+    return not brute_force(node.child, index, image_id)
+
+
+def random_query(rng, depth=0):
+    roll = rng.random()
+    if depth >= 3 or roll < 0.4:
+        word = rng.choice(["a", "b", "c", "d", "e", "a*", "id:img1*", "id:img007"])
+        return word if rng.random() < 0.8 else f"-{word}"
+    operator = " | " if roll < 0.7 else " "
+    children = [random_query(rng, depth + 1) for _ in range(rng.randint(2, 3))]
+    query = f"({operator.join(children)})"
+    return query if rng.random() < 0.8 else f"-{query}"
+
+
+@pytest.mark.parametrize("probe_ratio", [0, 4, 1000])
+def test_evaluate_matches_brute_force(monkeypatch, probe_ratio):
+    monkeypatch.setattr(tag_query, "PROBE_RATIO", probe_ratio)
+    rng = random.Random(probe_ratio)
+    vocabulary = ["a", "ab", "b", "c", "d", "e"]
+    index = DictIndex({f"img{i:03}": set(rng.sample(vocabulary, rng.randint(0, 4))) for i in range(200)})
+
+    for _ in range(300):
+        text = random_query(rng)
+        node = tag_query.parse(text)
+        expected = {image_id for image_id in index.catalog if brute_force(node, index, image_id)}
+        assert tag_query.evaluate(node, index) == expected, text
@@ -0,0 +1,77 @@
+from conftest import add_images, query
+
+import main
+
+
+def stats():
+    return (query("SELECT tag, count FROM tag_counts ORDER BY tag"),
+            query("SELECT tag, other, count FROM tag_pairs ORDER BY tag, other"),
+            query("SELECT tag, image_id FROM image_tags ORDER BY tag, image_id"),
+            query("SELECT value FROM catalog_meta WHERE key = 'image_count'"))
+
+
+def rebuilt_stats():
+    """What the statistics should be, recounted from the images themselves."""
+    conn = main.connect_db()
+    c = conn.cursor()
+    main.rebuild_tag_stats(c)
+    c.execute("DELETE FROM image_tags")
+    c.execute("""
+        INSERT INTO image_tags (tag, image_id)
+        SELECT DISTINCT t.value, i.id FROM images i, json_each(i.tags) t WHERE t.type = 'text'
+    """)
+    result = (c.execute("SELECT tag, count FROM tag_counts ORDER BY tag").fetchall(),
+              c.execute("SELECT tag, other, count FROM tag_pairs ORDER BY tag, other").fetchall(),
+              c.execute("SELECT tag, image_id FROM image_tags ORDER BY tag, image_id").fetchall(),
+              c.execute("SELECT value FROM catalog_meta WHERE key = 'image_count'").fetchall())
+    conn.rollback()
+    conn.close()
+    return result
+
+
+def catalog():
+    return [
+        ("img001", ["beach", "sunset", "dog"]),
+        ("img002", ["beach", "dog"]),
+        ("img003", ["sunset", "city"]),
+        ("img004", ["dog", "puppy"]),
+        ("img005", []),
+    ]
+
+
+def test_rename_keeps_stats_consistent(client):
+    add_images(catalog())
+
+    client.post("/tag/edit", data={"old_tag": "beach", "new_tag": "coast"})
+    assert stats() == rebuilt_stats()
+    assert ("coast", 2) in stats()[0]
+    assert not query("SELECT 1 FROM tag_counts WHERE tag = 'beach'")
+
+    # Merging into a tag some of the images already carry
+    client.post("/tag/edit", data={"old_tag": "puppy", "new_tag": "dog"})
+    assert stats() == rebuilt_stats()
+    assert ("dog", 3) in stats()[0]
+
+    # The trigger is back on for ordinary edits afterwards
+    assert not query("SELECT 1 FROM catalog_meta WHERE key = ?", (main.TAG_STATS_DEFERRED_KEY,))
+    client.post("/api/images/img005/tags", json={"tag": "coast"})
+    assert stats() == rebuilt_stats()
+
+
+def test_backup_restore_keeps_stats_consistent(client):
+    add_images(catalog())
+    main.save_backup("before")
+    backup_id = main.list_backups()[0][0]
+
+    client.post("/tag/edit", data={"old_tag": "sunset", "new_tag": "dusk"})
+    add_images([("img006", ["dusk", "beach"])])
+    conn = main.connect_db()
+    conn.execute("DELETE FROM images WHERE id = 'img004'")
+    conn.commit()
+    conn.close()
+
+    ok, _ = main.load_backup(backup_id, try_refresh_missing=False)
+    assert ok
+    assert stats() == rebuilt_stats()
+    assert ("sunset", 2) in stats()[0]
+    assert stats()[3] == [(6,)]
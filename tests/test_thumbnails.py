@@ -0,0 +1,64 @@
+import threading
+
+import pytest
+from conftest import add_images, query
+
+
+def test_claims_are_exclusive_until_released(app_module):
+    assert sorted(app_module.claim_thumbnail_refresh(["a", "b"], "worker-1")) == ["a", "b"]
+    assert app_module.claim_thumbnail_refresh(["b", "c"], "worker-2") == ["c"]
+
+    app_module.release_thumbnail_claims("worker-1")
+    assert sorted(app_module.claim_thumbnail_refresh(["b"], "worker-2")) == ["b", "c"]
+
+
+def test_expired_claims_can_be_taken_over(app_module, monkeypatch):
+    monkeypatch.setattr(app_module, "THUMBNAIL_CLAIM_TTL_SECONDS", -1)
+    app_module.claim_thumbnail_refresh(["a"], "crashed-worker")
+    assert app_module.claim_thumbnail_refresh(["a"], "worker-2") == ["a"]
+
+
+def test_concurrent_refreshes_fetch_each_file_once(app_module, drive):
+    add_images([("img001", ["beach"]), ("img002", ["beach"])])
+    drive.latency = 0.2  # Long enough for every thread to arrive while the first fetch is out
+    results = []
+
+    def refresh():
+        results.append(app_module.refresh_thumbnails_single_flight(["img001", "img002"], creds=None))
+
+    threads = [threading.Thread(target=refresh) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    expected = {file_id: drive.thumbnail_link(file_id) for file_id in ("img001", "img002")}
+    assert results == [expected] * 5
+    assert drive.calls["drive.files.get"] == 2
+    assert query("SELECT id, thumbnail FROM images ORDER BY id") == sorted(expected.items())
+    assert query("SELECT * FROM thumbnail_refresh_locks") == []
+    assert app_module._thumbnail_flights == {}
+
+
+def test_a_file_claimed_by_another_worker_is_read_back_not_fetched(app_module, drive):
+    add_images([("img001", ["beach"])])
+    app_module.claim_thumbnail_refresh(["img001"], "other-worker")
+    thumbnail = drive.thumbnail_link("img001")
+    other_worker = threading.Timer(0.3, app_module.release_thumbnail_claims, ("other-worker", {"img001": thumbnail}))
+    other_worker.start()
+
+    assert app_module.refresh_thumbnails_single_flight(["img001"], creds=None) == {"img001": thumbnail}
+    other_worker.join()
+    assert drive.calls["drive.files.get"] == 0
+
+
+def test_a_failed_fetch_releases_its_claims(app_module, monkeypatch):
+    def failing_fetch(_file_ids, _creds):
+        raise RuntimeError("Drive is down")
+
+    monkeypatch.setattr(app_module, "fetch_thumbnails_from_drive", failing_fetch)
+    with pytest.raises(RuntimeError):
+        app_module.refresh_thumbnails_single_flight(["img001"], creds=None)
+
+    assert query("SELECT * FROM thumbnail_refresh_locks") == []
+    assert app_module._thumbnail_flights == {}